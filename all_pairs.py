@@ -0,0 +1,149 @@
+import math
+import time
+
+import numpy as np
+
+from graph_definition import GraphNode
+from rate_matrix import QUOTE_RTOL, log_tolerance, log_rate_matrix, rate_matrix_from_node_pool
+
+
+'''
+таблица лучших курсов для всех пар валют (алгоритм Флойда-Уоршелла в логарифмах)
+
+предрасчёт выполняется один раз на снимок котировок:
+    dist[i, j] - логарифм лучшего произведения курсов из i в j
+    next_hop[i, j] - следующая вершина на лучшем пути из i в j (-1, если пути нет)
+
+    для каждой промежуточной вершины k вся матрица обновляется одной векторной операцией:
+        dist[i, j] = max(dist[i, j], dist[i, k] + dist[k, j])
+
+после этого курс для любой пары - обращение к таблице, путь восстанавливается по next_hop
+за число шагов, равное длине пути
+
+улучшение принимается, только если оно больше допуска rtol (см. rate_matrix.QUOTE_RTOL):
+циклы из-за округления котировок (выигрыш меньше допуска) не делают таблицу недействительной
+
+если в графе есть выгодные циклы (dist[i, i] больше допуска), лучшие значения не ограничены,
+такая таблица отмечается флагом has_arbitrage и не отвечает на запросы (rate и path - ValueError),
+ответ тогда даёт поиск с ограничением рёбер (Snapshot.query), а сами циклы - cycles.py
+'''
+
+
+class AllPairsTable:
+    def __init__(self, names: list[str], rates: np.ndarray, rtol: float = QUOTE_RTOL):
+        eps = log_tolerance(rtol)
+        n = len(names)
+        self.names: list[str] = names
+        self.index: dict[str, int] = {name: i for i, name in enumerate(names)}
+
+        dist = log_rate_matrix(rates)
+        next_hop = np.where(dist > -np.inf, np.arange(n)[None, :], -1)
+        np.fill_diagonal(dist, 0.)
+        np.fill_diagonal(next_hop, np.arange(n))
+
+        for k in range(n):
+            candidates = dist[:, k, None] + dist[None, k, :]
+            better = candidates > dist + eps
+            dist = np.where(better, candidates, dist)
+            next_hop = np.where(better, next_hop[:, k, None], next_hop)
+
+        self.dist: np.ndarray = dist
+        self.next_hop: np.ndarray = next_hop
+        self.best_rates: np.ndarray = np.exp(dist)  # exp(-inf) = 0 - пути нет
+        self.has_arbitrage: bool = bool((np.diag(dist) > eps).any())
+
+    def __check_valid(self):
+        if self.has_arbitrage:
+            raise ValueError('All pairs table is invalid: quotes contain profitable cycles')
+        return
+
+    # лучший курс из start в end (0, если пути нет)
+    def rate(self, start_name: str, end_name: str) -> float:
+        self.__check_valid()
+        return float(self.best_rates[self.index[start_name], self.index[end_name]])
+
+    # лучший путь из start в end ([] если пути нет)
+    def path(self, start_name: str, end_name: str) -> list[str]:
+        self.__check_valid()
+        start, end = self.index[start_name], self.index[end_name]
+        if self.next_hop[start, end] == -1:
+            return []
+        path: list[str] = [start_name]
+        current = start
+        while current != end:
+            current = int(self.next_hop[current, end])
+            path.append(self.names[current])
+            if len(path) > len(self.names):
+                # путь зациклился - это возможно только при выгодных циклах
+                raise ValueError(f'Path from {start_name} to {end_name} runs through a profitable cycle')
+        return path
+
+
+def build_all_pairs(node_pool: dict[str, GraphNode], quotes: dict[str, float],
+                    rtol: float = QUOTE_RTOL) -> AllPairsTable:
+    return AllPairsTable(list(node_pool), rate_matrix_from_node_pool(node_pool, quotes), rtol)
+
+
+def test_all_pairs():
+    from best_path import best_conversion_path
+    from benchmark import generate_complete_graph
+    from one_path import test_dijkstra_max_product_path
+
+    node_pool, path, quotes = test_dijkstra_max_product_path()
+    table = build_all_pairs(node_pool, quotes)
+    print('111 -> 888:', table.rate('111', '888'), table.path('111', '888'))
+    assert math.isclose(table.rate('111', '888'), 8.)
+    assert table.path('111', '888') == [node.name for node in path]
+    assert table.rate('888', '111') == 0. and table.path('888', '111') == []
+    assert not table.has_arbitrage
+
+    # выгодный цикл 444 -> 888 -> 444: значения таблицы не ограничены, запросы к ней - ошибка
+    arbitrage = build_all_pairs(dict(node_pool, **{'888': GraphNode('888', [node_pool['444']])}),
+                                dict(quotes, **{'888444': 1.}))
+    assert arbitrage.has_arbitrage
+    for query in (arbitrage.rate, arbitrage.path):
+        try:
+            query('111', '888')
+            assert False, 'query on table with arbitrage'
+        except ValueError:
+            pass
+
+    # все пары совпадают с поиском по одной паре (с одинаковым допуском; у случайных курсов
+    # много путей, отличающихся меньше QUOTE_RTOL, поэтому для точного сравнения допуск маленький)
+    node_pool, quotes = generate_complete_graph(40)
+    start = time.perf_counter()
+    table = build_all_pairs(node_pool, quotes, rtol=1e-12)
+    print(f'40 nodes precomputed in {time.perf_counter() - start:.4f} s')
+    for start_name in list(node_pool)[:5]:
+        for end_name in node_pool:
+            if start_name == end_name:
+                continue
+            value, best = best_conversion_path(node_pool, node_pool[start_name], node_pool[end_name], quotes,
+                                               rtol=1e-12)
+            assert math.isclose(table.rate(start_name, end_name), value, rel_tol=1e-9)
+            assert table.path(start_name, end_name) == [node.name for node in best]
+
+    # котировки, округлённые до 6 значащих цифр (как у mock_api): циклы округления не считаются арбитражем,
+    # таблица отвечает сама, значения в пределах допуска совпадают с поиском по одной паре
+    from mock_api import MOCK_USD_PRICES
+    names = list(MOCK_USD_PRICES)
+    rounded = {f'{a}{b}': float(f'{MOCK_USD_PRICES[a] / MOCK_USD_PRICES[b]:.6g}') for a in names for b in names if a != b}
+    rounded_pool = {name: GraphNode(name) for name in names}
+    for key in rounded:
+        rounded_pool[key[:3]].children.append(rounded_pool[key[3:]])
+    assert AllPairsTable(names, rate_matrix_from_node_pool(rounded_pool, rounded), rtol=1e-12).has_arbitrage
+    table = build_all_pairs(rounded_pool, rounded)
+    assert not table.has_arbitrage
+    for start_name in names:
+        for end_name in names:
+            if start_name == end_name:
+                continue
+            path = table.path(start_name, end_name)
+            value, _ = best_conversion_path(rounded_pool, rounded_pool[start_name], rounded_pool[end_name], rounded)
+            assert len(set(path)) == len(path) and math.isclose(table.rate(start_name, end_name), value, rel_tol=1e-4)
+    print('rounded quotes EUR -> JPY:', table.rate('EUR', 'JPY'), table.path('EUR', 'JPY'))
+    return table
+
+
+if __name__ == '__main__':
+    test_all_pairs()
@@ -1,9 +1,54 @@
+import heapq
+import math
+
+import numpy as np
 
 from graph_definition import GraphNode
+from metrics import METRICS
+from compact_graph import CompactGraph, from_node_pool
+from rate_matrix import build_rate_matrix
+from traversal import iter_simple_pathes
 
 
 # метод получения всех уникальных путей из start_node в end_node
+# обход в глубину с явным стеком (без рекурсии), поэтому длина пути не ограничена глубиной стека интерпретатора
 def find_all_pathes(start_node: GraphNode, end_node: GraphNode) -> list[list[GraphNode]]:
+    if start_node == end_node:
+        return [[start_node]]
+    end_name: str = end_node.name
+    all_pathes: list[list[GraphNode]] = []  # список всех уникальных путей
+    # имена узлов текущего пути, это позволяет исключить циклы (узлы равны, когда равны их имена)
+    visited: set[str] = {start_node.name}
+    current_path: list[GraphNode] = [start_node]  # текущий путь
+    children_stack = [iter(start_node.children)]  # для каждого узла пути - итератор по ещё не просмотренным детям
+    expanded: int = 0  # число спусков в вершины - для метрик
+
+    while children_stack:
+        for child in children_stack[-1]:
+            child_name = child.name
+            if child_name in visited:
+                continue
+            if child_name == end_name:
+                all_pathes.append(current_path + [child])  # копируем ссылки, но не сами объекты
+                continue
+            # спускаемся в child, его итератор продолжит перебор с того же места после возврата
+            visited.add(child_name)
+            current_path.append(child)
+            children_stack.append(iter(child.children))
+            expanded += 1
+            break
+        else:
+            # дети текущего узла кончились - возврат к предыдущей вершине
+            children_stack.pop()
+            visited.remove(current_path.pop().name)
+    if METRICS.enabled:
+        METRICS.count('find_all_pathes.nodes_expanded', expanded)
+        METRICS.count('find_all_pathes.pathes_enumerated', len(all_pathes))
+    return all_pathes
+
+
+# рекурсивный вариант - оставлен для сравнения в benchmark.py
+def find_all_pathes_recursive(start_node: GraphNode, end_node: GraphNode) -> list[list[GraphNode]]:
     all_pathes: list[list[GraphNode]] = []  # список всех уникальных путей
     visited: set[GraphNode] = set()  # множество посещённых узлов
     current_path: list[GraphNode] = []  # текущий путь
@@ -51,13 +96,170 @@ def calculate_path_value(path: list[GraphNode], quotes: dict[str, float]) -> flo
 
 
 def calculate_pathes_value(pathes: list[list[GraphNode]], quotes: dict[str, float]) -> list[float]:
-    values: list[float] = []
-    for path in pathes:
-        value = calculate_path_value(path, quotes)
-        values.append(value)
+    with METRICS.timer('scoring'):
+        values: list[float] = []
+        for path in pathes:
+            value = calculate_path_value(path, quotes)
+            values.append(value)
     return values
 
 
+# потоковый перебор путей: пути выдаются по одному, в памяти хранится только текущий путь
+# max_hops - ограничение на число рёбер в пути (None - без ограничения)
+def iter_pathes(start_node: GraphNode, end_node: GraphNode, max_hops: int | None = None):
+    if start_node == end_node:
+        yield [start_node]
+        return
+    if max_hops is not None and max_hops <= 0:
+        return  # до конечной вершины нужно хотя бы одно ребро
+    end_name: str = end_node.name
+    visited: set[str] = {start_node.name}
+    current_path: list[GraphNode] = [start_node]
+    children_stack = [iter(start_node.children)]
+
+    while children_stack:
+        for child in children_stack[-1]:
+            child_name = child.name
+            if child_name in visited:
+                continue
+            if child_name == end_name:
+                yield current_path + [child]
+                continue
+            if max_hops is not None and len(current_path) >= max_hops:
+                continue  # рёбер уже max_hops, а до конечной вершины не дошли
+            visited.add(child_name)
+            current_path.append(child)
+            children_stack.append(iter(child.children))
+            break
+        else:
+            children_stack.pop()
+            visited.remove(current_path.pop().name)
+
+
+# поиск top_k лучших путей без сохранения всех путей
+# prune - отсекать ветви, которые заведомо не могут стать лучше текущего k-го лучшего пути:
+# оценка сверху для ветви = логарифм текущего значения + (оставшиеся рёбра) * max(0, log(максимальный курс))
+# возвращает список (значение, путь) по убыванию значения,
+# при равных значениях раньше идёт путь, найденный раньше (как values.index(max) в полном переборе)
+def find_best_pathes(start_node: GraphNode, end_node: GraphNode, quotes: dict[str, float],
+                     max_hops: int | None = None, top_k: int = 1,
+                     prune: bool = True) -> list[tuple[float, list[GraphNode]]]:
+    max_log_rate: float = max(0., max((math.log(rate) for rate in quotes.values() if rate > 0), default=0.))
+    # без ограничения длины простой путь содержит не больше рёбер, чем вершин-источников в котировках
+    hops_limit: int = max_hops if max_hops is not None else len({key[:3] for key in quotes})
+
+    best: list[tuple[float, int, list[GraphNode]]] = []  # min-куча (значение, -порядковый номер, путь)
+    found: int = 0
+    expanded: int = 0
+    pruned: int = 0
+    if start_node == end_node:
+        return [(1., [start_node])]
+    if hops_limit <= 0:
+        return []
+    end_name: str = end_node.name
+    visited: set[str] = {start_node.name}
+    current_path: list[GraphNode] = [start_node]
+    path_values: list[float] = [1.]  # значение префикса пути до каждого узла
+    children_stack = [iter(start_node.children)]
+
+    while children_stack:
+        current_node = current_path[-1]
+        for child in children_stack[-1]:
+            child_name = child.name
+            if child_name in visited:
+                continue
+            value = path_values[-1] * quotes[f'{current_node.name}{child_name}']
+            if child_name == end_name:
+                found += 1
+                item = (value, -found, current_path + [child])
+                if len(best) < top_k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+                continue
+            hops = len(current_path)  # рёбер в пути после перехода в child
+            if hops >= hops_limit:
+                continue
+            if prune and len(best) == top_k and best[0][0] > 0:
+                bound = math.log(value) + (hops_limit - hops) * max_log_rate
+                if bound + 1e-12 < math.log(best[0][0]):
+                    pruned += 1
+                    continue  # даже по самым выгодным рёбрам ветвь не догонит k-й лучший путь
+            visited.add(child_name)
+            current_path.append(child)
+            path_values.append(value)
+            children_stack.append(iter(child.children))
+            expanded += 1
+            break
+        else:
+            children_stack.pop()
+            visited.remove(current_path.pop().name)
+            path_values.pop()
+
+    if METRICS.enabled:
+        METRICS.count('find_best_pathes.nodes_expanded', expanded)
+        METRICS.count('find_best_pathes.pathes_enumerated', found)
+        METRICS.count('find_best_pathes.pruned', pruned)
+    best.sort(reverse=True)
+    return [(value, path) for value, _, path in best]
+
+
+# упаковка путей в матрицу номеров рёбер (пути x рёбра), дополненную ребром-заглушкой с курсом 1
+# номер ребра u -> v равен u * n + v, заглушка - n * n
+def pack_pathes(pathes: list[list[GraphNode]], index: dict[str, int]) -> np.ndarray:
+    n = len(index)
+    max_len = max((len(path) for path in pathes), default=1)
+    nodes = np.full((len(pathes), max(max_len, 2)), -1, dtype=np.int64)
+    for row, path in enumerate(pathes):
+        nodes[row, :len(path)] = [index[node.name] for node in path]
+    edges = nodes[:, :-1] * n + nodes[:, 1:]
+    edges[nodes[:, 1:] < 0] = n * n
+    return edges
+
+
+# пакетный расчёт значений всех путей
+# значения перемножаются по столбцам слева направо, поэтому совпадают с calculate_pathes_value бит в бит
+# возвращает значения и номер первого пути с максимальным значением (-1, если путей нет)
+def calculate_pathes_value_batched(pathes: list[list[GraphNode]], quotes: dict[str, float]) -> tuple[list[float], int]:
+    if not pathes:
+        return [], -1
+    with METRICS.timer('scoring'):
+        return _calculate_pathes_value_batched(pathes, quotes)
+
+
+def _calculate_pathes_value_batched(pathes: list[list[GraphNode]], quotes: dict[str, float]) -> tuple[list[float], int]:
+    names: list[str] = list({node.name: None for path in pathes for node in path})
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+    edges = pack_pathes(pathes, index)
+
+    edge_rates = np.append(build_rate_matrix(names, quotes).ravel(), 1.)
+    if not edge_rates[edges].all():
+        row = int(np.nonzero(edge_rates[edges] == 0)[0][0])
+        raise KeyError(f'path {pathes[row]} uses an edge without a quote')
+
+    values = np.ones(len(pathes))
+    for column in range(edges.shape[1]):
+        values *= edge_rates[edges[:, column]]
+    return values.tolist(), int(np.argmax(values))
+
+
+# те же алгоритмы на компактном графе (пути - списки номеров вершин)
+def find_all_pathes_compact(graph: CompactGraph, start: int, end: int) -> list[list[int]]:
+    return [list(path) for path, _ in iter_simple_pathes(graph, start, end)]
+
+
+def calculate_path_value_compact(graph: CompactGraph, path: list[int]) -> float:
+    weights = graph.weights
+    path_value: float = 1.
+    for i in range(len(path) - 1):
+        path_value = path_value * weights[graph.edge_id(path[i], path[i + 1])]
+    return path_value
+
+
+def calculate_pathes_value_compact(graph: CompactGraph, pathes: list[list[int]]) -> list[float]:
+    return [calculate_path_value_compact(graph, path) for path in pathes]
+
+
 def test_find_all_pathes():
     node_pool: dict[str, GraphNode] = dict()
     node1 = GraphNode('111')
@@ -129,6 +331,23 @@ def test_find_all_pathes():
     print("Максимальное произведение весов:", max_value)
     print("Путь:", path)
 
+    batched_values, batched_idx = calculate_pathes_value_batched(all_pathes, quotes)
+    assert batched_values == values and batched_idx == idx
+
+    assert list(iter_pathes(node1, node8)) == all_pathes
+    assert list(iter_pathes(node1, node8, max_hops=2)) == [p for p in all_pathes if len(p) <= 3]
+    assert list(iter_pathes(node1, node8, max_hops=0)) == [] and find_best_pathes(node1, node8, quotes, max_hops=0) == []
+    assert find_best_pathes(node1, node8, quotes, max_hops=1) == [(3.5, [node1, node8])]
+    assert find_best_pathes(node1, node8, quotes) == [(max_value, path)]
+    top_3 = find_best_pathes(node1, node8, quotes, top_k=3)
+    assert [value for value, _ in top_3] == sorted(values, reverse=True)[:3]
+    assert find_best_pathes(node1, node8, quotes, top_k=3, prune=False) == top_3
+
+    graph = from_node_pool(node_pool, quotes)
+    compact_pathes = find_all_pathes_compact(graph, graph.index['111'], graph.index['888'])
+    assert [graph.path_names(p) for p in compact_pathes] == [[node.name for node in p] for p in all_pathes]
+    assert calculate_pathes_value_compact(graph, compact_pathes) == values
+
     return node_pool, path, quotes
 
 
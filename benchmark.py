@@ -0,0 +1,306 @@
+import argparse
+import itertools
+import json
+import math
+import platform
+import random
+import statistics
+import string
+import time
+import tracemalloc
+
+from graph_definition import GraphNode, NodePool
+from one_path import dijkstra_max_product_path
+from all_pathes import find_all_pathes, find_all_pathes_recursive, calculate_pathes_value, calculate_pathes_value_batched, find_best_pathes
+from best_path import best_conversion_path, best_rates_from
+from k_best import k_best_pathes
+from fees import FeeModel, best_net_path
+from pruning import reduce_graph, cycle_subgraph
+from all_pairs import build_all_pairs
+from cycles import find_arbitrage_cycles
+from parallel_pathes import find_best_pathes_parallel
+from compact_graph import from_node_pool
+from traversal import iter_simple_pathes
+
+
+'''
+замеры производительности алгоритмов на синтетических графах валют
+
+генераторы графов:
+    generate_random_graph - случайный граф заданного размера и плотности
+    generate_complete_graph - полный граф (каждая валюта меняется на каждую)
+
+распределения курсов:
+    consistent - курсы из случайных цен валют со спредом, выгодных циклов нет (как на реальном рынке)
+    lognormal - независимые случайные курсы, выгодных циклов много
+    uniform - независимые курсы, равномерно распределённые в [0.5, 2]
+
+для каждого алгоритма и размера графа замеряются время (лучшее и медиана по повторам)
+и пиковая память (tracemalloc), результаты пишутся в JSON
+
+запуск:
+    python benchmark.py --sizes 8 10 50 100 --density 0.5 --rates consistent --output benchmark_results.json
+'''
+
+RATE_DISTRIBUTIONS = ('consistent', 'lognormal', 'uniform')
+
+
+# трёхбуквенные коды вершин (AAA, AAB, ...) - алгоритмы делят ключ котировки пополам по 3 символа
+def currency_codes(size: int) -> list[str]:
+    letters = string.ascii_uppercase
+    return [''.join(code) for code in itertools.islice(itertools.product(letters, repeat=3), size)]
+
+
+def generate_random_graph(size: int, density: float = 0.5, rate_distribution: str = 'consistent',
+                          spread: float = 0.002, seed: int = 0,
+                          pooled: bool = True) -> tuple[dict[str, GraphNode], dict[str, float]]:
+    if rate_distribution not in RATE_DISTRIBUTIONS:
+        raise ValueError(f'Unknown rate distribution {rate_distribution}')
+    rng = random.Random(seed)
+    names = currency_codes(size)
+    prices = [math.exp(rng.gauss(0, 1)) for _ in range(size)]
+
+    node_pool: dict[str, GraphNode] = NodePool() if pooled else dict()
+    for name in names:
+        if pooled:
+            node_pool.create(name)
+        else:
+            node_pool[name] = GraphNode(name)
+    quotes: dict[str, float] = dict()
+    for i, name_from in enumerate(names):
+        node_from = node_pool[name_from]
+        for j, name_to in enumerate(names):
+            if i == j or rng.random() >= density:
+                continue
+            match rate_distribution:
+                case 'consistent':
+                    rate = prices[i] / prices[j] * (1 - rng.uniform(0, spread))
+                case 'lognormal':
+                    rate = math.exp(rng.gauss(0, 0.5))
+                case _:
+                    rate = rng.uniform(0.5, 2.)
+            node_from.children.append(node_pool[name_to])
+            quotes[f'{name_from}{name_to}'] = rate
+    return node_pool, quotes
+
+
+def generate_complete_graph(size: int, rate_distribution: str = 'consistent', spread: float = 0.002,
+                            seed: int = 0) -> tuple[dict[str, GraphNode], dict[str, float]]:
+    return generate_random_graph(size, 1., rate_distribution, spread, seed)
+
+
+# перебор путей замеряется отдельно от расчёта их значений (см. calculate_pathes_value)
+def _run_all_pathes(node_pool, quotes, start, end):
+    return len(find_all_pathes(node_pool[start], node_pool[end]))
+
+
+def _run_all_pathes_recursive(node_pool, quotes, start, end):
+    return len(find_all_pathes_recursive(node_pool[start], node_pool[end]))
+
+
+def _run_all_pathes_compact(node_pool, quotes, start, end):
+    graph = from_node_pool(node_pool, quotes)
+    return sum(1 for _ in iter_simple_pathes(graph, graph.index[start], graph.index[end]))
+
+
+def _run_score_pathes(pathes, quotes):
+    return max(calculate_pathes_value(pathes, quotes), default=0.)
+
+
+def _run_score_pathes_batched(pathes, quotes):
+    values, idx = calculate_pathes_value_batched(pathes, quotes)
+    return values[idx] if idx >= 0 else 0.
+
+
+# алгоритм -> (функция, нужен ли полный перебор путей)
+# функции перебора получают заранее перечисленные пути, остальные - node_pool и имена вершин
+ALGORITHMS = {
+    'find_all_pathes': (_run_all_pathes, True),
+    'find_all_pathes_recursive': (_run_all_pathes_recursive, True),
+    'iter_simple_pathes_compact': (_run_all_pathes_compact, True),
+    'calculate_pathes_value': (_run_score_pathes, True),
+    'calculate_pathes_value_batched': (_run_score_pathes_batched, True),
+    'find_best_pathes': (lambda node_pool, quotes, start, end:
+                         find_best_pathes(node_pool[start], node_pool[end], quotes), True),
+    'find_best_pathes_parallel': (lambda node_pool, quotes, start, end:
+                                  find_best_pathes_parallel(node_pool, node_pool[start], node_pool[end], quotes)[0][0],
+                                  True),
+    'dijkstra_max_product_path': (lambda node_pool, quotes, start, end:
+                                  dijkstra_max_product_path(node_pool, node_pool[start], node_pool[end], quotes)[0],
+                                  False),
+    'best_conversion_path': (lambda node_pool, quotes, start, end:
+                             best_conversion_path(node_pool, node_pool[start], node_pool[end], quotes)[0], False),
+    'best_rates_from': (lambda node_pool, quotes, start, end:
+                        best_rates_from(node_pool, node_pool[start], quotes).rate(end), False),
+    'best_net_path': (lambda node_pool, quotes, start, end:
+                      best_net_path(node_pool, node_pool[start], node_pool[end], quotes,
+                                    FeeModel(spread=0.0005, percent=0.001, fixed=0.01), 100.)[0], False),
+    'k_best_pathes': (lambda node_pool, quotes, start, end:
+                      len(k_best_pathes(node_pool, node_pool[start], node_pool[end], quotes, k=10)), False),
+    'all_pairs_table': (lambda node_pool, quotes, start, end:
+                        build_all_pairs(node_pool, quotes).rate(start, end), False),
+    'reduce_graph': (lambda node_pool, quotes, start, end:
+                     len(reduce_graph(node_pool, quotes, node_pool[start], node_pool[end], drop_dominated=True)[1]),
+                     False),
+    'cycle_subgraph': (lambda node_pool, quotes, start, end: len(cycle_subgraph(node_pool, quotes)[1]), False),
+    'arbitrage_cycles': (lambda node_pool, quotes, start, end:
+                         len(find_arbitrage_cycles(list(node_pool), quotes)), False),
+}
+
+SCORING_ALGORITHMS = ('calculate_pathes_value', 'calculate_pathes_value_batched')
+
+
+# время (лучшее и медиана) и пиковая память одного алгоритма
+def measure(function, *args, repeat: int = 3) -> dict:
+    times: list[float] = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'best_s': min(times),
+        'median_s': statistics.median(times),
+        'peak_memory_bytes': peak,
+        'result': result if isinstance(result, (int, float)) else None,
+    }
+
+
+def run_benchmark(sizes: list[int], density: float = 0.5, rate_distribution: str = 'consistent',
+                  algorithms: list[str] | None = None, repeat: int = 3, seed: int = 0,
+                  max_enumeration_size: int = 10) -> list[dict]:
+    algorithms = algorithms if algorithms is not None else list(ALGORITHMS)
+    results: list[dict] = []
+    for size in sizes:
+        node_pool, quotes = generate_random_graph(size, density, rate_distribution, seed=seed)
+        names = list(node_pool)
+        start, end = names[0], names[-1]
+        pathes = None
+        for name in algorithms:
+            function, enumerates = ALGORITHMS[name]
+            if enumerates and size > max_enumeration_size:
+                continue  # полный перебор путей растёт экспоненциально
+            if name in SCORING_ALGORITHMS:
+                if pathes is None:
+                    pathes = find_all_pathes(node_pool[start], node_pool[end])
+                record = measure(function, pathes, quotes, repeat=repeat)
+                record['pathes'] = len(pathes)
+            else:
+                record = measure(function, node_pool, quotes, start, end, repeat=repeat)
+            record.update({
+                'algorithm': name,
+                'size': size,
+                'edges': len(quotes),
+                'density': density,
+                'rate_distribution': rate_distribution,
+            })
+            results.append(record)
+            print(f"{name:32} n={size:<5} edges={len(quotes):<7} best={record['best_s']:.6f} s "
+                  f"peak={record['peak_memory_bytes'] / 1024:.1f} KiB")
+    return results
+
+
+# узел с __dict__ и хэшем по имени - как GraphNode до перехода на __slots__, только для сравнения
+class LegacyGraphNode:
+    def __init__(self, name: str, children: list = None):
+        self.name: str = name
+        self.children: list = children if children is not None else []
+
+    def __repr__(self):
+        return f'{self.name}'
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __eq__(self, other):
+        if isinstance(other, LegacyGraphNode):
+            return self.name == other.name
+        return super(LegacyGraphNode, self).__eq__(other)
+
+    def __lt__(self, other):
+        return self.name < other.name
+
+
+NODE_TYPES = {
+    'legacy': LegacyGraphNode,
+    'slots': GraphNode,
+    'pooled': None,  # узлы NodePool
+}
+NODE_TYPE_ALGORITHMS = ('find_all_pathes_recursive', 'dijkstra_max_product_path')
+
+
+# копия графа на узлах другого типа
+def _rebuild_node_pool(node_pool: dict[str, GraphNode], node_type: str) -> dict:
+    if NODE_TYPES[node_type] is None:
+        rebuilt = NodePool()
+        for name in node_pool:
+            rebuilt.create(name)
+    else:
+        rebuilt = {name: NODE_TYPES[node_type](name) for name in node_pool}
+    for name, node in node_pool.items():
+        rebuilt[name].children = [rebuilt[child.name] for child in node.children]
+    return rebuilt
+
+
+# память узлов графа и время алгоритмов, работающих с множествами и словарями узлов, для каждого типа узла
+def compare_node_types(sizes: list[int], density: float = 0.5, rate_distribution: str = 'consistent',
+                       repeat: int = 3, seed: int = 0, max_enumeration_size: int = 10) -> list[dict]:
+    results: list[dict] = []
+    for size in sizes:
+        node_pool, quotes = generate_random_graph(size, density, rate_distribution, seed=seed)
+        names = list(node_pool)
+        for node_type in NODE_TYPES:
+            tracemalloc.start()
+            nodes = _rebuild_node_pool(node_pool, node_type)
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            record = {'node_type': node_type, 'size': size, 'edges': len(quotes), 'node_memory_bytes': memory}
+            for name in NODE_TYPE_ALGORITHMS:
+                function, enumerates = ALGORITHMS[name]
+                if enumerates and size > max_enumeration_size:
+                    continue
+                record[f'{name}_best_s'] = measure(function, nodes, quotes, names[0], names[-1], repeat=repeat)['best_s']
+            results.append(record)
+            timings = ' '.join(f"{name}={record[f'{name}_best_s']:.6f} s"
+                               for name in NODE_TYPE_ALGORITHMS if f'{name}_best_s' in record)
+            print(f"node type {node_type:8} n={size:<5} memory={memory / 1024:.1f} KiB {timings}")
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='benchmark of currency graph search algorithms')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[6, 8, 10, 50, 100])
+    arg_parser.add_argument('--density', type=float, default=0.5)
+    arg_parser.add_argument('--rates', choices=RATE_DISTRIBUTIONS, default='consistent')
+    arg_parser.add_argument('--algorithms', nargs='+', choices=list(ALGORITHMS), default=None)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--max-enumeration-size', type=int, default=10)
+    arg_parser.add_argument('--output', default='benchmark_results.json')
+    args = arg_parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.density, args.rates, args.algorithms, args.repeat, args.seed,
+                            args.max_enumeration_size)
+    node_types = compare_node_types(args.sizes, args.density, args.rates, args.repeat, args.seed,
+                                    args.max_enumeration_size)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+        'node_types': node_types,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f'results written to {args.output}')
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import numpy as np
+
+from graph_definition import GraphNode
+from metrics import METRICS
+from one_path import dijkstra_max_product_path
+from rate_matrix import QUOTE_RTOL, log_tolerance, log_rate_matrix, rate_matrix_from_node_pool
+
+
+'''
+поиск лучшего пути преобразования - динамика по числу рёбер (Беллман-Форд с ограничением длины)
+
+dijkstra_max_product_path не гарантирует правильный ответ: алгоритм Дейкстры корректен
+только для неотрицательных весов, а логарифмы курсов бывают и положительными, и отрицательными
+(курс больше 1 и меньше 1), к тому же проверка causes_cycle проходит всю цепочку предшественников
+
+здесь:
+    dist_0 - 0 для начальной вершины, -inf для остальных
+    dist_k[v] = max(dist_{k-1}[v], max_u(dist_{k-1}[u] + log(курс u -> v)))
+    каждый слой считается сразу для всей матрицы средствами NumPy
+
+гарантия корректности:
+    dist_k[v] - точный максимум логарифма произведения курсов по всем маршрутам
+    из start в v длиной не больше k рёбер
+    если в графе нет выгодных циклов (произведение курсов по любому циклу не больше 1),
+    то лучший маршрут - простой путь, он же лучший путь вообще, и перебор слоёв
+    останавливается, как только слой ничего не улучшил
+    если выгодные циклы есть, то лучший маршрут может проходить вершины повторно (поиск циклов - cycles.py),
+    такой маршрут путём не выдаётся - вместо него ищется лучший простой путь (best_simple_path_matrix)
+
+улучшение принимается, только если оно больше допуска rtol (относительного, см. rate_matrix.QUOTE_RTOL):
+циклы из-за округления котировок дают выигрыш меньше допуска и не считаются выгодными
+
+сложность - O(max_hops * V^2) векторных операций, на согласованных котировках обычно несколько слоёв
+'''
+
+
+# слои динамики сразу для нескольких начальных вершин (строка на каждую)
+# возвращает логарифмы лучших значений (источники x вершины) и предшественников по слоям:
+# predecessors[k][s, v] - предшественник v для источника s, если значение улучшилось на слое k + 1, иначе -1
+def _relax_layers(log_rates: np.ndarray, starts: list[int], max_hops: int | None = None,
+                  eps: float = log_tolerance(QUOTE_RTOL)) -> tuple[np.ndarray, list[np.ndarray]]:
+    n = len(log_rates)
+    max_hops = max_hops if max_hops is not None else n - 1
+    rows = np.arange(len(starts))[:, None]
+    columns = np.arange(n)[None, :]
+
+    distances = np.full((len(starts), n), -np.inf)
+    distances[np.arange(len(starts)), starts] = 0.
+    predecessors: list[np.ndarray] = []
+    for _ in range(max_hops):
+        candidates = distances[:, :, None] + log_rates[None, :, :]
+        best_from = np.argmax(candidates, axis=1)
+        best = candidates[rows, best_from, columns]
+        improved = best > distances + eps
+        if not improved.any():
+            break  # слой ничего не улучшил - дальше значения не изменятся
+        distances = np.where(improved, best, distances)
+        predecessors.append(np.where(improved, best_from, -1))
+
+    if METRICS.enabled:
+        METRICS.count('best_path.layers', len(predecessors))
+        METRICS.count('best_path.relaxations', int(sum(np.count_nonzero(layer >= 0) for layer in predecessors)))
+    return distances, predecessors
+
+
+# поиск по матрице логарифмов курсов
+# возвращает логарифм значения лучшего маршрута и маршрут (номера вершин), [] если end недостижима
+# маршрут может повторять вершины, если в графе есть циклы с выигрышем больше допуска
+def best_conversion_path_matrix(log_rates: np.ndarray, start: int, end: int, max_hops: int | None = None,
+                                eps: float = log_tolerance(QUOTE_RTOL)) -> tuple[float, list[int]]:
+    distances, predecessors = _relax_layers(log_rates, [start], max_hops, eps)
+    if distances[0, end] == -np.inf:
+        return float('-inf'), []
+    return float(distances[0, end]), _restore_path([layer[0] for layer in predecessors], end)
+
+
+# лучший простой путь перебором с отсечением: (логарифм значения, путь), [] если end недостижима
+# оценка сверху для продолжения из v не длиннее h рёбер - лучший маршрут (не обязательно простой)
+# из v в end, он считается той же динамикой в обратную сторону;
+# ветвь отсекается, если даже с такой оценкой она не лучше найденного пути больше чем на eps,
+# дети перебираются от выгодных рёбер к невыгодным, поэтому хороший путь находится сразу
+def best_simple_path_matrix(log_rates: np.ndarray, start: int, end: int, max_hops: int | None = None,
+                            eps: float = log_tolerance(QUOTE_RTOL)) -> tuple[float, list[int]]:
+    n = len(log_rates)
+    max_hops = max_hops if max_hops is not None else n - 1
+    if start == end:
+        return 0., [start]
+
+    bound = np.full(n, -np.inf)
+    bound[end] = 0.
+    bounds: list[list[float]] = [bound.tolist()]  # bounds[h][v] - оценка для продолжения из v не длиннее h рёбер
+    for _ in range(max_hops):
+        next_bound = np.maximum(bound, np.max(log_rates + bound[None, :], axis=1))
+        if np.array_equal(next_bound, bound):
+            break  # дальше оценки не меняются
+        bound = next_bound
+        bounds.append(bound.tolist())
+    if bounds[min(max_hops, len(bounds) - 1)][start] == -np.inf:
+        return float('-inf'), []
+
+    rows = log_rates.tolist()
+    children: list[list[int]] = []
+    for u in range(n):
+        order = [v for v in np.argsort(-log_rates[u], kind='stable').tolist() if rows[u][v] > -np.inf]
+        children.append(order)
+
+    best_value, best_path = float('-inf'), []
+    visited = bytearray(n)
+    visited[start] = 1
+    path: list[int] = [start]
+    values: list[float] = [0.]
+    cursors = [iter(children[start])]
+    while cursors:
+        u = path[-1]
+        hops_left = max_hops - len(path)  # рёбер останется после перехода в ребёнка
+        for v in cursors[-1]:
+            if visited[v]:
+                continue
+            value = values[-1] + rows[u][v]
+            if v == end:
+                if value > best_value + eps or not best_path:
+                    best_value, best_path = value, path + [end]
+                continue
+            if hops_left <= 0:
+                continue
+            if value + bounds[min(hops_left, len(bounds) - 1)][v] <= best_value + eps:
+                continue  # даже лучший маршрут из v не даст заметного улучшения
+            visited[v] = 1
+            path.append(v)
+            values.append(value)
+            cursors.append(iter(children[v]))
+            break
+        else:
+            cursors.pop()
+            visited[path.pop()] = 0
+            values.pop()
+    if METRICS.enabled:
+        METRICS.count('best_path.simple_path_fallbacks')
+    return best_value, best_path
+
+
+# маршрут без повторов вершин - путь
+def _is_simple(path: list[int]) -> bool:
+    return len(set(path)) == len(path)
+
+
+# Восстановление маршрута: идём по слоям назад, для вершины берём последний слой, где она улучшилась
+def _restore_path(predecessors: list[np.ndarray], end: int) -> list[int]:
+    path: list[int] = [end]
+    current_vertex, layer = end, len(predecessors) - 1
+    while True:
+        while layer >= 0 and predecessors[layer][current_vertex] == -1:
+            layer -= 1
+        if layer < 0:
+            break  # значение вершины не менялось с начала - это start
+        current_vertex = int(predecessors[layer][current_vertex])
+        path.append(current_vertex)
+        layer -= 1
+    path.reverse()
+    return path
+
+
+# то же на графе из GraphNode, сигнатура как у dijkstra_max_product_path
+# для недостижимой вершины возвращает (0., [])
+# rtol - относительная точность котировок, путь всегда простой (без повторов вершин)
+def best_conversion_path(node_pool: dict[str, GraphNode], start_node: GraphNode, end_node: GraphNode,
+                         quotes: dict[str, float], max_hops: int | None = None,
+                         rtol: float = QUOTE_RTOL) -> tuple[float, list[GraphNode]]:
+    names: list[str] = list(node_pool)
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+    log_rates = log_rate_matrix(rate_matrix_from_node_pool(node_pool, quotes))
+    start, end, eps = index[start_node.name], index[end_node.name], log_tolerance(rtol)
+
+    _, ids = best_conversion_path_matrix(log_rates, start, end, max_hops, eps)
+    if not _is_simple(ids):
+        # маршрут идёт через выгодный цикл - выдаём лучший простой путь
+        _, ids = best_simple_path_matrix(log_rates, start, end, max_hops, eps)
+    path: list[GraphNode] = [node_pool[names[i]] for i in ids]
+
+    path_value: float = 1. if path else 0.
+    for i in range(len(path) - 1):
+        path_value = path_value * quotes[f'{path[i]}{path[i + 1]}']
+    return path_value, path
+
+
+'''
+лучшие курсы из одной валюты во все остальные
+
+та же динамика уже даёт значения для всех вершин, поэтому один проход отвечает
+на вопрос "лучший курс из USD во всё": BestRatesTree хранит значения и слои предшественников,
+пути во все вершины восстанавливаются без повторного поиска
+
+для нескольких валют-источников матрица курсов строится один раз на все источники,
+а слои считаются сразу для пачки источников одной векторной операцией
+
+если маршрут в вершину идёт через выгодный цикл, дерево отвечает лучшим простым путём
+(best_simple_path_matrix по той же матрице), курс такой вершины - курс этого пути
+'''
+
+
+class BestRatesTree:
+    def __init__(self, names: list[str], start: int, log_values: np.ndarray, layers: list[np.ndarray],
+                 log_rates: np.ndarray | None = None, max_hops: int | None = None,
+                 eps: float = log_tolerance(QUOTE_RTOL)):
+        self.names: list[str] = names
+        self.index: dict[str, int] = {name: i for i, name in enumerate(names)}
+        self.start: int = start
+        self.log_values: np.ndarray = log_values  # -inf - вершина недостижима
+        self.layers: list[np.ndarray] = layers  # предшественники по слоям, как в best_conversion_path_matrix
+
+        # дерево предшественников: предшественник с последнего слоя, где значение вершины улучшилось
+        # (-1 у start и недостижимых вершин)
+        parent = np.full(len(names), -1)
+        for layer in layers:
+            parent = np.where(layer >= 0, layer, parent)
+        self.parent: np.ndarray = parent
+
+        # для маршрутов с повторами вершин - лучшие простые пути, считаются при первом запросе
+        self.log_rates: np.ndarray | None = log_rates
+        self.max_hops: int | None = max_hops
+        self.eps: float = eps
+        self.simple_pathes: dict[int, tuple[float, list[int]]] = dict()
+
+    # (логарифм значения, путь номерами вершин) для end, путь всегда простой
+    def __best(self, end: int) -> tuple[float, list[int]]:
+        if self.log_values[end] == -np.inf:
+            return float('-inf'), []
+        path = _restore_path(self.layers, end)
+        if _is_simple(path) or self.log_rates is None:
+            return float(self.log_values[end]), path
+        if end not in self.simple_pathes:
+            self.simple_pathes[end] = best_simple_path_matrix(self.log_rates, self.start, end, self.max_hops, self.eps)
+        return self.simple_pathes[end]
+
+    @property
+    def start_name(self) -> str:
+        return self.names[self.start]
+
+    # лучший курс из start в end (0, если пути нет)
+    def rate(self, end_name: str) -> float:
+        return float(np.exp(self.__best(self.index[end_name])[0]))
+
+    # лучший путь из start в end ([] если пути нет)
+    def path(self, end_name: str) -> list[str]:
+        return [self.names[i] for i in self.__best(self.index[end_name])[1]]
+
+    # курсы во все достижимые вершины, кроме start
+    def rates(self) -> dict[str, float]:
+        return {name: self.rate(name) for i, name in enumerate(self.names)
+                if self.log_values[i] > -np.inf and i != self.start}
+
+    # предшественник каждой достижимой вершины, кроме start
+    def predecessors(self) -> dict[str, str]:
+        return {name: self.names[self.parent[i]] for i, name in enumerate(self.names) if self.parent[i] >= 0}
+
+
+# деревья лучших курсов для нескольких источников по общей матрице логарифмов курсов
+# источники считаются пачками, чтобы промежуточный массив (пачка x n x n) не превышал max_batch_cells
+def best_rates_trees_matrix(names: list[str], log_rates: np.ndarray, starts: list[int],
+                            max_hops: int | None = None, eps: float = log_tolerance(QUOTE_RTOL),
+                            max_batch_cells: int = 1 << 22) -> list[BestRatesTree]:
+    n = len(names)
+    batch = max(1, max_batch_cells // max(1, n * n))
+    trees: list[BestRatesTree] = []
+    for offset in range(0, len(starts), batch):
+        batch_starts = starts[offset:offset + batch]
+        distances, predecessors = _relax_layers(log_rates, batch_starts, max_hops, eps)
+        for row, start in enumerate(batch_starts):
+            trees.append(BestRatesTree(names, start, distances[row], [layer[row] for layer in predecessors],
+                                       log_rates, max_hops, eps))
+    return trees
+
+
+# лучшие курсы из start_node во все валюты за один проход
+def best_rates_from(node_pool: dict[str, GraphNode], start_node: GraphNode, quotes: dict[str, float],
+                    max_hops: int | None = None, rtol: float = QUOTE_RTOL) -> BestRatesTree:
+    return best_rates_from_many(node_pool, [start_node], quotes, max_hops, rtol)[start_node.name]
+
+
+# то же для нескольких источников: имя источника -> дерево лучших курсов
+def best_rates_from_many(node_pool: dict[str, GraphNode], start_nodes: list[GraphNode], quotes: dict[str, float],
+                         max_hops: int | None = None, rtol: float = QUOTE_RTOL) -> dict[str, BestRatesTree]:
+    names: list[str] = list(node_pool)
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+    log_rates = log_rate_matrix(rate_matrix_from_node_pool(node_pool, quotes))
+    trees = best_rates_trees_matrix(names, log_rates, [index[node.name] for node in start_nodes], max_hops,
+                                    log_tolerance(rtol))
+    return {tree.start_name: tree for tree in trees}
+
+
+def test_best_conversion_path():
+    from one_path import test_dijkstra_max_product_path
+
+    node_pool, dijkstra_path, quotes = test_dijkstra_max_product_path()
+    weight, path = best_conversion_path(node_pool, node_pool['111'], node_pool['888'], quotes)
+    print("Максимальное произведение весов:", weight)
+    print("Путь:", path)
+    assert weight == 8. and path == dijkstra_path
+
+    # ограничение на число рёбер
+    weight, path = best_conversion_path(node_pool, node_pool['111'], node_pool['888'], quotes, max_hops=2)
+    assert weight == 4.5 and [node.name for node in path] == ['111', '666', '888']
+
+    # недостижимая вершина не ломает восстановление пути
+    assert best_conversion_path(node_pool, node_pool['888'], node_pool['111'], quotes) == (0., [])
+
+    # пример, где Дейкстра ошибается: выгодное ребро (курс > 1) находится после убыточного,
+    # и BBB улучшается уже после того, как была обработана
+    pool = {name: GraphNode(name) for name in ('AAA', 'BBB', 'CCC', 'DDD', 'XXX')}
+    pool['AAA'].children = [pool['BBB'], pool['CCC'], pool['XXX']]
+    pool['BBB'].children = [pool['DDD']]
+    pool['CCC'].children = [pool['BBB']]
+    pool['XXX'].children = [pool['DDD']]
+    rates = {'AAABBB': 1., 'AAACCC': 0.5, 'AAAXXX': 1., 'CCCBBB': 4., 'BBBDDD': 1., 'XXXDDD': 1.5}
+    dijkstra_weight, _ = dijkstra_max_product_path(pool, pool['AAA'], pool['DDD'], rates)
+    weight, path = best_conversion_path(pool, pool['AAA'], pool['DDD'], rates)
+    print('dijkstra:', dijkstra_weight, 'hop-bounded dp:', weight, path)
+    assert weight == 2. and [node.name for node in path] == ['AAA', 'CCC', 'BBB', 'DDD']
+
+    # котировки, округлённые до 6 значащих цифр, как у mock_api: циклы округления не выгодны,
+    # маршрут EUR -> JPY не ходит по кругу
+    from mock_api import MOCK_USD_PRICES
+    from graph_definition import NodePool
+    names = list(MOCK_USD_PRICES)
+    rounded = {f'{a}{b}': float(f'{MOCK_USD_PRICES[a] / MOCK_USD_PRICES[b]:.6g}') for a in names for b in names if a != b}
+    rounded_pool = NodePool()
+    for name in names:
+        rounded_pool.create(name)
+    for key in rounded:
+        rounded_pool[key[:3]].children.append(rounded_pool[key[3:]])
+    weight, path = best_conversion_path(rounded_pool, rounded_pool['EUR'], rounded_pool['JPY'], rounded)
+    print('rounded quotes EUR -> JPY:', weight, [node.name for node in path])
+    assert len(set(path)) == len(path) and path[0].name == 'EUR' and path[-1].name == 'JPY'
+    assert abs(weight / rounded['EURJPY'] - 1) < 1e-5
+    tree = best_rates_from(rounded_pool, rounded_pool['EUR'], rounded)
+    assert all(len(set(tree.path(name))) == len(tree.path(name)) for name in names)
+
+    # настоящий выгодный цикл (больше допуска): вместо маршрута по кругу - лучший простой путь
+    looped = dict(rounded, GBPRUB=rounded['GBPRUB'] * 1.01)
+    weight, path = best_conversion_path(rounded_pool, rounded_pool['EUR'], rounded_pool['JPY'], looped)
+    _, looping = best_conversion_path_matrix(log_rate_matrix(rate_matrix_from_node_pool(rounded_pool, looped)),
+                                             names.index('EUR'), names.index('JPY'))
+    assert len(set(looping)) < len(looping)  # динамика сама по себе ходит по кругу
+    print('arbitrage EUR -> JPY:', weight, [node.name for node in path])
+    assert len(set(path)) == len(path) and 'GBP' in [node.name for node in path]
+    tree = best_rates_from(rounded_pool, rounded_pool['EUR'], looped)
+    assert tree.path('JPY') == [node.name for node in path] and abs(tree.rate('JPY') - weight) < 1e-9 * weight
+    return path
+
+
+def test_best_rates_from():
+    from one_path import test_dijkstra_max_product_path
+    from benchmark import generate_random_graph
+
+    node_pool, _, quotes = test_dijkstra_max_product_path()
+    tree = best_rates_from(node_pool, node_pool['111'], quotes)
+    print('rates from 111:', tree.rates())
+    print('predecessors:', tree.predecessors())
+    assert abs(tree.rate('888') - 8.) < 1e-12 and tree.path('888') == ['111', '444', '333', '777', '888']
+    assert tree.predecessors()['888'] == '777' and '111' not in tree.predecessors()
+    assert tree.rate('111') == 1. and tree.path('111') == ['111']
+
+    # значения и пути совпадают с отдельными поисками, в том числе при расчёте мелкими пачками
+    node_pool, quotes = generate_random_graph(30, density=0.2, seed=5)
+    names = list(node_pool)
+    sources = [node_pool[name] for name in names[:7]]
+    trees = best_rates_from_many(node_pool, sources, quotes, max_hops=4)
+    log_rates = log_rate_matrix(rate_matrix_from_node_pool(node_pool, quotes))
+    small_batches = best_rates_trees_matrix(names, log_rates, [names.index(node.name) for node in sources],
+                                            max_hops=4, max_batch_cells=2 * 30 * 30)
+    unreachable: int = 0
+    for source, batched in zip(sources, small_batches):
+        tree = trees[source.name]
+        for end_name in names:
+            if end_name == source.name:
+                continue
+            value, path = best_conversion_path(node_pool, source, node_pool[end_name], quotes, max_hops=4)
+            assert tree.path(end_name) == [node.name for node in path] == batched.path(end_name)
+            assert abs(tree.rate(end_name) - value) <= 1e-12 * value
+            unreachable += not path
+    print('unreachable pairs:', unreachable)
+    return trees
+
+
+if __name__ == '__main__':
+    test_best_conversion_path()
+    test_best_rates_from()
@@ -0,0 +1,101 @@
+import math
+from array import array
+
+from graph_definition import GraphNode
+
+
+'''
+компактное представление графа курсов для "горячих" участков алгоритмов
+
+каждой валюте один раз сопоставляется плотный целый номер (0..n-1),
+рёбра хранятся в формате CSR:
+    offsets[i]..offsets[i + 1] - диапазон рёбер, выходящих из вершины i
+    targets[e] - номер вершины, в которую ведёт ребро e
+    weights[e] - курс ребра e
+    log_weights[e] - логарифм курса ребра e (умножение курсов превращается в сложение)
+
+порядок рёбер каждой вершины совпадает с порядком GraphNode.children,
+поэтому алгоритмы обходят граф в том же порядке, что и на объектах GraphNode
+
+при обходе не нужно формировать строковые ключи f"{a}{b}" и искать их в quotes,
+для поиска ребра по паре вершин есть словарь edge_index с целым ключом u * n + v
+'''
+
+
+class CompactGraph:
+    def __init__(self, names: list[str], offsets: array, targets: array, weights: array):
+        self.names: list[str] = names  # номер вершины -> код валюты
+        self.index: dict[str, int] = {name: i for i, name in enumerate(names)}  # код валюты -> номер вершины
+        self.offsets: array = offsets
+        self.targets: array = targets
+        self.weights: array = weights
+        self.log_weights: array = array('d', (math.log(weight) for weight in weights))
+
+        n = len(names)
+        self.edge_index: dict[int, int] = dict()  # u * n + v -> номер ребра
+        # списки (вершина, номер ребра) исходящих рёбер - обход перебирает их без обращений к массивам
+        self.adjacency: list[list[tuple[int, int]]] = []
+        for u in range(n):
+            self.adjacency.append([(targets[e], e) for e in range(offsets[u], offsets[u + 1])])
+            for e in range(offsets[u], offsets[u + 1]):
+                self.edge_index[u * n + targets[e]] = e
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def edges_count(self) -> int:
+        return len(self.targets)
+
+    # номера рёбер, выходящих из вершины u
+    def out_edges(self, u: int) -> range:
+        return range(self.offsets[u], self.offsets[u + 1])
+
+    # номер ребра u -> v или -1, если такого ребра нет
+    def edge_id(self, u: int, v: int) -> int:
+        return self.edge_index.get(u * len(self.names) + v, -1)
+
+    def path_names(self, path: list[int]) -> list[str]:
+        return [self.names[i] for i in path]
+
+    def path_ids(self, names: list[str]) -> list[int]:
+        return [self.index[name] for name in names]
+
+
+# построение компактного графа из node_pool и словаря котировок
+def from_node_pool(node_pool: dict[str, GraphNode], quotes: dict[str, float]) -> CompactGraph:
+    names: list[str] = list(node_pool)
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+
+    offsets = array('l', [0])
+    targets = array('l')
+    weights = array('d')
+    for name in names:
+        for child in node_pool[name].children:
+            targets.append(index[child.name])
+            weights.append(quotes[f'{name}{child.name}'])
+        offsets.append(len(targets))
+
+    return CompactGraph(names, offsets, targets, weights)
+
+
+# построение компактного графа прямо из котировок (как Parser.__create_edges, но без GraphNode)
+def from_quotes(names: list[str], quotes: dict[str, float]) -> CompactGraph:
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+    adjacency: list[list[tuple[int, float]]] = [[] for _ in names]
+    for key, rate in quotes.items():
+        i = index.get(key[:3])
+        j = index.get(key[3:])
+        if i is None or j is None or i == j:
+            continue
+        adjacency[i].append((j, rate))
+
+    offsets = array('l', [0])
+    targets = array('l')
+    weights = array('d')
+    for edges in adjacency:
+        for j, rate in edges:
+            targets.append(j)
+            weights.append(rate)
+        offsets.append(len(targets))
+    return CompactGraph(list(names), offsets, targets, weights)
@@ -0,0 +1,179 @@
+import math
+import time
+
+import numpy as np
+
+from rate_matrix import build_rate_matrix, log_rate_matrix
+from compact_graph import from_quotes
+from traversal import iter_simple_cycles
+
+
+'''
+поиск выгодных циклов (арбитража) - третий алгоритм
+
+цикл выгоден, если произведение курсов вдоль него больше 1,
+после замены веса ребра на -log(курс) это цикл с отрицательной суммой весов,
+который находит алгоритм Беллмана-Форда
+
+    1. Инициализация:
+        расстояние до всех вершин 0 (как будто есть фиктивная вершина, связанная со всеми),
+        поэтому находятся циклы в любой части графа, а не только достижимые из одной валюты
+
+    2. Раунд релаксации выполняется сразу для всей матрицы средствами NumPy:
+        cand[u, v] = dist[u] + w[u, v], для каждой v берём минимум по u
+
+    3. Если граф предшественников содержит цикл, то это цикл отрицательного веса,
+        т.е. выгодный цикл - его выделяем, проверяем выигрыш и запоминаем
+
+    4. Чтобы найти и другие циклы, из графа удаляется одно ребро каждого найденного цикла
+        и поиск повторяется, пока циклы находятся (или пока не набрано max_cycles)
+
+полный перебор всех простых выгодных циклов экспоненциален,
+поэтому "все" здесь - все различные циклы, которые находит такая последовательность запусков
+
+для коротких циклов есть точный вариант find_arbitrage_cycles_exhaustive - перебор всех простых циклов
+длиной не больше max_len рёбер обходом без рекурсии (traversal.iter_simple_cycles)
+'''
+
+
+# выделяет все циклы графа предшественников (у каждой вершины не больше одного предшественника)
+def _predecessor_cycles(predecessors: np.ndarray) -> list[list[int]]:
+    n = len(predecessors)
+    state = bytearray(n)  # 0 - не посещена, 1 - в текущей цепочке, 2 - обработана
+    cycles: list[list[int]] = []
+    for start in range(n):
+        chain: list[int] = []
+        node = start
+        while node != -1 and state[node] == 0:
+            state[node] = 1
+            chain.append(node)
+            node = int(predecessors[node])
+        if node != -1 and state[node] == 1:
+            # цепочка замкнулась на себя - цикл (идём по предшественникам, поэтому разворачиваем)
+            cycle = chain[chain.index(node):]
+            cycle.reverse()
+            cycles.append(cycle)
+        for visited_node in chain:
+            state[visited_node] = 2
+    return cycles
+
+
+# приводим цикл к виду, начинающемуся с наименьшего номера, чтобы отсеять повторы
+def _canonical_cycle(cycle: list[int]) -> tuple[int, ...]:
+    shift = cycle.index(min(cycle))
+    return tuple(cycle[shift:] + cycle[:shift])
+
+
+def _bellman_ford_cycles(weights: np.ndarray, eps: float) -> list[list[int]]:
+    n = len(weights)
+    columns = np.arange(n)
+    distances = np.zeros(n)
+    predecessors = np.full(n, -1)
+    for _ in range(n):
+        candidates = distances[:, None] + weights
+        best_from = np.argmin(candidates, axis=0)
+        best = candidates[best_from, columns]
+        improved = best < distances - eps
+        if not improved.any():
+            return []  # релаксация сошлась - отрицательных циклов нет
+        distances[improved] = best[improved]
+        predecessors[improved] = best_from[improved]
+        cycles = _predecessor_cycles(predecessors)
+        if cycles:
+            return cycles
+    return _predecessor_cycles(predecessors)
+
+
+# поиск выгодных циклов по матрице курсов
+# возвращает список (выигрыш, цикл), цикл - номера вершин, первая вершина повторяется в конце
+def find_arbitrage_cycles_matrix(rates: np.ndarray, min_gain: float = 1e-9,
+                                 max_cycles: int = 100) -> list[tuple[float, list[int]]]:
+    log_rates = log_rate_matrix(rates)
+    weights = -log_rates  # отсутствующее ребро -> +inf
+    np.fill_diagonal(weights, np.inf)
+    eps = min_gain / 2
+
+    found: dict[tuple[int, ...], float] = dict()
+    while len(found) < max_cycles:
+        cycles = _bellman_ford_cycles(weights, eps)
+        if not cycles:
+            break
+        for cycle in cycles:
+            gain_log = float(sum(log_rates[cycle[i], cycle[(i + 1) % len(cycle)]] for i in range(len(cycle))))
+            key = _canonical_cycle(cycle)
+            if gain_log > min_gain and key not in found:
+                found[key] = gain_log
+            # удаляем ребро цикла с наименьшим курсом - цикл больше не найдётся
+            edges = [(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))]
+            u, v = max(edges, key=lambda edge: weights[edge])
+            weights[u, v] = np.inf
+
+    result = [(float(np.exp(gain_log)), list(key) + [key[0]]) for key, gain_log in found.items()]
+    result.sort(key=lambda item: -item[0])
+    return result[:max_cycles]
+
+
+# то же по словарю котировок (Parser.all_quotes), циклы - списки кодов валют
+def find_arbitrage_cycles(names: list[str], quotes: dict[str, float], min_gain: float = 1e-9,
+                          max_cycles: int = 100) -> list[tuple[float, list[str]]]:
+    rates = build_rate_matrix(names, quotes)
+    cycles = find_arbitrage_cycles_matrix(rates, min_gain, max_cycles)
+    return [(gain, [names[i] for i in cycle]) for gain, cycle in cycles]
+
+
+# точный перебор: все выгодные простые циклы длиной не больше max_len рёбер
+def find_arbitrage_cycles_exhaustive(names: list[str], quotes: dict[str, float], max_len: int = 3,
+                                     min_gain: float = 1e-9) -> list[tuple[float, list[str]]]:
+    graph = from_quotes(names, quotes)
+    log_weights = graph.log_weights
+    result: list[tuple[float, list[str]]] = []
+    for path, edges in iter_simple_cycles(graph, max_len):
+        gain_log = 0.
+        for e in edges:
+            gain_log += log_weights[e]
+        if gain_log > min_gain:
+            result.append((math.exp(gain_log), graph.path_names(path)))
+    result.sort(key=lambda item: -item[0])
+    return result
+
+
+def test_find_arbitrage_cycles():
+    # согласованные курсы: rate(a -> b) = price[a] / price[b], выгодных циклов нет
+    prices = {'111': 1., '222': 2., '333': 4., '444': 0.5}
+    quotes = {f'{a}{b}': prices[a] / prices[b] for a in prices for b in prices}
+    names = list(prices)
+    assert find_arbitrage_cycles(names, quotes) == []
+
+    # два завышенных курса: 111 -> 222 -> 111 даёт 1.01, 333 -> 444 -> 333 даёт 1.02,
+    # а цикл через оба завышенных ребра - 1.0302
+    quotes['111222'] *= 1.01
+    quotes['333444'] *= 1.02
+    cycles = find_arbitrage_cycles(names, quotes)
+    print('cycles:', cycles)
+    found = [cycle for _, cycle in cycles]
+    assert ['111', '222', '111'] in found and ['333', '444', '333'] in found
+    assert abs(cycles[0][0] - 1.0302) < 1e-9
+
+    # точный перебор находит все выгодные циклы, в том числе пропущенные Беллманом-Фордом
+    exhaustive = find_arbitrage_cycles_exhaustive(names, quotes, max_len=4)
+    print('exhaustive:', exhaustive)
+    assert {tuple(cycle) for _, cycle in cycles} <= {tuple(cycle) for _, cycle in exhaustive}
+    assert ['111', '222', '111'] in [cycle for _, cycle in exhaustive]
+
+    # полная матрица 170 x 170 должна обрабатываться за доли секунды
+    rng = np.random.default_rng(0)
+    price_vector = np.exp(rng.normal(size=170))
+    rates = price_vector[:, None] / price_vector[None, :]
+    for i in range(0, 20, 2):
+        rates[i, i + 1] *= 1.001
+    start = time.perf_counter()
+    cycles_matrix = find_arbitrage_cycles_matrix(rates)
+    elapsed = time.perf_counter() - start
+    print(f'170 x 170: {len(cycles_matrix)} cycles in {elapsed:.3f} s')
+    assert len(cycles_matrix) >= 10
+    assert elapsed < 1.
+    return cycles
+
+
+if __name__ == '__main__':
+    test_find_arbitrage_cycles()
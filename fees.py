@@ -0,0 +1,188 @@
+from array import array
+
+from graph_definition import GraphNode
+from compact_graph import CompactGraph, from_node_pool
+from best_path import _restore_path
+from metrics import METRICS
+
+
+'''
+лучший путь с учётом комиссий и спреда
+
+котировки - средние курсы (mid), реальный обмен по ребру A -> B суммы amount даёт:
+    (amount - fixed) * mid * (1 - spread / 2) * (1 - percent)
+    spread - относительная разница ask и bid (обмен идёт по худшей стороне, на spread / 2 хуже mid)
+    percent - процентная комиссия, fixed - фиксированная комиссия в валюте A
+    если amount <= fixed, обмен по ребру невозможен
+
+из-за фиксированных комиссий результат зависит от суммы, и логарифмы курсов уже не складываются,
+поэтому динамика по слоям (как в best_path.py) ведётся по суммам:
+    amount_k[v] = max(amount_{k-1}[v], max_u(обмен amount_{k-1}[u] по ребру u -> v))
+обмен по ребру - возрастающая функция суммы, поэтому максимум суммы в каждой вершине
+на каждом слое - точный ответ для маршрутов не длиннее k рёбер
+
+каждый слой - один проход по рёбрам компактного графа, сложность O(max_hops * E) без перебора путей
+без фиксированных комиссий ответ не зависит от суммы и совпадает с поиском по логарифмам чистых курсов
+'''
+
+
+class FeeModel:
+    def __init__(self, spread: float = 0., percent: float = 0., fixed: float = 0.,
+                 spreads: dict[str, float] | None = None, percents: dict[str, float] | None = None,
+                 fixed_fees: dict[str, float] | None = None):
+        # значения по умолчанию для всех рёбер
+        self.spread: float = spread
+        self.percent: float = percent
+        self.fixed: float = fixed
+        # значения для отдельных рёбер: ключ котировки f'{from}{to}' -> значение
+        self.spreads: dict[str, float] = spreads if spreads is not None else dict()
+        self.percents: dict[str, float] = percents if percents is not None else dict()
+        self.fixed_fees: dict[str, float] = fixed_fees if fixed_fees is not None else dict()
+
+    # курс ребра после спреда и процентной комиссии
+    def net_rate(self, key: str, mid: float) -> float:
+        return mid * (1 - self.spreads.get(key, self.spread) / 2) * (1 - self.percents.get(key, self.percent))
+
+    def fixed_fee(self, key: str) -> float:
+        return self.fixed_fees.get(key, self.fixed)
+
+    # сумма после обмена amount по ребру key (0, если сумма не покрывает фиксированную комиссию)
+    def convert(self, key: str, mid: float, amount: float) -> float:
+        fixed = self.fixed_fee(key)
+        if amount <= fixed:
+            return 0.
+        return (amount - fixed) * self.net_rate(key, mid)
+
+    # чистые курсы и фиксированные комиссии всех рёбер компактного графа (в порядке рёбер)
+    def edge_arrays(self, graph: CompactGraph) -> tuple[array, array]:
+        net_rates = array('d')
+        fixed_fees = array('d')
+        for u in range(len(graph)):
+            for e in graph.out_edges(u):
+                key = f'{graph.names[u]}{graph.names[graph.targets[e]]}'
+                net_rates.append(self.net_rate(key, graph.weights[e]))
+                fixed_fees.append(self.fixed_fee(key))
+        return net_rates, fixed_fees
+
+
+# сумма в конце пути после всех комиссий
+def calculate_path_net_value(path: list[GraphNode], quotes: dict[str, float], fees: FeeModel,
+                             amount: float = 1.) -> float:
+    for i in range(len(path) - 1):
+        key = f'{path[i]}{path[i + 1]}'
+        amount = fees.convert(key, quotes[key], amount)
+    return amount
+
+
+# поиск на компактном графе: (сумма в end, маршрут из номеров вершин), (0, []) если end недостижима
+def best_net_path_compact(graph: CompactGraph, fees: FeeModel, start: int, end: int, amount: float = 1.,
+                          max_hops: int | None = None, eps: float = 1e-12) -> tuple[float, list[int]]:
+    n = len(graph)
+    max_hops = max_hops if max_hops is not None else n - 1
+    offsets, targets = graph.offsets, graph.targets
+    net_rates, fixed_fees = fees.edge_arrays(graph)
+
+    amounts: list[float] = [0.] * n
+    amounts[start] = amount
+    # predecessors[k][v] - предшественник v, если сумма v улучшилась на слое k + 1, иначе -1
+    predecessors: list[list[int]] = []
+    relaxations: int = 0
+    for _ in range(max_hops):
+        layer_amounts = list(amounts)
+        layer: list[int] = [-1] * n
+        improved = False
+        for u in range(n):
+            current = amounts[u]
+            if current <= 0.:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                fixed = fixed_fees[e]
+                if current <= fixed:
+                    continue
+                value = (current - fixed) * net_rates[e]
+                v = targets[e]
+                if value > layer_amounts[v] * (1 + eps):
+                    layer_amounts[v] = value
+                    layer[v] = u
+                    improved = True
+                    relaxations += 1
+        if not improved:
+            break  # слой ничего не улучшил - дальше суммы не изменятся
+        amounts = layer_amounts
+        predecessors.append(layer)
+
+    if METRICS.enabled:
+        METRICS.count('best_net_path.layers', len(predecessors))
+        METRICS.count('best_net_path.relaxations', relaxations)
+
+    if amounts[end] <= 0. or start == end:
+        return (amounts[end], [start]) if start == end else (0., [])
+    return amounts[end], _restore_path(predecessors, end)
+
+
+# то же на графе из GraphNode: (сумма в end после комиссий, путь)
+def best_net_path(node_pool: dict[str, GraphNode], start_node: GraphNode, end_node: GraphNode,
+                  quotes: dict[str, float], fees: FeeModel, amount: float = 1.,
+                  max_hops: int | None = None) -> tuple[float, list[GraphNode]]:
+    graph = from_node_pool(node_pool, quotes)
+    _, ids = best_net_path_compact(graph, fees, graph.index[start_node.name], graph.index[end_node.name],
+                                   amount, max_hops)
+    path: list[GraphNode] = [node_pool[graph.names[i]] for i in ids]
+    # сумма пересчитывается тем же порядком операций, что и calculate_path_net_value
+    return (calculate_path_net_value(path, quotes, fees, amount) if path else 0.), path
+
+
+def test_best_net_path():
+    from all_pathes import find_all_pathes, test_find_all_pathes
+    from best_path import best_conversion_path
+    from benchmark import generate_random_graph
+
+    node_pool, path, quotes = test_find_all_pathes()
+    start_node, end_node = node_pool['111'], node_pool['888']
+
+    # без комиссий - обычный лучший путь
+    assert best_net_path(node_pool, start_node, end_node, quotes, FeeModel()) == (6., path)
+
+    # процентная комиссия делает длинные пути невыгодными
+    value, net_path = best_net_path(node_pool, start_node, end_node, quotes, FeeModel(percent=0.3))
+    print('30% fee:', value, net_path)
+    assert [node.name for node in net_path] == ['111', '888'] and abs(value - 2.45) < 1e-12
+    value, net_path = best_net_path(node_pool, start_node, end_node, quotes, FeeModel(percent=0.3), max_hops=1)
+    assert [node.name for node in net_path] == ['111', '888']
+
+    # фиксированная комиссия: ответ зависит от суммы
+    fees = FeeModel(fixed=1.)
+    all_pathes = find_all_pathes(start_node, end_node)
+    for amount in (1.5, 3., 10.):
+        value, net_path = best_net_path(node_pool, start_node, end_node, quotes, fees, amount)
+        expected = max(calculate_path_net_value(p, quotes, fees, amount) for p in all_pathes)
+        print(f'amount {amount}:', value, net_path)
+        assert abs(value - expected) < 1e-12
+    assert [node.name for node in best_net_path(node_pool, start_node, end_node, quotes, fees, 1.5)[1]] == ['111', '888']
+    assert [node.name for node in best_net_path(node_pool, start_node, end_node, quotes, fees, 10.)[1]] == \
+        ['111', '555', '666', '888']
+
+    # недостижимая вершина и сумма, не покрывающая комиссию
+    assert best_net_path(node_pool, end_node, start_node, quotes, fees) == (0., [])
+    assert best_net_path(node_pool, start_node, end_node, quotes, FeeModel(fixed=5.), 2.) == (0., [])
+
+    # комиссия отдельного ребра и спред на случайном графе: совпадение с перебором по путям до 3 рёбер
+    node_pool, quotes = generate_random_graph(8, density=0.6, seed=11)
+    names = list(node_pool)
+    fees = FeeModel(spread=0.002, percent=0.001, fixed=0.01, percents={f'{names[0]}{names[1]}': 0.05})
+    start_node, end_node = node_pool[names[0]], node_pool[names[-1]]
+    value, net_path = best_net_path(node_pool, start_node, end_node, quotes, fees, 5., max_hops=3)
+    short = [p for p in find_all_pathes(start_node, end_node) if len(p) <= 4]
+    assert abs(value - max(calculate_path_net_value(p, quotes, fees, 5.) for p in short)) < 1e-12
+
+    # без фиксированных комиссий - то же, что поиск по логарифмам чистых курсов
+    fees = FeeModel(spread=0.002, percent=0.001)
+    net_quotes = {key: fees.net_rate(key, rate) for key, rate in quotes.items()}
+    value, net_path = best_net_path(node_pool, start_node, end_node, quotes, fees)
+    log_value, log_path = best_conversion_path(node_pool, start_node, end_node, net_quotes)
+    assert net_path == log_path and abs(value - log_value) < 1e-12
+    return net_path
+
+
+if __name__ == '__main__':
+    test_best_net_path()
@@ -1,8 +1,28 @@
+import sys
+
+
+'''
+узел графа валют
+
+    - __slots__ вместо __dict__: узел занимает меньше памяти, доступ к name и children быстрее
+    - имя интернируется (sys.intern), хэш считается один раз при создании
+    - GraphNode равны, когда равны их имена - узлы можно создавать независимо (тесты, mock-графы)
+
+PooledNode - узел из NodePool: в пуле на каждое имя ровно один узел, поэтому равенство и хэш
+берутся по идентичности объекта (object.__eq__ / object.__hash__, реализованы на C),
+и операции с множествами и словарями узлов (visited, predecessors) не вызывают методов на Python
+сравнение PooledNode с GraphNode того же имени по-прежнему даёт True (через GraphNode.__eq__),
+но хранить в одном множестве узлы из пула и узлы вне пула не нужно - хэши у них разные
+'''
+
 
 class GraphNode:
+    __slots__ = ('name', 'children', '_hash')
+
     def __init__(self, name: str, children: list = None):
-        self.name: str = name
+        self.name: str = sys.intern(name)
         self.children: list[GraphNode] = children if children is not None else []
+        self._hash: int = hash(self.name)
 
     def __repr__(self):
         return f'{self.name}'
@@ -11,9 +31,11 @@ class GraphNode:
         return f'{self.name}'
 
     def __hash__(self):
-        return hash(self.name)
+        return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, GraphNode):
             return self.name == other.name
         return super(GraphNode, self).__eq__(other)
@@ -40,3 +62,49 @@ class GraphNode:
         if isinstance(other, GraphNode):
             return self.name >= other.name
         raise TypeError(f'type {type(GraphNode)} can not be compare with type {type(other)}')
+
+
+class PooledNode(GraphNode):
+    __slots__ = ()
+
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+
+# реестр узлов: имя -> единственный узел с этим именем
+# это обычный dict[str, GraphNode], поэтому его можно передавать везде, где ожидается node_pool
+class NodePool(dict):
+    # новый узел с пустым списком детей (заменяет узел с тем же именем, если он был)
+    def create(self, name: str) -> PooledNode:
+        node = PooledNode(name)
+        self[node.name] = node
+        return node
+
+    # узел с данным именем, создаётся при первом обращении
+    def get_or_create(self, name: str) -> PooledNode:
+        node = self.get(name)
+        if node is None:
+            node = self.create(name)
+        return node
+
+
+def test_graph_node():
+    plain_a, plain_b = GraphNode('AAA'), GraphNode('AA' + 'A'.lower().upper())
+    assert plain_a == plain_b and hash(plain_a) == hash(plain_b) and plain_a.name is plain_b.name
+    assert not hasattr(plain_a, '__dict__')
+
+    pool = NodePool()
+    node_a = pool.get_or_create('AAA')
+    node_b = pool.get_or_create('BBB')
+    assert pool.get_or_create('AAA') is node_a and list(pool) == ['AAA', 'BBB']
+    assert node_a == node_a and node_a != node_b and node_a < node_b
+    assert len({node_a, node_b, pool['AAA']}) == 2
+
+    # пересоздание узла - это уже другой узел
+    assert pool.create('AAA') != node_a
+    return pool
+
+
+if __name__ == '__main__':
+    test_graph_node()
@@ -0,0 +1,186 @@
+import heapq
+import random
+
+import numpy as np
+
+from graph_definition import GraphNode
+from metrics import METRICS
+from best_path import best_conversion_path_matrix, best_simple_path_matrix
+from rate_matrix import QUOTE_RTOL, log_tolerance, log_rate_matrix, rate_matrix_from_node_pool
+
+
+'''
+k лучших простых путей преобразования (алгоритм Йена) по логарифмам курсов
+
+    1. Лучший путь ищется динамикой по рёбрам (best_path.best_conversion_path_matrix)
+    2. Каждый следующий путь - ответвление от уже найденного:
+        для каждой вершины i найденного пути берём его начало до i (корень),
+        запрещаем рёбра, которыми из того же корня выходили уже найденные пути,
+        и вершины корня, после чего ищем лучшее продолжение из i
+    3. Кандидаты хранятся в куче, следующий путь - лучший из кандидатов
+
+стоимость - O(k * L) поисков лучшего пути (L - длина пути), т.е. растёт с k,
+а не с общим числом путей, как полный перебор find_all_pathes
+
+max_hops ограничивает число рёбер в каждом пути
+rtol - относительная точность котировок (см. rate_matrix.QUOTE_RTOL): циклы с выигрышем меньше rtol
+(округление котировок) не выгодны, пути со значениями ближе rtol поиск считает равными,
+поэтому среди таких почти равных путей выбор может отличаться от полного перебора;
+маленький rtol (например 1e-9) даёт точный порядок, но на почти согласованных курсах
+перебор простых путей тогда растёт экспоненциально - годится для малых графов или с max_hops
+если динамика всё же даёт маршрут с повтором вершин (выгодный цикл больше rtol),
+продолжение ищется перебором простых путей с отсечением (best_path.best_simple_path_matrix),
+поэтому каждое продолжение - лучший простой путь, и кандидаты не теряются
+'''
+
+
+def _path_log_value(log_rates: np.ndarray, path: list[int]) -> float:
+    value = 0.
+    for i in range(len(path) - 1):
+        value += float(log_rates[path[i], path[i + 1]])
+    return value
+
+
+# лучший простой путь: динамика, а если её маршрут повторяет вершины - перебор с отсечением
+def _best_simple_path(log_rates: np.ndarray, start: int, end: int, max_hops: int,
+                      eps: float) -> tuple[float, list[int]]:
+    value, path = best_conversion_path_matrix(log_rates, start, end, max_hops, eps)
+    if len(set(path)) != len(path):
+        value, path = best_simple_path_matrix(log_rates, start, end, max_hops, eps)
+    return value, path
+
+
+# k лучших путей по матрице логарифмов курсов: список (логарифм значения, путь из номеров вершин)
+def k_best_pathes_matrix(log_rates: np.ndarray, start: int, end: int, k: int, max_hops: int | None = None,
+                         rtol: float = QUOTE_RTOL) -> list[tuple[float, list[int]]]:
+    max_hops = max_hops if max_hops is not None else len(log_rates) - 1
+    eps = log_tolerance(rtol)
+    _, path = _best_simple_path(log_rates, start, end, max_hops, eps)
+    if not path:
+        return []
+
+    found: list[tuple[float, list[int]]] = [(_path_log_value(log_rates, path), path)]
+    candidates: list[tuple[float, int, list[int]]] = []  # куча (-значение, порядковый номер, путь)
+    seen: set[tuple[int, ...]] = {tuple(path)}
+    counter: int = 0
+    spur_searches: int = 0
+
+    while len(found) < k:
+        previous = found[-1][1]
+        for i in range(len(previous) - 1):
+            spur_node = previous[i]
+            root = previous[:i + 1]
+            masked = log_rates.copy()
+            # запрещаем рёбра, которыми найденные пути с тем же корнем уходят из spur_node
+            for _, path in found:
+                if path[:i + 1] == root:
+                    masked[path[i], path[i + 1]] = -np.inf
+            # вершины корня (кроме spur_node) в продолжении встречаться не могут
+            for node in root[:-1]:
+                masked[node, :] = -np.inf
+                masked[:, node] = -np.inf
+
+            _, spur_path = _best_simple_path(masked, spur_node, end, max_hops - i, eps)
+            spur_searches += 1
+            if not spur_path:
+                continue
+            candidate = root[:-1] + spur_path  # простой: вершины корня из продолжения исключены
+            key = tuple(candidate)
+            if key in seen:
+                continue
+            seen.add(key)
+            counter += 1
+            heapq.heappush(candidates, (-_path_log_value(log_rates, candidate), counter, candidate))
+
+        if not candidates:
+            break
+        value, _, path = heapq.heappop(candidates)
+        found.append((-value, path))
+    # в пределах допуска пути могли найтись не строго по убыванию точных значений
+    found.sort(key=lambda item: -item[0])
+    if METRICS.enabled:
+        METRICS.count('k_best.spur_searches', spur_searches)
+        METRICS.count('k_best.pathes_enumerated', len(found))
+    return found
+
+
+# k лучших путей на графе из GraphNode: список (значение, путь) по убыванию значения
+def k_best_pathes(node_pool: dict[str, GraphNode], start_node: GraphNode, end_node: GraphNode,
+                  quotes: dict[str, float], k: int, max_hops: int | None = None,
+                  rtol: float = QUOTE_RTOL) -> list[tuple[float, list[GraphNode]]]:
+    names: list[str] = list(node_pool)
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+    log_rates = log_rate_matrix(rate_matrix_from_node_pool(node_pool, quotes))
+
+    result: list[tuple[float, list[GraphNode]]] = []
+    for _, ids in k_best_pathes_matrix(log_rates, index[start_node.name], index[end_node.name], k, max_hops, rtol):
+        path = [node_pool[names[i]] for i in ids]
+        path_value: float = 1.
+        for i in range(len(path) - 1):
+            path_value = path_value * quotes[f'{path[i]}{path[i + 1]}']
+        result.append((path_value, path))
+    return result
+
+
+def test_k_best_pathes():
+    from all_pathes import iter_pathes, calculate_pathes_value, test_find_all_pathes
+    from benchmark import generate_random_graph
+
+    node_pool, _, quotes = test_find_all_pathes()
+    best = k_best_pathes(node_pool, node_pool['111'], node_pool['888'], quotes, k=3)
+    print('k best:', best)
+    assert [value for value, _ in best] == [6., 4.5, 4.]
+
+    # совпадение с полным перебором на графе без выгодных циклов
+    node_pool, quotes = generate_random_graph(9, density=0.7, seed=3)
+    start_node, end_node = node_pool['AAA'], node_pool['AAI']
+    for max_hops in (None, 3):
+        pathes = list(iter_pathes(start_node, end_node, max_hops))
+        values = sorted(calculate_pathes_value(pathes, quotes), reverse=True)
+        best = k_best_pathes(node_pool, start_node, end_node, quotes, k=10, max_hops=max_hops)
+        assert len(best) == min(10, len(pathes))
+        assert all(abs(value / expected - 1) < 1e-12 for (value, _), expected in zip(best, values))
+        assert len({tuple(path) for _, path in best}) == len(best)
+
+    # котировки, округлённые до 6 значащих цифр (как у mock_api): циклы округления не мешают поиску
+    from mock_api import MOCK_USD_PRICES
+    from graph_definition import NodePool
+    from all_pathes import find_best_pathes
+    names = list(MOCK_USD_PRICES)
+    rounded = {f'{a}{b}': float(f'{MOCK_USD_PRICES[a] / MOCK_USD_PRICES[b]:.6g}') for a in names for b in names if a != b}
+    rounded_pool = NodePool()
+    for name in names:
+        rounded_pool.create(name)
+    for key in rounded:
+        rounded_pool[key[:3]].children.append(rounded_pool[key[3:]])
+    best = k_best_pathes(rounded_pool, rounded_pool['EUR'], rounded_pool['JPY'], rounded, k=3)
+    print('rounded quotes EUR -> JPY:', best)
+    expected = find_best_pathes(rounded_pool['EUR'], rounded_pool['JPY'], rounded, top_k=3)
+    assert len(best) == 3 and len({tuple(path) for _, path in best}) == 3
+    assert all(len(set(path)) == len(path) for _, path in best)
+    assert [value for value, _ in best] == sorted((value for value, _ in best), reverse=True)
+    assert all(abs(value / exact - 1) < 1e-5 for (value, _), (exact, _) in zip(best, expected))
+
+    # шум 1e-5 даёт настоящие выгодные циклы: продолжения - лучшие простые пути,
+    # с маленьким допуском порядок совпадает с перебором find_best_pathes
+    rng = random.Random(7)
+    names = [f'C{i:02d}' for i in range(12)]
+    prices = {name: rng.uniform(0.5, 2.) for name in names}
+    noisy = {f'{a}{b}': prices[a] / prices[b] * (1 + rng.uniform(-1e-5, 1e-5)) for a in names for b in names if a != b}
+    noisy_pool = NodePool()
+    for name in names:
+        noisy_pool.create(name)
+    for key in noisy:
+        noisy_pool[key[:3]].children.append(noisy_pool[key[3:]])
+    start_node, end_node = noisy_pool['C00'], noisy_pool['C05']
+    expected = find_best_pathes(start_node, end_node, noisy, max_hops=3, top_k=3)
+    best = k_best_pathes(noisy_pool, start_node, end_node, noisy, k=3, max_hops=3, rtol=1e-9)
+    assert [path for _, path in best] == [path for _, path in expected]
+    assert all(abs(value / exact - 1) < 1e-12 for (value, _), (exact, _) in zip(best, expected))
+    best = k_best_pathes(noisy_pool, start_node, end_node, noisy, k=3, max_hops=3)
+    assert all(abs(value / exact - 1) < 1e-5 for (value, _), (exact, _) in zip(best, expected))
+    return best
+
+
+if __name__ == '__main__':
+    test_k_best_pathes()
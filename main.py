@@ -1,44 +1,37 @@
 
+import argparse
+import contextlib
 import json
-from graphviz import Digraph
+import sys
+import threading
+import time
+from typing import Iterable, TextIO
 
 from graph_definition import GraphNode
-from one_path import dijkstra_max_product_path
-from all_pathes import find_all_pathes, calculate_pathes_value
-from parser import Parser
+from best_path import best_rates_from_many
+from k_best import k_best_pathes
+from fees import FeeModel, best_net_path
+from all_pathes import find_all_pathes, find_best_pathes, calculate_pathes_value_batched
+from cycles import find_arbitrage_cycles
+from pruning import reduce_graph, cycle_subgraph
+from all_pairs import AllPairsTable
+from parser import Parser, STALE_USE
+from metrics import METRICS
+from query_cache import QueryCache
+from rendering import GraphRenderer
+from snapshot import Snapshot, QUERY_ALGORITHMS, build_snapshot, update_snapshot
+from refresher import BackgroundRefresher
+
+# алгоритмы, доступные в пакетном режиме
+BATCH_ALGORITHMS = QUERY_ALGORITHMS
 
 
 def visualize_graph(node_pool: dict[str, GraphNode], path: list[GraphNode], quotes: dict[str, float]):
-    def is_neighbours_in_path(node1: GraphNode, node2: GraphNode) -> bool:
-        nonlocal path
-        if node1 not in path or node2 not in path:
-            return False
-        idx1 = path.index(node1)
-        idx2 = path.index(node2)
-        if abs(idx1 - idx2) < 2:
-            return True
-        return False
-
-    dot = Digraph(comment='Graph Visualization')
-
-    # Добавляем все узлы
-    for node_name, node in node_pool.items():
-        if node in path:
-            # Выделение узлов, которые есть в пути
-            dot.node(node_name, node_name, color='red')
-        else:
-            dot.node(node_name, node_name)
-
-        # Добавляем все рёбра
-        for child in node.children:
-            if is_neighbours_in_path(node, child):
-                dot.edge(node_name, child.name, label=str(quotes[f'{node.name}{child.name}']), color='red')
-            else:
-                dot.edge(node_name, child.name)
-
+    renderer = GraphRenderer(background=False)
+    renderer.prepare(node_pool)
     print("graph has built \nwaiting visualization...")
     # Визуализация и сохранение графа
-    dot.render('graph_output', view=True, format='png')
+    renderer.render(node_pool, path, quotes)
 
 
 class Main:
@@ -49,20 +42,91 @@ class Main:
             cls._instance = super(Main, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, access_key: str):
+    def __init__(self, access_key: str, **parser_options):
         self.access_key: str = access_key
-        self.parser: Parser = Parser(access_key)
-
-        self.all_quotes: dict[str, float] = dict()
-        self.node_pool: dict[str, GraphNode] = dict()
-        self.currencies: dict[str, str] = {}
-
+        self.parser: Parser = Parser(access_key, **parser_options)
+
+        # текущий снимок данных: запрос берёт ссылку на него один раз и работает только с ним,
+        # новые данные собираются в отдельный снимок и публикуются заменой ссылки (publish)
+        # версия снимка - ключ кэша результатов запросов и описания графа для отрисовки
+        self.current: Snapshot = Snapshot(0, {}, {}, {}, None)
+        self.cache: QueryCache = QueryCache()
+        # новый снимок строится ровно тогда, когда Parser получил новые котировки (загрузка или поток обновлений)
+        self.parser.subscribe(self.on_quotes_changed)
+        self.refresher: BackgroundRefresher | None = None
+        # следующий снимок строится из текущего и публикуется под одной блокировкой - версии не повторяются
+        self.publish_lock = threading.RLock()
+
+        self.prune_dominated: bool = False  # перебор путей без рёбер, проигрывающих обходу через одну валюту
+        self.fees: FeeModel = FeeModel()  # комиссии и спреды для поиска с учётом комиссий
+
+        self.render: bool = True  # рисовать найденный путь (в фоновом потоке)
+        self.renderer: GraphRenderer = GraphRenderer()
+
+    # данные текущего снимка (только для чтения)
+    @property
+    def all_quotes(self) -> dict[str, float]:
+        return self.current.quotes
+
+    @property
+    def node_pool(self) -> dict[str, GraphNode]:
+        return self.current.node_pool
+
+    @property
+    def currencies(self) -> dict[str, str]:
+        return self.current.currencies
+
+    @property
+    def all_pairs(self) -> AllPairsTable:
+        return self.current.all_pairs
+
+    @property
+    def data_version(self) -> int:
+        return self.current.version
+
+    # Parser меняет свои котировки и граф на месте, запросы их не видят:
+    # снимок публикует on_quotes_changed, когда загрузка закончена
+    # загрузка из меню, фоновое обновление и поток обновлений идут по очереди (Parser.lock)
     def get_real_data(self):
         self.parser.get_all_quotes()
+        return
 
-        self.all_quotes = self.parser.all_quotes
-        self.node_pool = self.parser.node_pool
-        self.currencies = self.parser.currencies
+    # новый снимок из данных Parser - строится в потоке, который получил котировки, под Parser.lock
+    def on_quotes_changed(self, changed: dict[str, float]):
+        parser = self.parser
+        with self.publish_lock:
+            current = self.current
+            # изменились только курсы рёбер текущего снимка (поток обновлений или та же загрузка заново):
+            # граф снимка переиспользуется, копируются только котировки
+            same_graph = len(parser.all_quotes) == len(current.quotes) and \
+                parser.node_pool.keys() == current.node_pool.keys() and \
+                all(key in current.quotes for key in changed)
+            if same_graph:
+                snapshot = update_snapshot(current, current.version + 1, changed)
+            else:
+                currencies = {name: (parser.currencies or {}).get(name, name) for name in parser.node_pool}
+                snapshot = build_snapshot(current.version + 1, currencies, parser.all_quotes)
+            self.publish(snapshot)
+        return
+
+    # замена снимка - одно присваивание ссылки, начатые запросы дорабатывают на старом снимке
+    def publish(self, snapshot: Snapshot):
+        with self.publish_lock:
+            self.current = snapshot
+            self.cache.invalidate()  # записи старых версий больше не будут запрошены
+        return
+
+    # фоновое обновление котировок раз в interval секунд
+    def start_refresher(self, interval: float = 60.) -> BackgroundRefresher:
+        if self.refresher is None:
+            self.refresher = BackgroundRefresher(self.get_real_data, interval).start()
+        return self.refresher
+
+    def stop_refresher(self):
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+        return
 
     def get_mock_data(self):
         node_pool: dict[str, GraphNode] = dict()
@@ -116,58 +180,259 @@ class Main:
             '777888': 4
         }
 
-        self.all_quotes = quotes
-        self.node_pool = node_pool
+        with self.publish_lock:
+            self.publish(Snapshot(self.current.version + 1, {name: name for name in node_pool}, quotes, node_pool))
         return
 
     def calculate_by_all_pathes(self, start_node_name: str, end_node_name: str):
-        if start_node_name not in self.node_pool:
+        snapshot = self.snapshot()
+        if start_node_name not in snapshot.node_pool:
             raise KeyError(f'Node with name {start_node_name} does not exists')
-        if end_node_name not in self.node_pool:
+        if end_node_name not in snapshot.node_pool:
             raise KeyError(f'Node with name {end_node_name} does not exists')
 
-        start_node = self.node_pool[start_node_name]
-        end_node = self.node_pool[end_node_name]
-
-        all_pathes: list[list[GraphNode]] = find_all_pathes(start_node, end_node)
-        print('\nall pathes')
-        for cur_path in all_pathes:
-            print(cur_path)
+        start_node = snapshot.node_pool[start_node_name]
+        end_node = snapshot.node_pool[end_node_name]
+
+        # в кэше только лучший путь: список всех путей может занимать гигабайты,
+        # поэтому он печатается при переборе и не хранится
+        computed: bool = False
+
+        def search():
+            nonlocal computed
+            computed = True
+            node_pool, quotes = reduce_graph(snapshot.node_pool, snapshot.quotes, start_node, end_node,
+                                             self.prune_dominated)
+            all_pathes: list[list[GraphNode]] = find_all_pathes(node_pool[start_node_name], node_pool[end_node_name])
+            values, idx = calculate_pathes_value_batched(all_pathes, quotes)
+            print('\nall pathes')
+            for cur_path in all_pathes:
+                print(cur_path)
+
+            print('\nvalues')
+            print(values)
+            return (values[idx], all_pathes[idx]) if idx >= 0 else (0., [])
+
+        algorithm = 'all_pathes_undominated' if self.prune_dominated else 'all_pathes'
+        key = self.cache.key(start_node_name, end_node_name, algorithm, snapshot.version)
+        max_value, path = self.cache.get_or_compute(key, search)
+        if not computed:
+            print('\nall pathes: result from cache, listing skipped')
+        if not path:
+            raise ValueError(f'No path from {start_node_name} to {end_node_name}')
 
-        values: list[float] = calculate_pathes_value(all_pathes, self.all_quotes)
-        print('\nvalues')
-        print(values)
-
-        max_value = max(values)
         print(f'\nmax value = {max_value}')
 
-        idx = values.index(max_value)
+        print("Максимальное произведение весов:", max_value)
+        print("Путь:", path)
 
-        path = all_pathes[idx]
+        self.visualize(path, snapshot)
+        return
 
+    def calculate_by_best_pathes(self, start_node_name: str, end_node_name: str,
+                                 max_hops: int | None = None, top_k: int = 1):
+        snapshot = self.snapshot()
+        if start_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {start_node_name} does not exists')
+        if end_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {end_node_name} does not exists')
+
+        start_node = snapshot.node_pool[start_node_name]
+        end_node = snapshot.node_pool[end_node_name]
+
+        # отбрасывание рёбер-проигравших сохраняет только лучшее значение без ограничения рёбер,
+        # поэтому для max_hops и списка top_k путей оно не применяется
+        drop_dominated = self.prune_dominated and max_hops is None and top_k == 1
+        node_pool, quotes = reduce_graph(snapshot.node_pool, snapshot.quotes, start_node, end_node, drop_dominated)
+        best_pathes = find_best_pathes(node_pool[start_node_name], node_pool[end_node_name], quotes,
+                                       max_hops=max_hops, top_k=top_k)
+        if not best_pathes:
+            raise ValueError(f'No path from {start_node_name} to {end_node_name}')
+        for value, cur_path in best_pathes:
+            print(value, cur_path)
+
+        max_value, path = best_pathes[0]
         print("Максимальное произведение весов:", max_value)
         print("Путь:", path)
 
-        visualize_graph(self.node_pool, path, self.all_quotes)
+        self.visualize(path, snapshot)
         return
 
     def calculate_by_one_path(self, start_node_name: str, end_node_name: str):
-        if start_node_name not in self.node_pool:
+        snapshot = self.snapshot()
+        if start_node_name not in snapshot.node_pool:
             raise KeyError(f'Node with name {start_node_name} does not exists')
-        if end_node_name not in self.node_pool:
+        if end_node_name not in snapshot.node_pool:
             raise KeyError(f'Node with name {end_node_name} does not exists')
 
-        start_node = self.node_pool[start_node_name]
-        end_node = self.node_pool[end_node_name]
+        weight, names = self.query_snapshot(snapshot, start_node_name, end_node_name, 'one')
+        path: list[GraphNode] = [snapshot.node_pool[name] for name in names]
+        print("Максимальное произведение весов:", weight)
+        print("Путь:", path)
+
+        self.visualize(path, snapshot)
+        return
+
+    def calculate_by_best_path(self, start_node_name: str, end_node_name: str, max_hops: int | None = None):
+        snapshot = self.snapshot()
+        if start_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {start_node_name} does not exists')
+        if end_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {end_node_name} does not exists')
 
-        weight, path = dijkstra_max_product_path(self.node_pool, start_node, end_node, self.all_quotes)
+        weight, names = self.query_snapshot(snapshot, start_node_name, end_node_name, 'best', max_hops)
+        path: list[GraphNode] = [snapshot.node_pool[name] for name in names]
+        if not path:
+            raise ValueError(f'No path from {start_node_name} to {end_node_name}')
         print("Максимальное произведение весов:", weight)
         print("Путь:", path)
 
-        # Вызов функции с вашими данными
-        visualize_graph(self.node_pool, path, self.all_quotes)
+        self.visualize(path, snapshot)
+        return
+
+    # k лучших простых путей (алгоритм Йена) - стоимость растёт с k, а не с числом всех путей
+    def calculate_by_k_best(self, start_node_name: str, end_node_name: str, k: int = 1,
+                            max_hops: int | None = None):
+        snapshot = self.snapshot()
+        if start_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {start_node_name} does not exists')
+        if end_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {end_node_name} does not exists')
+
+        start_node = snapshot.node_pool[start_node_name]
+        end_node = snapshot.node_pool[end_node_name]
+
+        best_pathes = k_best_pathes(snapshot.node_pool, start_node, end_node, snapshot.quotes, k, max_hops)
+        if not best_pathes:
+            raise ValueError(f'No path from {start_node_name} to {end_node_name}')
+        for value, cur_path in best_pathes:
+            print(value, cur_path)
+
+        max_value, path = best_pathes[0]
+        print("Максимальное произведение весов:", max_value)
+        print("Путь:", path)
+
+        self.visualize(path, snapshot)
         return
 
+    # лучший путь по сумме после спредов и комиссий (self.fees), не длиннее max_hops рёбер
+    def calculate_by_net_path(self, start_node_name: str, end_node_name: str, amount: float = 1.,
+                              max_hops: int | None = None):
+        snapshot = self.snapshot()
+        if start_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {start_node_name} does not exists')
+        if end_node_name not in snapshot.node_pool:
+            raise KeyError(f'Node with name {end_node_name} does not exists')
+
+        start_node = snapshot.node_pool[start_node_name]
+        end_node = snapshot.node_pool[end_node_name]
+
+        value, path = best_net_path(snapshot.node_pool, start_node, end_node, snapshot.quotes, self.fees,
+                                    amount, max_hops)
+        if not path:
+            raise ValueError(f'No path from {start_node_name} to {end_node_name} for amount {amount}')
+        print("Сумма после комиссий:", value)
+        print("Путь:", path)
+
+        self.visualize(path, snapshot)
+        return value, path
+
+    # лучшие курсы из каждой валюты-источника во все валюты за один проход на источник
+    def calculate_rates_from(self, start_node_names: list[str], max_hops: int | None = None):
+        snapshot = self.snapshot()
+        for name in start_node_names:
+            if name not in snapshot.node_pool:
+                raise KeyError(f'Node with name {name} does not exists')
+
+        start_nodes = [snapshot.node_pool[name] for name in start_node_names]
+        trees = best_rates_from_many(snapshot.node_pool, start_nodes, snapshot.quotes, max_hops)
+        for start_name, tree in trees.items():
+            print(f'\nлучшие курсы из {start_name}')
+            for end_name, rate in tree.rates().items():
+                print(end_name, rate, ' -> '.join(tree.path(end_name)))
+        return trees
+
+    # отрисовка пути в фоне: описание графа строится один раз на снимок
+    def visualize(self, path: list[GraphNode], snapshot: Snapshot | None = None):
+        if not self.render:
+            return
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        self.renderer.render(snapshot.node_pool, path, snapshot.quotes, snapshot_key=snapshot.version)
+        return
+
+    # ответ по заранее рассчитанной таблице всех пар - без поиска
+    def calculate_by_table(self, start_node_name: str, end_node_name: str) -> tuple[float, list[str]]:
+        snapshot = self.snapshot()
+        if not snapshot.node_pool:
+            raise ValueError('No data loaded')
+        if snapshot.all_pairs.has_arbitrage:
+            print('в котировках есть выгодные циклы - таблица всех пар недействительна, ответ поиском по рёбрам')
+        weight, path = snapshot.query(start_node_name, end_node_name, 'table')
+        print("Максимальное произведение весов:", weight)
+        print("Путь:", path)
+        return weight, path
+
+    def calculate_cycles(self):
+        snapshot = self.snapshot()
+        # выгодный цикл лежит внутри одной компоненты сильной связности - остальные вершины и рёбра не нужны
+        node_pool, quotes = cycle_subgraph(snapshot.node_pool, snapshot.quotes)
+        cycles = find_arbitrage_cycles(list(node_pool), quotes)
+        if not cycles:
+            print('выгодных циклов нет')
+            return
+        for gain, cycle in cycles:
+            print(f'{gain:.6f}', ' -> '.join(cycle))
+        return
+
+    def snapshot(self) -> Snapshot:
+        return self.current
+
+    # ответ на один запрос без печати и отрисовки: (значение, путь в виде кодов валют)
+    # all - полный перебор, top - перебор с отсечением, one - Дейкстра, best - динамика по рёбрам, table - таблица
+    # повторный запрос на тех же данных берётся из кэша
+    def query(self, start_node_name: str, end_node_name: str, algorithm: str = 'table',
+              max_hops: int | None = None) -> tuple[float, list[str]]:
+        return self.query_snapshot(self.snapshot(), start_node_name, end_node_name, algorithm, max_hops)
+
+    def query_snapshot(self, snapshot: Snapshot, start_node_name: str, end_node_name: str, algorithm: str = 'table',
+                       max_hops: int | None = None) -> tuple[float, list[str]]:
+        key = self.cache.key(start_node_name, end_node_name, algorithm, snapshot.version, max_hops)
+        return self.cache.get_or_compute(
+            key, lambda: snapshot.query(start_node_name, end_node_name, algorithm, max_hops))
+
+    # пакетный режим: запросы построчно - JSON {"start": ..., "end": ..., "algorithm": ..., "max_hops": ...}
+    # или "START END [ALGORITHM]", ответы - JSON по строке на запрос, без отрисовки графа
+    def run_batch(self, queries: Iterable[str], output: TextIO, algorithm: str = 'table') -> dict:
+        count: int = 0
+        errors: int = 0
+        start_time = time.perf_counter()
+        for line in queries:
+            result = {'query': line.strip()}
+            try:
+                # ошибка разбора строки - такая же ошибка запроса, пакет продолжается
+                request = parse_query(line, algorithm)
+                if request is None:
+                    continue
+                result = dict(request)
+                value, path = self.query(request['start'], request['end'], request['algorithm'],
+                                         request.get('max_hops'))
+                result.update({'value': value, 'path': path})
+            except Exception as ex:
+                errors += 1
+                result['error'] = str(ex)
+            output.write(json.dumps(result) + '\n')
+            count += 1
+
+        elapsed = time.perf_counter() - start_time
+        stats = {
+            'queries': count,
+            'errors': errors,
+            'seconds': elapsed,
+            'queries_per_second': count / elapsed if elapsed > 0 else 0.,
+            'cache': self.cache.stats(),
+        }
+        return stats
+
     def main(self):
         while True:
             try:
@@ -179,6 +444,16 @@ class Main:
                           '5 - print all quotes\n'
                           '6 - print all currencies\n'
                           '7 - exit\n'
+                          '8 - find profitable cycles\n'
+                          '9 - calculate by alg 1 - best pathes with hops limit\n'
+                          '10 - calculate by alg 2 - hop-bounded best path\n'
+                          '11 - best rate from all pairs table\n'
+                          '12 - calculate by alg 2 - k best pathes\n'
+                          '13 - print metrics (collection is turned on by the first call)\n'
+                          '14 - best rates from currencies to all others\n'
+                          '15 - start/stop background refresh of real data\n'
+                          '16 - best path with spreads and fees\n'
+                          '17 - turn on/off pruning of dominated edges before enumeration\n'
                           '-> '))
                 match option:
                     case 1:
@@ -198,13 +473,223 @@ class Main:
                     case 6:
                         print(json.dumps(self.currencies, indent=4))
                     case 7:
+                        self.stop_refresher()
+                        self.renderer.close()
                         return
+                    case 8:
+                        self.calculate_cycles()
+                    case 9:
+                        start_name = input('start name -> ')
+                        end_name = input('end name -> ')
+                        max_hops = input('max hops (empty - no limit) -> ')
+                        top_k = input('number of best pathes (empty - 1) -> ')
+                        self.calculate_by_best_pathes(start_name, end_name,
+                                                      int(max_hops) if max_hops else None,
+                                                      int(top_k) if top_k else 1)
+                    case 10:
+                        start_name = input('start name -> ')
+                        end_name = input('end name -> ')
+                        max_hops = input('max hops (empty - no limit) -> ')
+                        self.calculate_by_best_path(start_name, end_name, int(max_hops) if max_hops else None)
+                    case 11:
+                        start_name = input('start name -> ')
+                        end_name = input('end name -> ')
+                        self.calculate_by_table(start_name, end_name)
+                    case 12:
+                        start_name = input('start name -> ')
+                        end_name = input('end name -> ')
+                        max_hops = input('max hops (empty - no limit) -> ')
+                        top_k = input('number of best pathes (empty - 1) -> ')
+                        self.calculate_by_k_best(start_name, end_name, int(top_k) if top_k else 1,
+                                                 int(max_hops) if max_hops else None)
+                    case 13:
+                        if METRICS.enabled:
+                            print(METRICS.export())
+                            print(json.dumps(self.cache.stats(), indent=4))
+                        else:
+                            METRICS.enable()
+                            print('metrics collection enabled')
+                    case 14:
+                        start_names = input('start names separated by spaces -> ').split()
+                        max_hops = input('max hops (empty - no limit) -> ')
+                        self.calculate_rates_from(start_names, int(max_hops) if max_hops else None)
+                    case 15:
+                        if self.refresher is not None:
+                            self.stop_refresher()
+                            print('background refresh stopped')
+                        else:
+                            interval = input('interval in seconds (empty - 60) -> ')
+                            self.start_refresher(float(interval) if interval else 60.)
+                            print('background refresh started')
+                    case 16:
+                        start_name = input('start name -> ')
+                        end_name = input('end name -> ')
+                        amount = input('amount (empty - 1) -> ')
+                        max_hops = input('max hops (empty - no limit) -> ')
+                        spread = input(f'spread (empty - {self.fees.spread}) -> ')
+                        percent = input(f'percent fee (empty - {self.fees.percent}) -> ')
+                        fixed = input(f'fixed fee (empty - {self.fees.fixed}) -> ')
+                        self.fees.spread = float(spread) if spread else self.fees.spread
+                        self.fees.percent = float(percent) if percent else self.fees.percent
+                        self.fees.fixed = float(fixed) if fixed else self.fees.fixed
+                        self.calculate_by_net_path(start_name, end_name, float(amount) if amount else 1.,
+                                                   int(max_hops) if max_hops else None)
+                    case 17:
+                        self.prune_dominated = not self.prune_dominated
+                        print(f'pruning of dominated edges {"on" if self.prune_dominated else "off"}')
                     case _:
                         print('неверный номер команды')
             except Exception as ex:
                 print(ex)
 
 
+# строка запроса: JSON {"start": ..., "end": ..., "algorithm": ..., "max_hops": ...} или "START END [ALGORITHM]"
+# None для пустой строки
+def parse_query(line: str, algorithm: str = 'table') -> dict | None:
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        request = json.loads(line)  # json.JSONDecodeError - подкласс ValueError
+        if not isinstance(request, dict):
+            raise ValueError('query must be a JSON object')
+    else:
+        fields = line.split()
+        if len(fields) < 2:
+            raise ValueError('query must contain start and end')
+        request = {'start': fields[0], 'end': fields[1]}
+        if len(fields) > 2:
+            request['algorithm'] = fields[2]
+    request.setdefault('algorithm', algorithm)
+    return request
+
+
+def run_batch_cli(args: argparse.Namespace):
+    parser_options = dict()
+    if args.snapshot is not None:
+        # снимок используется как есть, даже устаревший - в пакетном режиме в сеть не ходим
+        parser_options = {'cache_path': args.snapshot, 'stale_policy': STALE_USE}
+
+    queries = sys.stdin if args.batch == '-' else open(args.batch)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        # в stdout - только строки результатов, сообщения Parser и фонового обновления уходят в stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            main = Main('cbdaabe4b8f76243c6acc161a45cb9d3', **parser_options)
+            if args.mock:
+                main.get_mock_data()
+            else:
+                main.get_real_data()
+            stats = main.run_batch(queries, output, args.algorithm)
+    finally:
+        if queries is not sys.stdin:
+            queries.close()
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(stats), file=sys.stderr)
+    if args.metrics:
+        print(METRICS.export(indent=None), file=sys.stderr)
+    return
+
+
+def test_run_batch():
+    import io
+
+    main = Main('test')
+    main.get_mock_data()
+    queries = io.StringIO('111 888\n'
+                          '111 888 all\n'
+                          '{"start": "111", "end": "888", "algorithm": "top", "max_hops": 2}\n'
+                          '888 111 best\n'
+                          '111 999\n')
+    output = io.StringIO()
+    stats = main.run_batch(queries, output)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    print(stats)
+    assert stats['queries'] == 5 and stats['errors'] == 1
+    assert results[0]['path'] == results[1]['path'] == ['111', '555', '666', '888']
+    assert results[2]['value'] == 4.5 and results[3]['path'] == [] and 'error' in results[4]
+
+    # строки, которые не разбираются, дают запись с ошибкой и не останавливают пакет
+    output = io.StringIO()
+    stats = main.run_batch(io.StringIO('USD\n{bad\n[1]\n'), output)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert stats['queries'] == 3 and stats['errors'] == 3
+    assert [result['query'] for result in results] == ['USD', '{bad', '[1]'] and all('error' in r for r in results)
+
+    # повторные запросы - из кэша, новые котировки в Parser сбрасывают кэш
+    main.run_batch(io.StringIO('111 888\n111 888 all\n'), io.StringIO())
+    assert main.cache.stats()['hits'] == 2
+    version = main.data_version
+    main.get_mock_data()
+    assert main.data_version == version + 1 and len(main.cache) == 0
+    main.run_batch(io.StringIO('111 888\n'), io.StringIO())
+    assert main.cache.stats()['hits'] == 2 and main.cache.stats()['misses'] == 6
+
+    # перебор всех путей кэширует только лучший путь, а не список всех путей
+    main.render = False
+    main.calculate_by_all_pathes('111', '888')
+    main.calculate_by_all_pathes('111', '888')
+    value, path = main.cache.entries[main.cache.key('111', '888', 'all_pathes', main.data_version)]
+    assert value == 6. and [node.name for node in path] == ['111', '555', '666', '888']
+    assert main.cache.stats()['hits'] == 3
+    return results
+
+
+def test_quote_updates():
+    import parser as parser_module
+    from mock_api import MockApiServer
+
+    debug = parser_module.DEBUG
+    parser_module.DEBUG = False
+    try:
+        with MockApiServer() as api:
+            main = Main('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live', backoff=0.01)
+            main.render = False
+            main.get_real_data()
+            first = main.snapshot()
+
+            # поток обновлений: граф снимка общий, таблица всех пар не пересчитывается до запроса к ней
+            main.parser.apply_updates([('EURUSD', 1.2)])
+            second = main.snapshot()
+            assert second.version == first.version + 1 and second.node_pool is first.node_pool
+            assert second._all_pairs is None and second.quotes['EURUSD'] == 1.2 and first.quotes['EURUSD'] != 1.2
+            assert main.query('EUR', 'USD', 'best', max_hops=1) == (1.2, ['EUR', 'USD'])
+
+            # обновления из нескольких потоков и полная загрузка: у каждого снимка своя версия
+            versions: list[int] = []
+            main.parser.subscribe(lambda changed: versions.append(main.data_version))
+            threads = [threading.Thread(target=main.parser.apply_updates, args=([('EURUSD', 1.3 + i / 100)],))
+                       for i in range(8)]
+            threads.append(threading.Thread(target=main.get_real_data))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            print('published versions:', versions)
+            assert len(versions) == 9 and len(set(versions)) == 9
+            assert main.data_version == second.version + 9
+            assert main.snapshot().quotes == main.parser.all_quotes
+    finally:
+        parser_module.DEBUG = debug
+    return versions
+
+
 if __name__ == '__main__':
-    main = Main('cbdaabe4b8f76243c6acc161a45cb9d3')
-    main.main()
+    arg_parser = argparse.ArgumentParser(description='currency conversion paths')
+    arg_parser.add_argument('--batch', help='file with queries ("-" - stdin), runs without interactive menu')
+    arg_parser.add_argument('--output', default='-', help='file for JSON lines results ("-" - stdout)')
+    arg_parser.add_argument('--algorithm', choices=BATCH_ALGORITHMS, default='table',
+                            help='algorithm for queries that do not specify one')
+    arg_parser.add_argument('--snapshot', help='quotes snapshot file (see Parser cache_path)')
+    arg_parser.add_argument('--mock', action='store_true', help='use mock graph instead of real data')
+    arg_parser.add_argument('--metrics', action='store_true', help='collect metrics and print summary to stderr')
+    cli_args = arg_parser.parse_args()
+    if cli_args.metrics:
+        METRICS.enable()
+
+    if cli_args.batch is not None:
+        run_batch_cli(cli_args)
+    else:
+        main = Main('cbdaabe4b8f76243c6acc161a45cb9d3')
+        main.main()
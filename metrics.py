@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+'''
+необязательный сбор метрик: счётчики и таймеры для Parser и алгоритмов поиска
+
+по умолчанию выключен, тогда каждая точка замера - одна проверка METRICS.enabled на вызов функции:
+    - алгоритмы считают узлы, релаксации и пути в локальных переменных
+      и записывают итог один раз в конце вызова, а не на каждой итерации
+    - timer() при выключенном сборе возвращает пустой контекст без обращения к часам
+
+имена метрик:
+    http_latency[валюта]  - время HTTP-запроса (с повторами) по каждой валюте
+    http_requests, http_retries, http_failures - число запросов, повторов и неуспешных ответов
+    node_pool_build, edge_build - построение вершин и рёбер графа
+    <алгоритм>.nodes_expanded, .relaxations, .pathes_enumerated, .pruned - работа алгоритмов поиска
+    scoring - расчёт значений путей
+
+summary() - словарь {'counters': {...}, 'timers': {...}}, export() - тот же словарь в JSON
+'''
+
+
+class TimerStats:
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.
+        self.min: float = float('inf')
+        self.max: float = 0.
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        return
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.,
+            'min': self.min if self.count else 0.,
+            'max': self.max,
+        }
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled: bool = enabled
+        self.counters: dict[str, int] = dict()
+        self.timers: dict[str, TimerStats] = dict()
+        self.lock = threading.Lock()  # Parser загружает котировки из нескольких потоков
+
+    def enable(self):
+        self.enabled = True
+        return
+
+    def disable(self):
+        self.enabled = False
+        return
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+        return
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        return
+
+    def add_time(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self.lock:
+            stats = self.timers.get(name)
+            if stats is None:
+                stats = self.timers[name] = TimerStats()
+            stats.add(seconds)
+        return
+
+    @contextmanager
+    def _timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    # замер времени блока with, при выключенном сборе - пустой контекст
+    def timer(self, name: str):
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name)
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                'counters': dict(sorted(self.counters.items())),
+                'timers': {name: stats.as_dict() for name, stats in sorted(self.timers.items())},
+            }
+
+    def export(self, indent: int | None = 4) -> str:
+        return json.dumps(self.summary(), indent=indent)
+
+
+# общий сборщик метрик процесса
+METRICS = Metrics()
+
+
+def test_metrics():
+    metrics = Metrics()
+    metrics.count('disabled')
+    with metrics.timer('disabled'):
+        pass
+    assert metrics.summary() == {'counters': {}, 'timers': {}}
+
+    metrics.enable()
+    metrics.count('pathes', 3)
+    metrics.count('pathes')
+    for _ in range(2):
+        with metrics.timer('block'):
+            time.sleep(0.001)
+    summary = json.loads(metrics.export())
+    print(json.dumps(summary, indent=4))
+    assert summary['counters'] == {'pathes': 4}
+    assert summary['timers']['block']['count'] == 2
+    assert summary['timers']['block']['min'] >= 0.001
+
+    metrics.reset()
+    assert metrics.summary() == {'counters': {}, 'timers': {}}
+    return summary
+
+
+if __name__ == '__main__':
+    test_metrics()
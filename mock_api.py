@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+'''
+локальная заглушка API currencylayer/apilayer для тестов
+
+отвечает на те же пути, что и настоящий сервис:
+    /list - список валют
+    /live?source=XXX - котировки из валюты XXX во все остальные
+
+курсы задаются через стоимость каждой валюты в USD,
+поэтому котировки согласованы между собой (без арбитража)
+'''
+
+MOCK_USD_PRICES: dict[str, float] = {
+    "AUD": 0.66,
+    "CAD": 0.73,
+    "CNY": 0.14,
+    "EUR": 1.08,
+    "GBP": 1.27,
+    "JPY": 0.0067,
+    "RUB": 0.011,
+    "USD": 1.,
+}
+
+
+class MockApiServer:
+    def __init__(self, prices: dict[str, float] = None, fail_first: int = 0, delay: float = 0.,
+                 self_quotes: bool = True):
+        self.prices: dict[str, float] = prices if prices is not None else dict(MOCK_USD_PRICES)
+        self.self_quotes: bool = self_quotes  # отдавать котировку валюты в саму себя (USDUSD)
+        self.fail_first: int = fail_first  # сколько первых запросов /live ответят ошибкой 503
+        self.delay: float = delay  # искусственная задержка ответа в секундах
+        self.requests_count: int = 0
+        self.connections: set[tuple[str, int]] = set()  # адреса клиентов (для проверки переиспользования соединений)
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def quotes_by_source(self, source: str) -> dict[str, float]:
+        source_price = self.prices[source]
+        return {f'{source}{name}': source_price / price for name, price in self.prices.items()
+                if self.self_quotes or name != source}
+
+    def start(self) -> 'MockApiServer':
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, чтобы клиент мог переиспользовать соединение
+
+            def do_GET(self):
+                with api._lock:
+                    api.requests_count += 1
+                    api.connections.add(self.client_address)
+                    fail = api.fail_first > 0 and self.path.startswith('/live')
+                    if fail:
+                        api.fail_first -= 1
+                if api.delay:
+                    time.sleep(api.delay)
+                if fail:
+                    self._send(503, {'success': False})
+                    return
+
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if url.path == '/list':
+                    self._send(200, {'success': True, 'currencies': {name: name for name in api.prices}})
+                elif url.path == '/live':
+                    source = params.get('source', ['USD'])[0]
+                    if source not in api.prices:
+                        self._send(200, {'success': False, 'error': {'code': 201, 'info': 'invalid source'}})
+                        return
+                    self._send(200, {'success': True, 'source': source, 'quotes': api.quotes_by_source(source)})
+                else:
+                    self._send(404, {'success': False})
+
+            def _send(self, code: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return  # не засоряем вывод тестов
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -4,6 +4,8 @@ import heapq
 import time
 
 from graph_definition import GraphNode
+from metrics import METRICS
+from compact_graph import CompactGraph, from_node_pool
 
 
 '''
@@ -29,8 +31,7 @@ from graph_definition import GraphNode
 и используем -бесконечность вместо бесконечности для инициализации расстояний.
 '''
 
-# есть идея - добавить третий алгоритм - поиск полезных циклов
-# но сначала довести до ума надо то что есть
+# третий алгоритм - поиск полезных циклов - реализован в cycles.py
 def dijkstra_max_product_path(node_pool: dict[str, GraphNode], start_node: GraphNode, end_node: GraphNode,
                               quotes: dict[str, float]) -> tuple[float, list[GraphNode]]:
     # Проверяет, создаст ли добавление new_predecessor в качестве предшественника current_node цикл.
@@ -62,6 +63,7 @@ def dijkstra_max_product_path(node_pool: dict[str, GraphNode], start_node: Graph
     priority_queue: list[tuple[int | float, GraphNode]] = [(0, start_node)]
 
     visited: set[GraphNode] = set()
+    relaxations: int = 0
 
     while priority_queue:
         current_distance, current_node = heapq.heappop(priority_queue)
@@ -80,6 +82,11 @@ def dijkstra_max_product_path(node_pool: dict[str, GraphNode], start_node: Graph
                 distances[child.name] = distance
                 predecessors[child] = current_node
                 heapq.heappush(priority_queue, (-distance, child))
+                relaxations += 1
+
+    if METRICS.enabled:
+        METRICS.count('dijkstra.nodes_expanded', len(visited))
+        METRICS.count('dijkstra.relaxations', relaxations)
 
     # Восстановление пути
     path: list[GraphNode] = []
@@ -92,6 +99,61 @@ def dijkstra_max_product_path(node_pool: dict[str, GraphNode], start_node: Graph
     return calculate_path_value(path), path
 
 
+# тот же алгоритм на компактном графе: вершины - целые номера, веса рёбер уже логарифмированы
+# возвращает значение пути и путь в виде номеров вершин
+def dijkstra_max_product_path_compact(graph: CompactGraph, start: int, end: int) -> tuple[float, list[int]]:
+    n = len(graph)
+    offsets, targets, log_weights = graph.offsets, graph.targets, graph.log_weights
+
+    # ранг вершины по имени - чтобы при равных расстояниях куча разрешала ничьи так же, как на GraphNode
+    rank: list[int] = [0] * n
+    for i, node_id in enumerate(sorted(range(n), key=graph.names.__getitem__)):
+        rank[node_id] = i
+
+    def causes_cycle(current_node: int, new_predecessor: int) -> bool:
+        node = new_predecessor
+        while node != -1:
+            if node == current_node:
+                return True
+            node = predecessors[node]
+        return False
+
+    distances: list[float] = [float('-inf')] * n
+    distances[start] = 0
+    predecessors: list[int] = [-1] * n
+    priority_queue: list[tuple[float, int, int]] = [(0, rank[start], start)]
+    visited = bytearray(n)
+
+    while priority_queue:
+        current_distance, _, current_node = heapq.heappop(priority_queue)
+        current_distance = -current_distance
+
+        if visited[current_node]:
+            continue
+        visited[current_node] = 1
+
+        for e in range(offsets[current_node], offsets[current_node + 1]):
+            child = targets[e]
+            distance = current_distance + log_weights[e]
+            if distance > distances[child] and not causes_cycle(child, current_node):
+                distances[child] = distance
+                predecessors[child] = current_node
+                heapq.heappush(priority_queue, (-distance, rank[child], child))
+
+    # Восстановление пути
+    path: list[int] = []
+    current_vertex = end
+    while current_vertex != -1:
+        path.append(current_vertex)
+        current_vertex = predecessors[current_vertex]
+    path.reverse()
+
+    path_value: float = 1.
+    for i in range(len(path) - 1):
+        path_value = path_value * graph.weights[graph.edge_id(path[i], path[i + 1])]
+    return path_value, path
+
+
 def test_dijkstra_max_product_path():
     node_pool: dict[str, GraphNode] = dict()
     node1 = GraphNode('111')
@@ -149,6 +211,11 @@ def test_dijkstra_max_product_path():
     print("Максимальное произведение весов:", weight)
     print("Путь:", path)
 
+    graph = from_node_pool(node_pool, quotes)
+    compact_weight, compact_path = dijkstra_max_product_path_compact(graph, graph.index['111'], graph.index['888'])
+    assert compact_weight == weight
+    assert graph.path_names(compact_path) == [node.name for node in path]
+
     return node_pool, path, quotes
 
 
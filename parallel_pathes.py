@@ -0,0 +1,150 @@
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from graph_definition import GraphNode
+from compact_graph import CompactGraph, from_node_pool
+from traversal import iter_simple_pathes
+
+
+'''
+параллельный перебор путей по процессам
+
+перебор из start_node делится на поддеревья по префиксам пути длины split_depth
+(при split_depth = 1 - по детям начальной вершины), каждое поддерево - отдельная задача для пула процессов
+
+    - граф передаётся в процессы один раз (CompactGraph - массивы, а не связанные объекты)
+    - процесс перебирает пути своего поддерева, сам считает их значения
+      и возвращает только top_k лучших, а не все пути
+    - результаты объединяются по значению, а при равенстве - по порядку, в котором
+      путь нашёл бы последовательный перебор, поэтому ответ совпадает с find_all_pathes
+
+значения путей считаются тем же порядком умножений, что и в calculate_path_value
+'''
+
+_graph: CompactGraph | None = None  # граф процесса-исполнителя
+
+
+def _init_worker(graph: CompactGraph):
+    global _graph
+    _graph = graph
+    return
+
+
+# перебор одного поддерева: все пути с заданным префиксом
+# возвращает top_k записей (значение, номер задачи, номер пути в задаче, путь)
+def _search_subtree(task: tuple[int, list[int], float, int, int, int | None]) -> list[tuple[float, int, int, list[int]]]:
+    order, prefix, prefix_value, end, top_k, max_hops = task
+    graph = _graph
+    weights = graph.weights
+
+    best: list[tuple[float, int, list[int]]] = []  # min-куча (значение, -номер пути, путь)
+    visited = bytearray(len(graph))
+    for node in prefix[:-1]:
+        visited[node] = 1
+    hops_left = max_hops - (len(prefix) - 1) if max_hops is not None else None
+    if hops_left is not None and (hops_left < 0 or hops_left == 0 and prefix[-1] != end):
+        return []  # префикс уже исчерпал ограничение рёбер и не дошёл до end
+
+    found: int = 0
+    for path, edges in iter_simple_pathes(graph, prefix[-1], end, hops_left, visited):
+        value = prefix_value
+        for e in edges:
+            value = value * weights[e]
+        seq = -found
+        found += 1
+        if len(best) < top_k:
+            heapq.heappush(best, (value, seq, prefix[:-1] + path))
+        elif (value, seq) > best[0][:2]:
+            # путь копируется, только если попадает в top_k
+            heapq.heapreplace(best, (value, seq, prefix[:-1] + path))
+    return [(value, order, -seq, path) for value, seq, path in best]
+
+
+# префиксы длины split_depth в порядке последовательного перебора
+# пути, дошедшие до end раньше, тоже становятся отдельными задачами
+def _split_tasks(graph: CompactGraph, start: int, end: int, split_depth: int,
+                 max_hops: int | None) -> list[tuple[list[int], float]]:
+    tasks: list[tuple[list[int], float]] = []
+    prefix: list[int] = [start]
+
+    def expand(current_node: int, value: float):
+        if current_node == end or len(prefix) > split_depth or \
+                (max_hops is not None and len(prefix) > max_hops):
+            tasks.append((list(prefix), value))
+            return
+        for e in graph.out_edges(current_node):
+            child = graph.targets[e]
+            if child not in prefix:
+                prefix.append(child)
+                expand(child, value * graph.weights[e])
+                prefix.pop()
+        return
+
+    expand(start, 1.)
+    return tasks
+
+
+def find_best_pathes_parallel(node_pool: dict[str, GraphNode], start_node: GraphNode, end_node: GraphNode,
+                              quotes: dict[str, float], top_k: int = 1, max_hops: int | None = None,
+                              processes: int | None = None,
+                              split_depth: int = 1) -> list[tuple[float, list[GraphNode]]]:
+    graph = from_node_pool(node_pool, quotes)
+    start, end = graph.index[start_node.name], graph.index[end_node.name]
+    tasks = [(order, prefix, value, end, top_k, max_hops)
+             for order, (prefix, value) in enumerate(_split_tasks(graph, start, end, split_depth, max_hops))]
+
+    processes = processes if processes is not None else os.cpu_count()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(graph,)) as executor:
+        results = [item for task_result in executor.map(_search_subtree, tasks) for item in task_result]
+
+    # слияние: по убыванию значения, при равенстве - порядок последовательного перебора
+    results.sort(key=lambda item: (-item[0], item[1], item[2]))
+    return [(value, [node_pool[graph.names[i]] for i in path]) for value, _, _, path in results[:top_k]]
+
+
+def test_find_best_pathes_parallel():
+    from all_pathes import find_all_pathes, calculate_pathes_value, test_find_all_pathes
+    from benchmark import generate_complete_graph
+
+    node_pool, path, quotes = test_find_all_pathes()
+    best = find_best_pathes_parallel(node_pool, node_pool['111'], node_pool['888'], quotes, processes=2)
+    assert best == [(6., path)]
+
+    node_pool, quotes = generate_complete_graph(9, rate_distribution='uniform')
+    start_node, end_node = node_pool['AAA'], node_pool['AAI']
+
+    start = time.perf_counter()
+    all_pathes = find_all_pathes(start_node, end_node)
+    values = calculate_pathes_value(all_pathes, quotes)
+    order = sorted(range(len(values)), key=lambda i: (-values[i], i))[:5]
+    serial = [(values[i], all_pathes[i]) for i in order]
+    serial_time = time.perf_counter() - start
+
+    for split_depth in (1, 2):
+        start = time.perf_counter()
+        parallel = find_best_pathes_parallel(node_pool, start_node, end_node, quotes, top_k=5, split_depth=split_depth)
+        parallel_time = time.perf_counter() - start
+        print(f'{len(all_pathes)} pathes: serial {serial_time:.3f} s, '
+              f'parallel (split depth {split_depth}, {os.cpu_count()} cpu) {parallel_time:.3f} s')
+        assert parallel == serial
+
+    # ограничение числа рёбер
+    limited = find_best_pathes_parallel(node_pool, start_node, end_node, quotes, top_k=3, max_hops=3, split_depth=2)
+    short = [i for i, p in enumerate(all_pathes) if len(p) <= 4]
+    short.sort(key=lambda i: (-values[i], i))
+    assert limited == [(values[i], all_pathes[i]) for i in short[:3]]
+    # ограничение не длиннее префиксов задач: ответ тот же, что у последовательного перебора
+    for max_hops in (0, 1, 2):
+        for split_depth in (1, 2, 3):
+            limited = find_best_pathes_parallel(node_pool, start_node, end_node, quotes, top_k=3,
+                                                max_hops=max_hops, split_depth=split_depth)
+            short = [i for i, p in enumerate(all_pathes) if len(p) <= max_hops + 1]
+            short.sort(key=lambda i: (-values[i], i))
+            assert limited == [(values[i], all_pathes[i]) for i in short[:3]], (max_hops, split_depth)
+    return serial
+
+
+if __name__ == '__main__':
+    test_find_best_pathes_parallel()
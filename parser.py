@@ -1,8 +1,16 @@
 import requests
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
 
+import numpy as np
 from requests import Response
-from graph_definition import GraphNode
+from requests.adapters import HTTPAdapter
+from graph_definition import GraphNode, NodePool
+from metrics import METRICS
 
 '''
 url = "http://api.currencylayer.com/list"
@@ -33,6 +41,14 @@ print(json.dumps(data, indent=4))
 
 DEBUG = True
 
+LIST_URL = "http://api.currencylayer.com/list"
+LIVE_URL = "http://apilayer.net/api/live"
+
+# политики использования устаревшего снимка котировок
+STALE_REFRESH = 'refresh'  # загрузить заново
+STALE_FALLBACK = 'fallback'  # загрузить заново, а при сетевой ошибке использовать устаревший снимок
+STALE_USE = 'use'  # использовать устаревший снимок без запросов
+
 
 # класс парсинга курсов и построения на лету графа данных курсов
 class Parser:
@@ -43,41 +59,152 @@ class Parser:
             cls._instance = super(Parser, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, access_key: str):
+    def __init__(self, access_key: str, concurrent: bool = False, max_workers: int = 8,
+                 timeout: float = 10., retries: int = 3, backoff: float = 0.5,
+                 list_url: str = LIST_URL, live_url: str = LIVE_URL,
+                 cache_path: str | None = None, cache_ttl: float = 300., stale_policy: str = STALE_REFRESH,
+                 bulk: bool = False, bulk_base: str = 'USD', direct_sources: list[str] | None = None,
+                 verbose: bool = False):
         self.access_key = access_key
         self.currencies: dict[str, str] | None = None
         self.all_quotes: dict[str, float] = dict()
         self.all_quotes_got: bool = False
-        self.node_pool: dict[str, GraphNode] = dict()
-
-    def __create_node_pool(self):
-        print('creating all vertexes')
-        # создание узлов графа для каждой валюты
-        for currency in self.currencies:
-            self.node_pool[currency] = GraphNode(currency, [])
-        print('all vertexes created')
+        self.node_pool: NodePool = NodePool()  # узел на каждую валюту, равенство узлов - по идентичности
+        self.edge_index: dict[str, tuple[GraphNode, GraphNode]] = dict()  # ключ котировки -> ребро графа
+        # подписчики на изменения котировок: получают словарь изменившихся котировок
+        self.listeners: list[Callable[[dict[str, float]], None]] = []
+        self.version: int = 0  # номер версии котировок - растёт при каждом изменении
+        # загрузка и потоковые обновления меняют котировки по очереди, подписчики вызываются под этой же блокировкой
+        self.lock = threading.RLock()
+
+        # настройки загрузки котировок
+        self.concurrent: bool = concurrent  # загружать котировки по валютам параллельно
+        self.max_workers: int = max_workers  # ограничение числа одновременных запросов
+        self.timeout: float = timeout  # таймаут одного запроса в секундах
+        self.retries: int = retries  # число повторов после неудачной попытки
+        self.backoff: float = backoff  # базовая задержка перед повтором (удваивается с каждой попыткой)
+        self.list_url: str = list_url
+        self.live_url: str = live_url
+        self.verbose: bool = verbose  # печатать ответы API целиком (иначе только ошибки)
+
+        # снимок котировок на диске (None - не сохранять)
+        if stale_policy not in (STALE_REFRESH, STALE_FALLBACK, STALE_USE):
+            raise ValueError(f'Unknown stale policy {stale_policy}')
+        self.cache_path: str | None = cache_path
+        self.cache_ttl: float = cache_ttl  # время жизни снимка в секундах
+        self.stale_policy: str = stale_policy
+        self.snapshot_time: float | None = None  # время получения текущих котировок
+
+        # режим одного запроса: котировки только из bulk_base, кросс-курсы вычисляются локально
+        self.bulk: bool = bulk
+        self.bulk_base: str = bulk_base
+        self.direct_sources: list[str] = direct_sources if direct_sources is not None else []  # их котировки берутся напрямую
+
+        # одна сессия на все запросы - соединения переиспользуются (keep-alive)
+        self.session: requests.Session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # новый граф сбоку от текущего: узлы для прежних вершин и валют currencies, рёбра для котировок quotes
+    # текущие node_pool и edge_index не трогаются, пока новый граф не будет готов
+    def __build_graph(self, currencies: dict[str, str],
+                      quotes: dict[str, float]) -> tuple[NodePool, dict[str, tuple[GraphNode, GraphNode]]]:
+        node_pool = NodePool()
+        edge_index: dict[str, tuple[GraphNode, GraphNode]] = dict()
+        with METRICS.timer('node_pool_build'):
+            # создание узлов графа для каждой валюты
+            for currency in (*self.node_pool, *currencies):
+                node_pool.get_or_create(currency)
+        with METRICS.timer('edge_build'):
+            for key in quotes:
+                self.__upsert_edge(key, node_pool, edge_index)
+        METRICS.count('edges', len(edge_index))
+        return node_pool, edge_index
+
+    # добавляет ребро для котировки, если его ещё нет (повторный вызов ничего не меняет)
+    @staticmethod
+    def __upsert_edge(key: str, node_pool: NodePool, edge_index: dict[str, tuple[GraphNode, GraphNode]]):
+        if key in edge_index:
+            return
+        node_from_name: str = key[:3]
+        node_to_name: str = key[3:]
+
+        if node_from_name not in node_pool or node_to_name not in node_pool:
+            # связь есть - вершин таких нет (скипаем связь)
+            return
+
+        node_from: GraphNode = node_pool[node_from_name]
+        node_to: GraphNode = node_pool[node_to_name]
+        node_from.children.append(node_to)
+        edge_index[key] = (node_from, node_to)
+        return
+
+    # замена котировок и графа на загруженные (merge - дополнить текущие котировки, иначе заменить)
+    # под блокировкой только слияние котировок, сборка рёбер, подмена и уведомление - без сетевых запросов
+    def __install(self, currencies: dict[str, str], quotes: dict[str, float], snapshot_time: float,
+                  merge: bool = True):
+        with self.lock:
+            all_quotes: dict[str, float] = dict(self.all_quotes) if merge else dict()
+            all_quotes.update(quotes)
+            node_pool, edge_index = self.__build_graph(currencies, all_quotes)
+            self.currencies = currencies
+            self.all_quotes = all_quotes
+            self.node_pool = node_pool
+            self.edge_index = edge_index
+            self.snapshot_time = snapshot_time
+            self.all_quotes_got = True
+            self.__notify(all_quotes)
         return
 
-    def __create_edges(self):
-        print('creating all edges')
-        for key in self.all_quotes:
-            node_from_name: str = key[:3]
-            node_to_name: str = key[3:]
+    def __notify(self, changed: dict[str, float]):
+        self.version += 1
+        for listener in self.listeners:
+            listener(changed)
+        return
 
-            if node_from_name not in self.node_pool or node_to_name not in self.node_pool:
-                # связь есть - вершин таких нет (скипаем связь)
-                continue
+    def subscribe(self, listener: Callable[[dict[str, float]], None]):
+        self.listeners.append(listener)
+        return
 
-            node_from: GraphNode = self.node_pool[node_from_name]
-            node_to: GraphNode = self.node_pool[node_to_name]
-            node_from.children.append(node_to)
-        print('all edges created')
+    def unsubscribe(self, listener: Callable[[dict[str, float]], None]):
+        self.listeners.remove(listener)
         return
 
-    def __get_all_currencies(self):
+    # потоковое обновление котировок: пары (ключ котировки, курс)
+    # котировка и ребро обновляются на месте без перестроения графа, подписчики получают только изменившиеся курсы
+    def apply_updates(self, updates: Iterable[tuple[str, float]]) -> dict[str, float]:
+        with self.lock:
+            all_quotes = self.all_quotes
+            changed: dict[str, float] = dict()
+            for key, rate in updates:
+                if all_quotes.get(key) == rate:
+                    continue  # курс не изменился
+                all_quotes[key] = rate
+                self.__upsert_edge(key, self.node_pool, self.edge_index)
+                changed[key] = rate
+            if changed:
+                self.__notify(changed)
+        return changed
+
+    # применение потока обновлений пачками по batch_size - подписчики вызываются раз на пачку
+    def consume_updates(self, stream: Iterable[tuple[str, float]], batch_size: int = 256) -> int:
+        applied: int = 0
+        batch: list[tuple[str, float]] = []
+        for update in stream:
+            batch.append(update)
+            if len(batch) >= batch_size:
+                applied += len(self.apply_updates(batch))
+                batch.clear()
+        if batch:
+            applied += len(self.apply_updates(batch))
+        return applied
+
+    # список валют (None, если API вернул ошибку)
+    def __get_all_currencies(self) -> dict[str, str] | None:
         global DEBUG
         if DEBUG:
-            self.currencies = {
+            currencies = {
                 "AED": "United Arab Emirates Dirham",
                 "ANG": "Netherlands Antillean Guilder",
                 "AUD": "Australian Dollar",
@@ -101,46 +228,389 @@ class Parser:
                 "USD": "United States Dollar",
                 "XAU": "Gold (troy ounce)"
             }
-            self.__create_node_pool()
-            print(json.dumps(self.currencies, indent=4))
+            if self.verbose:
+                print(json.dumps(currencies, indent=4))
         else:
-            url = "http://api.currencylayer.com/list"
             params = {
                 "access_key": self.access_key
             }
-            response: Response = requests.get(url, params=params)
-            data = response.json()
+            data = self.__request_json(self.list_url, params, 'list')
 
-            if data['success']:
-                self.currencies = data['currencies']
-                self.__create_node_pool()
+            currencies = data['currencies'] if data['success'] else None
+            self.__report(data)
+        return currencies
+
+    # ответ API печатается целиком только в режиме verbose, ошибка - всегда
+    def __report(self, data: dict):
+        if self.verbose:
             print(json.dumps(data, indent=4))
+        elif not data.get('success'):
+            METRICS.count('http_failures')
+            print('API error:', json.dumps(data.get('error', data)))
         return
 
-    def __get_quotes_by_currency(self, name: str):
-        url = "http://apilayer.net/api/live"
+    # GET-запрос с таймаутом и повторами с экспоненциальной задержкой
+    # повторяем при сетевых ошибках и ответах 5xx, остальные ответы возвращаем как есть
+    # label - метка запроса для метрики времени ответа (валюта или 'list')
+    def __request_json(self, url: str, params: dict[str, str], label: str = '') -> dict:
+        with METRICS.timer(f'http_latency[{label}]'):
+            data = self.__request_json_with_retries(url, params)
+        METRICS.count('http_requests')
+        return data
+
+    def __request_json_with_retries(self, url: str, params: dict[str, str]) -> dict:
+        attempt = 0
+        while True:
+            try:
+                response: Response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code < 500:
+                    return response.json()
+                error: Exception = requests.HTTPError(f'{response.status_code} for {url}', response=response)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                error = ex
+            if attempt >= self.retries:
+                raise error
+            METRICS.count('http_retries')
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def __fetch_quotes_by_currency(self, name: str) -> dict:
         params = {
             "access_key": self.access_key,
             "source": name
         }
+        return self.__request_json(self.live_url, params, name)
 
-        response = requests.get(url, params=params)
-        data = response.json()
-
+    # котировки из ответа API добавляются в quotes (загрузка собирает их в свой словарь, а не в all_quotes)
+    def __add_quotes(self, quotes: dict[str, float], data: dict):
         if data['success']:
-            quotes: dict[str, float] = data['quotes']
-            self.all_quotes.update(quotes)
-        print(json.dumps(data, indent=4))
+            received: dict[str, float] = data['quotes']
+            quotes.update(received)
+            METRICS.count('quotes_received', len(received))
+        self.__report(data)
+        return
+
+    def __get_quotes_by_currency(self, quotes: dict[str, float], name: str):
+        data = self.__fetch_quotes_by_currency(name)
+        self.__add_quotes(quotes, data)
+        return
+
+    # параллельная загрузка котировок по всем валютам
+    # ответы объединяются в порядке валют, поэтому quotes получается таким же, как при последовательной загрузке
+    def __get_quotes_concurrently(self, quotes: dict[str, float], currencies: dict[str, str]):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for data in executor.map(self.__fetch_quotes_by_currency, currencies):
+                self.__add_quotes(quotes, data)
         return
 
+    # кросс-курсы из котировок одной базовой валюты: курс A -> B = (base -> B) / (base -> A)
+    # вся матрица считается одной векторной операцией
+    def __derive_cross_quotes(self, base_quotes: dict[str, float], currencies: dict[str, str]) -> dict[str, float]:
+        base = self.bulk_base
+        # ответ API может не содержать котировку базовой валюты в саму себя - без неё нет кросс-курсов X -> base
+        base_quotes = dict(base_quotes)
+        base_quotes.setdefault(f'{base}{base}', 1.)
+        codes: list[str] = [code for code in currencies if base_quotes.get(f'{base}{code}', 0) > 0]
+        base_rates = np.array([base_quotes[f'{base}{code}'] for code in codes], dtype=np.float64)
+        cross = base_rates[None, :] / base_rates[:, None]
+
+        quotes: dict[str, float] = dict()
+        for i, code_from in enumerate(codes):
+            row = cross[i].tolist()
+            for j, code_to in enumerate(codes):
+                quotes[f'{code_from}{code_to}'] = row[j]
+        return quotes
+
+    def __get_quotes_bulk(self, quotes: dict[str, float], currencies: dict[str, str]):
+        data = self.__fetch_quotes_by_currency(self.bulk_base)
+        if not data['success']:
+            self.__report(data)
+            return
+        derived = self.__derive_cross_quotes(data['quotes'], currencies)
+        quotes.update(derived)
+        print(f'{len(derived)} quotes derived from {self.bulk_base}')
+
+        # прямые котировки там, где они нужны, заменяют вычисленные
+        sources = [source for source in self.direct_sources if source != self.bulk_base]
+        with ThreadPoolExecutor(max_workers=self.max_workers if self.concurrent else 1) as executor:
+            for direct in executor.map(self.__fetch_quotes_by_currency, sources):
+                self.__add_quotes(quotes, direct)
+        # котировки самой базовой валюты уже получены напрямую
+        quotes.update(data['quotes'])
+        return
+
+    # снимок хранится в несжатом .npz: коды и названия валют, ключи и значения котировок, время получения
+    def __write_snapshot(self, currencies: dict[str, str], quotes: dict[str, float], snapshot_time: float):
+        tmp_path = f'{self.cache_path}.tmp.npz'
+        np.savez(tmp_path,
+                 currency_codes=np.array(list(currencies), dtype='U3'),
+                 currency_names=np.array(list(currencies.values()), dtype=str),
+                 quote_keys=np.array(list(quotes), dtype='U6'),
+                 quote_values=np.fromiter(quotes.values(), dtype=np.float64, count=len(quotes)),
+                 timestamp=np.float64(snapshot_time))
+        os.replace(tmp_path, self.cache_path)  # атомарная замена - читатель не увидит половину файла
+        return
+
+    def __read_snapshot(self) -> dict | None:
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return None
+        with np.load(self.cache_path, allow_pickle=False) as data:
+            return {
+                'currencies': dict(zip(data['currency_codes'].tolist(), data['currency_names'].tolist())),
+                'quotes': dict(zip(data['quote_keys'].tolist(), data['quote_values'].tolist())),
+                'timestamp': float(data['timestamp']),
+            }
+
+    def __apply_snapshot(self, snapshot: dict):
+        self.__install(snapshot['currencies'], snapshot['quotes'], snapshot['timestamp'], merge=False)
+        return
+
+    # загрузка валют и котировок в локальные словари - текущие котировки и граф при этом не меняются,
+    # поэтому неудачная загрузка их не портит, а apply_updates не ждёт сетевых запросов
+    def __fetch_all_quotes(self) -> tuple[dict[str, str], dict[str, float], float]:
+        currencies = self.__get_all_currencies()
+        if currencies is None:
+            currencies = dict(self.currencies or {})  # список не получен - валюты прежние
+        quotes: dict[str, float] = dict()
+        if self.bulk:
+            self.__get_quotes_bulk(quotes, currencies)
+        elif self.concurrent:
+            self.__get_quotes_concurrently(quotes, currencies)
+        else:
+            for currency in currencies:  # key in dict
+                self.__get_quotes_by_currency(quotes, currency)
+        return currencies, quotes, time.time()
+
+    # блокировка берётся только на подмену загруженных данных (см. __install), не на время запросов
     def get_all_quotes(self) -> dict:
-        self.__get_all_currencies()
-        for currency in self.currencies:  # key in dict
-            self.__get_quotes_by_currency(currency)
+        return self.__load_all_quotes()
+
+    def __load_all_quotes(self) -> dict:
+        # тёплый старт: свежий снимок с диска без HTTP-запросов
+        snapshot = self.__read_snapshot()
+        if snapshot is not None:
+            fresh = time.time() - snapshot['timestamp'] <= self.cache_ttl
+            if fresh or self.stale_policy == STALE_USE:
+                self.__apply_snapshot(snapshot)
+                return self.all_quotes
 
-        self.all_quotes_got = True
-        self.__create_edges()
+        try:
+            currencies, quotes, snapshot_time = self.__fetch_all_quotes()
+        except requests.RequestException:
+            if snapshot is None or self.stale_policy != STALE_FALLBACK:
+                raise
+            print('quotes refresh failed, using stale snapshot')
+            self.__apply_snapshot(snapshot)
+            return self.all_quotes
+
+        self.__install(currencies, quotes, snapshot_time)
+        if self.cache_path is not None:
+            with self.lock:
+                currencies, quotes, snapshot_time = dict(self.currencies), dict(self.all_quotes), self.snapshot_time
+            self.__write_snapshot(currencies, quotes, snapshot_time)
         return self.all_quotes
 
 
+def test_concurrent_quotes():
+    from mock_api import MockApiServer
+
+    global DEBUG
+    debug = DEBUG
+    DEBUG = False
+    try:
+        with MockApiServer(fail_first=2, delay=0.01) as api:
+            sequential = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live', backoff=0.01)
+            sequential.get_all_quotes()
+            sequential_quotes = dict(sequential.all_quotes)
+            sequential_edges = {name: [child.name for child in node.children]
+                                for name, node in sequential.node_pool.items()}
+
+            api.connections.clear()
+            concurrent = Parser('test', concurrent=True, max_workers=4, backoff=0.01,
+                                list_url=f'{api.url}/list', live_url=f'{api.url}/live')
+            METRICS.reset()
+            METRICS.enable()
+            try:
+                concurrent.get_all_quotes()
+            finally:
+                METRICS.disable()
+            summary = METRICS.summary()
+            METRICS.reset()
+            concurrent_edges = {name: [child.name for child in node.children]
+                                for name, node in concurrent.node_pool.items()}
+
+            assert list(concurrent.all_quotes.items()) == list(sequential_quotes.items())
+            assert concurrent_edges == sequential_edges
+            # 1 запрос списка + 8 запросов котировок не больше чем по 4 соединениям
+            assert len(api.connections) <= concurrent.max_workers
+            print('quotes:', len(concurrent.all_quotes), 'connections:', len(api.connections))
+
+            # время ответа по каждой валюте и построение рёбер попали в метрики
+            assert summary['counters']['http_requests'] == 1 + len(concurrent.currencies)
+            assert all(summary['timers'][f'http_latency[{code}]']['count'] == 1 for code in concurrent.currencies)
+            assert summary['timers']['edge_build']['count'] == 1
+            assert summary['counters']['quotes_received'] == len(concurrent.all_quotes)
+    finally:
+        DEBUG = debug
+    return
+
+
+def test_snapshot_cache():
+    import tempfile
+    from mock_api import MockApiServer
+
+    global DEBUG
+    debug = DEBUG
+    DEBUG = False
+    try:
+        with tempfile.TemporaryDirectory() as directory, MockApiServer() as api:
+            cache_path = os.path.join(directory, 'quotes.npz')
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live',
+                            cache_path=cache_path, cache_ttl=60.)
+            parser.get_all_quotes()
+            fetched_quotes = dict(parser.all_quotes)
+            fetched_currencies = dict(parser.currencies)
+            requests_count = api.requests_count
+
+            # тёплый старт: данные и граф восстанавливаются из снимка без запросов
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live',
+                            cache_path=cache_path, cache_ttl=60.)
+            start = time.perf_counter()
+            parser.get_all_quotes()
+            print(f'warm start in {time.perf_counter() - start:.4f} s')
+            assert api.requests_count == requests_count
+            assert parser.all_quotes == fetched_quotes and parser.currencies == fetched_currencies
+            assert [child.name for child in parser.node_pool['USD'].children] == list(fetched_currencies)
+
+            # устаревший снимок и недоступный API: fallback использует снимок, refresh - падает
+            api.stop()
+            for policy, ok in ((STALE_FALLBACK, True), (STALE_REFRESH, False)):
+                parser = Parser('test', list_url='http://127.0.0.1:9/list', live_url='http://127.0.0.1:9/live',
+                                cache_path=cache_path, cache_ttl=0., stale_policy=policy, retries=0)
+                try:
+                    parser.get_all_quotes()
+                    assert ok and parser.all_quotes == fetched_quotes
+                except requests.ConnectionError:
+                    assert not ok
+    finally:
+        DEBUG = debug
+    return
+
+
+def test_bulk_quotes():
+    from mock_api import MockApiServer
+
+    global DEBUG
+    debug = DEBUG
+    DEBUG = False
+    try:
+        with MockApiServer() as api:
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live')
+            parser.get_all_quotes()
+            direct_quotes = dict(parser.all_quotes)
+
+            requests_count = api.requests_count
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live', bulk=True)
+            parser.get_all_quotes()
+            assert api.requests_count - requests_count == 2  # список валют + котировки USD
+            assert parser.all_quotes.keys() == direct_quotes.keys()
+            for key, rate in direct_quotes.items():
+                assert abs(parser.all_quotes[key] / rate - 1) < 1e-12
+            assert [child.name for child in parser.node_pool['EUR'].children] == list(parser.currencies)
+
+            # прямые котировки EUR заменяют вычисленные
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live',
+                            bulk=True, direct_sources=['EUR'])
+            parser.get_all_quotes()
+            assert all(parser.all_quotes[key] == rate for key, rate in direct_quotes.items() if key.startswith('EUR'))
+            print('bulk quotes:', len(parser.all_quotes))
+
+        # в ответе нет USDUSD: курсы X -> USD всё равно вычисляются
+        with MockApiServer(self_quotes=False) as api:
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live', bulk=True)
+            parser.get_all_quotes()
+            assert parser.all_quotes.keys() == direct_quotes.keys()
+            assert abs(parser.all_quotes['EURUSD'] / direct_quotes['EURUSD'] - 1) < 1e-12
+    finally:
+        DEBUG = debug
+    return
+
+
+def test_apply_updates():
+    from mock_api import MockApiServer
+    from all_pathes import iter_pathes
+    from path_portfolio import PathPortfolio
+
+    global DEBUG
+    debug = DEBUG
+    DEBUG = False
+    try:
+        with MockApiServer() as api:
+            parser = Parser('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live', bulk=True)
+            parser.get_all_quotes()
+            edges = {name: [child.name for child in node.children] for name, node in parser.node_pool.items()}
+            parser.get_all_quotes()  # повторная загрузка не дублирует рёбра
+            assert edges == {name: [child.name for child in node.children] for name, node in parser.node_pool.items()}
+
+            pool = parser.node_pool
+            portfolio = PathPortfolio(list(iter_pathes(pool['EUR'], pool['JPY'], max_hops=2)), parser.all_quotes)
+            notifications: list[dict[str, float]] = []
+            parser.subscribe(notifications.append)
+            parser.subscribe(portfolio.update)
+
+            usd_children = len(pool['USD'].children)
+            changed = parser.apply_updates([('EURJPY', parser.all_quotes['EURJPY'] * 1.01),
+                                            ('USDEUR', parser.all_quotes['USDEUR']),  # без изменений
+                                            ('EURJPY', parser.all_quotes['EURJPY'] * 1.02)])
+            assert list(changed) == ['EURJPY'] and notifications == [changed]
+            assert len(pool['USD'].children) == usd_children
+            value, path = portfolio.best()
+            assert [node.name for node in path] == ['EUR', 'JPY']
+
+            # новая пара создаёт ребро один раз
+            parser.node_pool.create('XAU')
+            assert parser.consume_updates(iter([('XAUUSD', 2000.), ('XAUUSD', 2000.), ('XAUEUR', 1850.)]), 2) == 2
+            assert [child.name for child in pool['XAU'].children] == ['USD', 'EUR']
+            print('updates applied:', notifications[1:])
+
+            # обновления не ждут фоновой загрузки: блокировка не держится на время запросов
+            parser.bulk = False
+            api.delay = 0.05
+            refresh = threading.Thread(target=parser.get_all_quotes)
+            refresh.start()
+            time.sleep(0.1)
+            start = time.perf_counter()
+            parser.apply_updates([('EURJPY', 170.)])
+            stall = time.perf_counter() - start
+            assert refresh.is_alive()
+            refresh.join()
+            api.delay = 0.
+            print(f'update during refresh in {stall:.4f} s')
+            assert stall < 0.05
+            assert parser.all_quotes['XAUUSD'] == 2000.  # потоковые котировки пережили загрузку
+            assert [child.name for child in parser.node_pool['XAU'].children] == ['USD', 'EUR']
+
+            # неудачная загрузка не трогает котировки и граф
+            quotes = dict(parser.all_quotes)
+            edges = {name: [child.name for child in node.children] for name, node in parser.node_pool.items()}
+            edge_count = len(parser.edge_index)
+            parser.live_url, parser.retries = 'http://127.0.0.1:9/live', 0
+            try:
+                parser.get_all_quotes()
+                assert False, 'refresh with unavailable API'
+            except requests.ConnectionError:
+                pass
+            assert parser.all_quotes == quotes and len(parser.edge_index) == edge_count
+            assert edges == {name: [child.name for child in node.children] for name, node in parser.node_pool.items()}
+            parser.apply_updates([('EURUSD', quotes['EURUSD'] * 1.01)])
+            assert len(parser.edge_index) == edge_count
+    finally:
+        DEBUG = debug
+    return
+
 
+if __name__ == '__main__':
+    test_concurrent_quotes()
+    test_snapshot_cache()
+    test_bulk_quotes()
+    test_apply_updates()
@@ -0,0 +1,117 @@
+import heapq
+import math
+
+from graph_definition import GraphNode
+from all_pathes import find_all_pathes, calculate_pathes_value
+
+
+'''
+портфель заранее найденных путей с инкрементальным пересчётом
+
+идея из all_pathes.py: пути перебираются один раз, а при изменении курсов
+пересчитываются только значения путей, а не граф
+
+    - для каждого ребра (ключа котировки) хранится список путей, которые через него проходят
+    - значения путей хранятся в логарифмах (сумма логарифмов курсов рёбер)
+    - при изменении части котировок пересчитываются только пути, проходящие через изменённые рёбра
+    - лучший путь поддерживается кучей с ленивым удалением устаревших записей
+
+стоимость одного обновления пропорциональна числу путей, затронутых изменёнными рёбрами
+'''
+
+
+class PathPortfolio:
+    def __init__(self, pathes: list[list[GraphNode]], quotes: dict[str, float]):
+        self.pathes: list[list[GraphNode]] = pathes
+        self.log_quotes: dict[str, float] = dict()
+        self.path_edges: list[list[str]] = []  # ключи котировок рёбер каждого пути
+        self.edge_pathes: dict[str, list[int]] = dict()  # ключ котировки -> номера путей через это ребро
+        self.log_values: list[float] = []
+        self.versions: list[int] = []  # версия значения пути - для отбрасывания устаревших записей кучи
+        self.heap: list[tuple[float, int, int]] = []  # (-значение, номер пути, версия)
+
+        for idx, path in enumerate(pathes):
+            edges = [f'{path[i]}{path[i + 1]}' for i in range(len(path) - 1)]
+            self.path_edges.append(edges)
+            for key in edges:
+                if key not in self.log_quotes:
+                    self.log_quotes[key] = math.log(quotes[key])
+                self.edge_pathes.setdefault(key, []).append(idx)
+            log_value = sum(self.log_quotes[key] for key in edges)
+            self.log_values.append(log_value)
+            self.versions.append(0)
+            self.heap.append((-log_value, idx, 0))
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.pathes)
+
+    # применяет изменившиеся котировки, возвращает число пересчитанных путей
+    def update(self, changed_quotes: dict[str, float]) -> int:
+        affected: set[int] = set()
+        for key, rate in changed_quotes.items():
+            if key not in self.edge_pathes:
+                continue  # ребро не входит ни в один путь портфеля
+            self.log_quotes[key] = math.log(rate)
+            affected.update(self.edge_pathes[key])
+
+        log_quotes = self.log_quotes
+        for idx in affected:
+            log_value = sum(log_quotes[key] for key in self.path_edges[idx])
+            version = self.versions[idx] + 1
+            self.log_values[idx] = log_value
+            self.versions[idx] = version
+            heapq.heappush(self.heap, (-log_value, idx, version))
+        return len(affected)
+
+    # лучший путь: (значение, путь); при равных значениях - путь с меньшим номером, как values.index(max)
+    # (0, []) для пустого портфеля - как ответ Snapshot, когда пути нет
+    def best(self) -> tuple[float, list[GraphNode]]:
+        if not self.pathes:
+            return 0., []
+        heap = self.heap
+        while heap[0][2] != self.versions[heap[0][1]]:
+            heapq.heappop(heap)  # запись устарела - значение пути с тех пор менялось
+        # куча может разрастаться от обновлений - перестраиваем, когда устаревших записей слишком много
+        if len(heap) > 4 * len(self.pathes):
+            self.heap = [(-log_value, idx, self.versions[idx]) for idx, log_value in enumerate(self.log_values)]
+            heapq.heapify(self.heap)
+            heap = self.heap
+        idx = heap[0][1]
+        return math.exp(self.log_values[idx]), self.pathes[idx]
+
+    def values(self) -> list[float]:
+        return [math.exp(log_value) for log_value in self.log_values]
+
+
+def test_path_portfolio():
+    from all_pathes import test_find_all_pathes
+
+    node_pool, _, quotes = test_find_all_pathes()
+    pathes = find_all_pathes(node_pool['111'], node_pool['888'])
+    portfolio = PathPortfolio(pathes, quotes)
+
+    value, path = portfolio.best()
+    print('best:', value, path)
+    assert math.isclose(value, 6.) and [node.name for node in path] == ['111', '555', '666', '888']
+
+    # удешевляем ребро лучшего пути - пересчитываются только пути через 555 -> 666
+    quotes['555666'] = 0.5
+    recalculated = portfolio.update({'555666': 0.5})
+    assert recalculated == len(portfolio.edge_pathes['555666'])
+
+    expected = calculate_pathes_value(pathes, quotes)
+    assert all(math.isclose(a, b) for a, b in zip(portfolio.values(), expected))
+    value, path = portfolio.best()
+    print('best after update:', value, path)
+    assert math.isclose(value, max(expected)) and path == pathes[expected.index(max(expected))]
+
+    # котировка, не входящая ни в один путь, ничего не пересчитывает
+    assert portfolio.update({'888111': 2.}) == 0
+
+    assert PathPortfolio([], quotes).best() == (0., [])
+    return portfolio
+
+
+if __name__ == '__main__':
+    test_path_portfolio()
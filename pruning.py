@@ -0,0 +1,245 @@
+import numpy as np
+
+from graph_definition import GraphNode, NodePool
+from rate_matrix import log_rate_matrix, rate_matrix_from_node_pool
+from cycles import find_arbitrage_cycles_matrix
+from metrics import METRICS
+
+
+'''
+предобработка графа (после Parser.__create_edges) перед поиском - сокращение пространства перебора
+
+    1. компоненты сильной связности (алгоритм Тарьяна без рекурсии):
+        выгодный цикл целиком лежит внутри одной компоненты, поэтому для поиска циклов
+        остаются только вершины нетривиальных компонент и рёбра внутри компонент (cycle_subgraph)
+
+    2. для запроса start -> end вершина нужна, только если она достижима из start
+        и из неё достижима end (прямой обход от start и обратный от end), остальные вершины - мёртвые
+        рёбра в start и из end простым путям start -> end тоже не нужны (reduce_graph)
+        набор простых путей start -> end и порядок их перебора при этом не меняются
+
+    3. по желанию (drop_dominated) - рёбра u -> v, которые проигрывают обходу u -> w -> v
+        (курс обхода больше хотя бы в (1 + margin) раз):
+        если выгодных циклов нет, лучший путь через такое ребро можно улучшить обходом,
+        поэтому значение лучшего пути без ограничения числа рёбер сохраняется,
+        но список путей (и k лучших) уже другой, а с ограничением рёбер обход может не поместиться
+        на графе с выгодными циклами это не так - там рёбра не отбрасываются
+
+сокращённый граф - новый NodePool с теми же именами и котировки только его рёбер,
+исходный граф снимка не меняется
+'''
+
+
+# компоненты сильной связности, каждая - список имён вершин
+# компоненты выдаются в обратном топологическом порядке (сначала те, из которых нет выхода)
+def strongly_connected_components(node_pool: dict[str, GraphNode]) -> list[list[str]]:
+    index: dict[str, int] = dict()
+    low: dict[str, int] = dict()
+    on_stack: set[str] = set()
+    stack: list[str] = []
+    components: list[list[str]] = []
+
+    for root in node_pool:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        call_stack = [(root, iter(node_pool[root].children))]
+        while call_stack:
+            name, children = call_stack[-1]
+            for child in children:
+                child_name = child.name
+                if child_name not in node_pool:
+                    continue  # ребро в вершину вне графа
+                if child_name not in index:
+                    index[child_name] = low[child_name] = len(index)
+                    stack.append(child_name)
+                    on_stack.add(child_name)
+                    call_stack.append((child_name, iter(node_pool[child_name].children)))
+                    break
+                if child_name in on_stack:
+                    low[name] = min(low[name], index[child_name])
+            else:
+                call_stack.pop()
+                if call_stack:
+                    parent = call_stack[-1][0]
+                    low[parent] = min(low[parent], low[name])
+                if low[name] == index[name]:
+                    component: list[str] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == name:
+                            break
+                    components.append(component)
+    return components
+
+
+# имена вершин, достижимых из start_node (включая её)
+def reachable_from(start_node: GraphNode) -> set[str]:
+    reached: set[str] = {start_node.name}
+    queue: list[GraphNode] = [start_node]
+    while queue:
+        node = queue.pop()
+        for child in node.children:
+            if child.name not in reached:
+                reached.add(child.name)
+                queue.append(child)
+    return reached
+
+
+# имена вершин, из которых достижима end_node (включая её) - обход по обратным рёбрам
+def reaching(node_pool: dict[str, GraphNode], end_node: GraphNode) -> set[str]:
+    parents: dict[str, list[str]] = {name: [] for name in node_pool}
+    for name, node in node_pool.items():
+        for child in node.children:
+            if child.name in parents:
+                parents[child.name].append(name)
+    reached: set[str] = {end_node.name}
+    queue: list[str] = [end_node.name]
+    while queue:
+        for parent in parents.get(queue.pop(), ()):
+            if parent not in reached:
+                reached.add(parent)
+                queue.append(parent)
+    return reached
+
+
+# рёбра (u, v), которые проигрывают обходу через одну промежуточную вершину
+def dominated_edges(node_pool: dict[str, GraphNode], quotes: dict[str, float],
+                    margin: float = 1e-9) -> set[tuple[str, str]]:
+    names: list[str] = list(node_pool)
+    log_rates = log_rate_matrix(rate_matrix_from_node_pool(node_pool, quotes))
+    two_hops = np.full(log_rates.shape, -np.inf)
+    for w in range(len(names)):
+        np.maximum(two_hops, log_rates[:, w, None] + log_rates[None, w, :], out=two_hops)
+    np.fill_diagonal(two_hops, -np.inf)
+    rows, columns = np.nonzero(np.isfinite(log_rates) & (two_hops > log_rates + np.log1p(margin)))
+    return {(names[u], names[v]) for u, v in zip(rows.tolist(), columns.tolist())}
+
+
+# копия графа только из вершин keep и рёбер, прошедших фильтр, с котировками этих рёбер
+def _subgraph(node_pool: dict[str, GraphNode], quotes: dict[str, float], keep: set[str],
+              skip_edge=lambda name, child_name: False) -> tuple[NodePool, dict[str, float]]:
+    reduced = NodePool()
+    for name in node_pool:
+        if name in keep:
+            reduced.create(name)
+    reduced_quotes: dict[str, float] = dict()
+    edges: int = 0
+    for name, node in node_pool.items():
+        for child in node.children:
+            edges += 1
+            if name not in reduced or child.name not in reduced or skip_edge(name, child.name):
+                continue
+            reduced[name].children.append(reduced[child.name])
+            key = f'{name}{child.name}'
+            reduced_quotes[key] = quotes[key]
+    if METRICS.enabled:
+        METRICS.count('pruning.nodes_dropped', len(node_pool) - len(reduced))
+        METRICS.count('pruning.edges_dropped', edges - len(reduced_quotes))
+    return reduced, reduced_quotes
+
+
+# сокращённый граф для поиска путей start -> end: (новый NodePool, котировки его рёбер)
+# в сокращённом графе всегда есть start и end, даже если пути между ними нет
+def reduce_graph(node_pool: dict[str, GraphNode], quotes: dict[str, float], start_node: GraphNode,
+                 end_node: GraphNode, drop_dominated: bool = False,
+                 margin: float = 1e-9) -> tuple[NodePool, dict[str, float]]:
+    start_name, end_name = start_node.name, end_node.name
+    keep = reachable_from(start_node) & reaching(node_pool, end_node)
+    keep |= {start_name, end_name}
+    dominated: set[tuple[str, str]] = set()
+    if drop_dominated:
+        if find_arbitrage_cycles_matrix(rate_matrix_from_node_pool(node_pool, quotes), max_cycles=1):
+            METRICS.count('pruning.dominated_skipped')  # есть выгодный цикл - отбрасывать рёбра нельзя
+        else:
+            dominated = dominated_edges(node_pool, quotes, margin)
+
+    def skip_edge(name: str, child_name: str) -> bool:
+        if child_name == start_name or name == end_name:
+            return start_name != end_name  # простой путь не возвращается в start и не продолжается после end
+        return (name, child_name) in dominated
+
+    return _subgraph(node_pool, quotes, keep, skip_edge)
+
+
+# подграф для поиска циклов: вершины нетривиальных компонент и рёбра внутри компонент
+def cycle_subgraph(node_pool: dict[str, GraphNode], quotes: dict[str, float]) -> tuple[NodePool, dict[str, float]]:
+    component_of: dict[str, int] = dict()
+    for i, component in enumerate(strongly_connected_components(node_pool)):
+        if len(component) > 1:
+            for name in component:
+                component_of[name] = i
+    return _subgraph(node_pool, quotes, set(component_of),
+                     lambda name, child_name: component_of[name] != component_of[child_name])
+
+
+def test_pruning():
+    from all_pathes import find_all_pathes, find_best_pathes, test_find_all_pathes
+    from cycles import find_arbitrage_cycles
+
+    node_pool, path, quotes = test_find_all_pathes()
+    # мёртвые вершины: 999 - тупик после 111, 000 ведёт в 111, но недостижима из 111
+    node_pool['999'] = GraphNode('999')
+    node_pool['000'] = GraphNode('000', [node_pool['111']])
+    node_pool['111'].children.append(node_pool['999'])
+    quotes = dict(quotes, **{'111999': 100., '000111': 1.})
+    start_node, end_node = node_pool['111'], node_pool['888']
+
+    # в DAG все компоненты тривиальные - искать циклы негде
+    assert len(strongly_connected_components(node_pool)) == len(node_pool)
+    assert cycle_subgraph(node_pool, quotes) == ({}, {})
+
+    reduced, reduced_quotes = reduce_graph(node_pool, quotes, start_node, end_node)
+    assert set(reduced) == set(node_pool) - {'999', '000'}
+    assert '111999' not in reduced_quotes and '000111' not in reduced_quotes
+    # те же пути в том же порядке
+    pathes = find_all_pathes(reduced['111'], reduced['888'])
+    assert [[node.name for node in p] for p in pathes] == \
+        [[node.name for node in p] for p in find_all_pathes(start_node, end_node)]
+    value, best = find_best_pathes(reduced['111'], reduced['888'], reduced_quotes)[0]
+    assert value == 6. and best == path
+
+    # 111 -> 888 (3.5) проигрывает обходу 111 -> 666 -> 888 (4.5)
+    reduced, reduced_quotes = reduce_graph(node_pool, quotes, start_node, end_node, drop_dominated=True)
+    assert '111888' not in reduced_quotes
+    assert len(find_all_pathes(reduced['111'], reduced['888'])) < len(pathes)
+    assert find_best_pathes(reduced['111'], reduced['888'], reduced_quotes)[0] == (6., path)
+
+    # выгодный цикл 444 -> 888 -> 444: обходы больше не гарантируют лучший путь, рёбра остаются
+    node_pool['888'].children.append(node_pool['444'])
+    arbitrage_quotes = dict(quotes, **{'888444': 1.})
+    reduced, reduced_quotes = reduce_graph(node_pool, arbitrage_quotes, start_node, end_node, drop_dominated=True)
+    assert '111888' in reduced_quotes
+    node_pool['888'].children.pop()
+
+    # обратная пара в конец: путь 888 -> 111 не существует, остаются только сами вершины
+    reduced, reduced_quotes = reduce_graph(node_pool, quotes, end_node, start_node)
+    assert set(reduced) == {'111', '888'} and not reduced_quotes
+
+    # циклы: две связные группы валют и одна валюта, в которую можно только войти
+    prices = {'111': 1., '222': 2., '333': 4., '444': 0.5}
+    cycle_quotes = {f'{a}{b}': prices[a] / prices[b] for a in ('111', '222') for b in ('111', '222') if a != b}
+    cycle_quotes.update({f'{a}{b}': prices[a] / prices[b] for a in ('333', '444') for b in ('333', '444') if a != b})
+    cycle_quotes.update({'222333': 2., '111555': 1.})
+    cycle_quotes['111222'] *= 1.01
+    cycle_quotes['333444'] *= 1.02
+    cycle_pool = NodePool()
+    for name in ('111', '222', '333', '444', '555'):
+        cycle_pool.create(name)
+    for key in cycle_quotes:
+        cycle_pool[key[:3]].children.append(cycle_pool[key[3:]])
+    components = strongly_connected_components(cycle_pool)
+    print('components:', components)
+    assert sorted(sorted(component) for component in components) == [['111', '222'], ['333', '444'], ['555']]
+    sub_pool, sub_quotes = cycle_subgraph(cycle_pool, cycle_quotes)
+    assert list(sub_pool) == ['111', '222', '333', '444'] and '222333' not in sub_quotes
+    assert find_arbitrage_cycles(list(sub_pool), sub_quotes) == find_arbitrage_cycles(list(cycle_pool), cycle_quotes)
+    return reduced
+
+
+if __name__ == '__main__':
+    test_pruning()
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+'''
+кэш результатов запросов с вытеснением давно не использованных (LRU)
+
+ключ - (начальная валюта, конечная валюта, алгоритм, версия данных, ограничение рёбер),
+поэтому результат по старым котировкам не может быть выдан для новых:
+    - версия данных меняется, когда Parser получает новые котировки (Main подписан на Parser)
+    - invalidate() при этом сразу освобождает записи старых версий, не дожидаясь вытеснения
+
+размер ограничен max_size записями, при переполнении удаляется запись, к которой дольше всего не обращались
+статистика попаданий и промахов - stats()
+'''
+
+
+class QueryCache:
+    def __init__(self, max_size: int = 1024):
+        self.max_size: int = max_size
+        self.entries: OrderedDict[Hashable, object] = OrderedDict()
+        self.lock = threading.Lock()  # кэш общий для потоков сервера
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(start_node_name: str, end_node_name: str, algorithm: str, version: int,
+            max_hops: int | None = None) -> tuple:
+        return start_node_name, end_node_name, algorithm, version, max_hops
+
+    # результат из кэша или compute(), сохранённый в кэше
+    # исключения compute() не кэшируются
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        # поиск выполняется без блокировки - другие запросы в это время обслуживаются
+        result = compute()
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    # сброс всех записей - данные изменились
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+        return
+
+    def stats(self) -> dict:
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def test_query_cache():
+    cache = QueryCache(max_size=2)
+    calls: list[str] = []
+
+    def compute(value):
+        def run():
+            calls.append(value)
+            return value
+        return run
+
+    usd_eur = cache.key('USD', 'EUR', 'one', 1)
+    assert cache.get_or_compute(usd_eur, compute('a')) == 'a'
+    assert cache.get_or_compute(usd_eur, compute('b')) == 'a'  # повторный запрос - из кэша
+    # та же пара на новой версии данных считается заново
+    assert cache.get_or_compute(cache.key('USD', 'EUR', 'one', 2), compute('c')) == 'c'
+    # переполнение: вытесняется давно не использованная запись
+    cache.get_or_compute(usd_eur, compute('d'))
+    cache.get_or_compute(cache.key('USD', 'GBP', 'one', 1), compute('e'))
+    assert cache.get_or_compute(cache.key('USD', 'EUR', 'one', 2), compute('f')) == 'f'
+    assert calls == ['a', 'c', 'e', 'f']
+
+    stats = cache.stats()
+    print(stats)
+    assert stats['hits'] == 2 and stats['misses'] == 4 and stats['evictions'] == 2 and stats['size'] == 2
+
+    cache.invalidate()
+    assert len(cache) == 0 and cache.stats()['invalidations'] == 1
+    return stats
+
+
+if __name__ == '__main__':
+    test_query_cache()
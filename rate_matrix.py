@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+
+
+'''
+плотная матрица курсов валют n x n
+
+rates[i, j] - курс перевода валюты names[i] в валюту names[j],
+0 - если котировки нет (ребра нет), диагональ всегда 0 (переход в себя не ребро)
+'''
+
+# относительная точность котировок: курсы приходят округлёнными (около 6 значащих цифр),
+# поэтому на согласованных курсах есть циклы с выигрышем в несколько 1e-6 - это не арбитраж
+# значения путей, отличающиеся меньше чем в (1 + QUOTE_RTOL) раз, поиск считает равными
+QUOTE_RTOL = 1e-5
+
+
+# допуск в логарифмах для относительной точности rtol
+def log_tolerance(rtol: float) -> float:
+    return math.log1p(rtol)
+
+
+def build_rate_matrix(names: list[str], quotes: dict[str, float]) -> np.ndarray:
+    index: dict[str, int] = {name: i for i, name in enumerate(names)}
+    rates = np.zeros((len(names), len(names)), dtype=np.float64)
+    for key, rate in quotes.items():
+        i = index.get(key[:3])
+        j = index.get(key[3:])
+        if i is None or j is None or i == j or rate <= 0:
+            # связь есть - вершин таких нет (скипаем связь)
+            continue
+        rates[i, j] = rate
+    return rates
+
+
+# логарифм курсов: -inf там, где ребра нет
+def log_rate_matrix(rates: np.ndarray) -> np.ndarray:
+    log_rates = np.full(rates.shape, -np.inf)
+    np.log(rates, out=log_rates, where=rates > 0)
+    return log_rates
+
+
+# матрица курсов по рёбрам графа (GraphNode.children), порядок вершин - порядок node_pool
+def rate_matrix_from_node_pool(node_pool: dict, quotes: dict[str, float]) -> np.ndarray:
+    index: dict[str, int] = {name: i for i, name in enumerate(node_pool)}
+    rates = np.zeros((len(index), len(index)), dtype=np.float64)
+    for name, node in node_pool.items():
+        i = index[name]
+        for child in node.children:
+            if child.name == name:
+                continue  # котировка валюты в саму себя (USDUSD) - не ребро
+            rates[i, index[child.name]] = quotes[f'{name}{child.name}']
+    return rates
@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Callable
+
+
+'''
+фоновое обновление данных по расписанию
+
+поток раз в interval секунд вызывает refresh() - например, Main.get_real_data:
+    - котировки загружаются и граф следующего снимка строится в этом потоке, в стороне от текущего снимка
+    - готовый снимок публикуется одной заменой ссылки (Main.publish), запросы всё это время
+      работают со старым снимком и не ждут загрузки
+    - ошибка загрузки не останавливает поток: текущий снимок остаётся, ошибка считается и печатается
+
+stop() дожидается конца текущего обновления и останавливает поток
+'''
+
+
+class BackgroundRefresher:
+    def __init__(self, refresh: Callable[[], object], interval: float = 60., name: str = 'quotes-refresher'):
+        self.refresh: Callable[[], object] = refresh
+        self.interval: float = interval
+        self.name: str = name
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+        self.refreshes: int = 0
+        self.failures: int = 0
+        self.last_error: str | None = None
+        self.last_duration: float = 0.  # длительность последнего обновления в секундах
+
+    def __enter__(self) -> 'BackgroundRefresher':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # immediately - первое обновление сразу при запуске, а не через interval
+    def start(self, immediately: bool = False) -> 'BackgroundRefresher':
+        if self.thread is not None:
+            return self
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(immediately,), name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return
+
+    def refresh_once(self):
+        start = time.perf_counter()
+        try:
+            self.refresh()
+            self.refreshes += 1
+            self.last_error = None
+        except Exception as ex:
+            self.failures += 1
+            self.last_error = str(ex)
+            print(f'background refresh failed: {ex}')
+        self.last_duration = time.perf_counter() - start
+        return
+
+    def _run(self, immediately: bool):
+        if immediately:
+            self.refresh_once()
+        while not self.stop_event.wait(self.interval):
+            self.refresh_once()
+        return
+
+    def stats(self) -> dict:
+        return {
+            'running': self.thread is not None,
+            'interval': self.interval,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_duration': self.last_duration,
+        }
+
+
+def test_background_refresher():
+    import parser as parser_module
+    from main import Main
+    from mock_api import MockApiServer
+
+    debug = parser_module.DEBUG
+    parser_module.DEBUG = False
+    try:
+        with MockApiServer() as api:
+            main = Main('test', list_url=f'{api.url}/list', live_url=f'{api.url}/live', backoff=0.01)
+            main.render = False
+            main.get_real_data()
+            first = main.snapshot()
+            first_rate = main.query('EUR', 'USD', 'one')[0]
+            assert abs(first_rate - 1.08) < 1e-12
+
+            # курс EUR меняется на стороне API, фоновое обновление публикует новый снимок
+            api.prices['EUR'] = 1.2
+            answers: list[tuple[int, float]] = []
+            with BackgroundRefresher(main.get_real_data, interval=0.02) as refresher:
+                deadline = time.time() + 5
+                while main.snapshot() is first and time.time() < deadline:
+                    snapshot = main.snapshot()
+                    answers.append((snapshot.version, snapshot.query('EUR', 'USD', 'one')[0]))
+                while refresher.refreshes < 2 and time.time() < deadline:
+                    time.sleep(0.01)
+            print(refresher.stats(), len(answers), 'queries during refresh')
+
+            # запросы во время обновления видели только старый снимок целиком
+            assert all(version == first.version and abs(rate - 1.08) < 1e-12 for version, rate in answers)
+            assert main.data_version > first.version and abs(main.query('EUR', 'USD', 'one')[0] - 1.2) < 1e-12
+            # старый снимок не изменился (граф тот же - изменились только курсы, он общий для обоих снимков)
+            assert first.quotes['EURUSD'] == first_rate and first.quotes is not main.snapshot().quotes
+            assert refresher.failures == 0 and not refresher.stats()['running']
+
+            # ошибка загрузки не останавливает обновления и не трогает текущий снимок
+            current = main.snapshot()
+            api.fail_first = 100
+            failing = BackgroundRefresher(main.get_real_data, interval=0.01)
+            failing.refresh_once()
+            assert failing.failures == 1 and main.snapshot() is current
+    finally:
+        parser_module.DEBUG = debug
+    return answers
+
+
+if __name__ == '__main__':
+    test_background_refresher()
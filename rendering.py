@@ -0,0 +1,123 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from graphviz import Digraph
+
+from graph_definition import GraphNode
+
+
+'''
+отрисовка графа с выделенным путём
+
+    - описание графа без выделения (строки узлов и рёбер graphviz) строится один раз на снимок котировок
+      и запоминается вместе с позицией строки каждого узла и ребра
+    - для пути заменяются только строки его узлов и рёбер, рёбра пути - множество пар,
+      поэтому проверка ребра O(1), а не поиск по списку пути
+    - render() по умолчанию рисует в фоновом потоке и сразу возвращает Future,
+      так что отрисовка не задерживает ответ на запрос
+'''
+
+
+class GraphRenderer:
+    def __init__(self, filename: str = 'graph_output', view: bool = True, background: bool = True):
+        self.filename: str = filename
+        self.view: bool = view
+        self.background: bool = background
+        self.executor: ThreadPoolExecutor | None = ThreadPoolExecutor(max_workers=1) if background else None
+
+        self.snapshot_key = None  # снимок, для которого построено базовое описание
+        self.base_body: list[str] = []
+        self.node_lines: dict[str, int] = dict()  # имя узла -> номер строки в base_body
+        self.edge_lines: dict[tuple[str, str], int] = dict()  # (откуда, куда) -> номер строки в base_body
+
+    # базовое описание графа - перестраивается, только если сменился снимок
+    def prepare(self, node_pool: dict[str, GraphNode], snapshot_key=None):
+        snapshot_key = snapshot_key if snapshot_key is not None else id(node_pool)
+        if snapshot_key == self.snapshot_key:
+            return
+        dot = Digraph(comment='Graph Visualization')
+        node_lines: dict[str, int] = dict()
+        edge_lines: dict[tuple[str, str], int] = dict()
+        for node_name, node in node_pool.items():
+            node_lines[node_name] = len(dot.body)
+            dot.node(node_name, node_name)
+            for child in node.children:
+                edge_lines[(node_name, child.name)] = len(dot.body)
+                dot.edge(node_name, child.name)
+        self.base_body = dot.body
+        self.node_lines = node_lines
+        self.edge_lines = edge_lines
+        self.snapshot_key = snapshot_key
+        return
+
+    # описание графа с выделенным путём
+    def build(self, path: list[GraphNode], quotes: dict[str, float]) -> Digraph:
+        highlight = Digraph()
+        body: list[str] = list(self.base_body)
+        for node in path:
+            if node.name in self.node_lines:
+                highlight.node(node.name, node.name, color='red')
+                body[self.node_lines[node.name]] = highlight.body.pop()
+        for i in range(len(path) - 1):
+            edge = (path[i].name, path[i + 1].name)
+            if edge in self.edge_lines:
+                highlight.edge(edge[0], edge[1], label=str(quotes[f'{edge[0]}{edge[1]}']), color='red')
+                body[self.edge_lines[edge]] = highlight.body.pop()
+
+        dot = Digraph(comment='Graph Visualization')
+        dot.body = body
+        return dot
+
+    # ошибки фоновой отрисовки (например, не установлен graphviz) не должны теряться
+    @staticmethod
+    def _report_error(future: Future):
+        if future.exception() is not None:
+            print(f'graph rendering failed: {future.exception()}')
+        return
+
+    def _render(self, dot: Digraph) -> str:
+        return dot.render(self.filename, view=self.view, format='png')
+
+    # отрисовка пути: в фоне возвращает Future с именем файла, иначе рисует сразу
+    def render(self, node_pool: dict[str, GraphNode], path: list[GraphNode], quotes: dict[str, float],
+               snapshot_key=None) -> Future:
+        self.prepare(node_pool, snapshot_key)
+        dot = self.build(path, quotes)
+        if self.executor is not None:
+            future = self.executor.submit(self._render, dot)
+            future.add_done_callback(self._report_error)
+            return future
+        future: Future = Future()
+        future.set_result(self._render(dot))
+        return future
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        return
+
+
+def test_graph_renderer():
+    from all_pathes import test_find_all_pathes
+
+    node_pool, path, quotes = test_find_all_pathes()
+    renderer = GraphRenderer(background=False)
+    renderer.prepare(node_pool, snapshot_key=1)
+    base_body = renderer.base_body
+    source = renderer.build(path, quotes).source
+    print(source)
+
+    # выделены ровно узлы и рёбра пути, остальное описание не изменилось
+    assert source.count('color=red') == len(path) + len(path) - 1
+    assert '\t555 -> 666 [label=2 color=red]' in source
+    assert '\t111 -> 222\n' in source
+
+    # для того же снимка базовое описание не перестраивается
+    renderer.prepare(node_pool, snapshot_key=1)
+    assert renderer.base_body is base_body
+    renderer.prepare(node_pool, snapshot_key=2)
+    assert renderer.base_body is not base_body
+    return source
+
+
+if __name__ == '__main__':
+    test_graph_renderer()
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+from graph_definition import NodePool
+from main import Main, parse_query
+from snapshot import Snapshot, QUERY_ALGORITHMS
+from query_cache import QueryCache
+from refresher import BackgroundRefresher
+
+
+'''
+asyncio-сервер запросов на преобразование валют (построчный протокол поверх TCP)
+
+    - запрос - строка, как в пакетном режиме Main.run_batch:
+      JSON {"start": ..., "end": ..., "algorithm": ..., "max_hops": ...} или "START END [ALGORITHM]"
+      ответ - строка JSON со значением, путём и версией снимка, на котором он посчитан
+    - строка "stats" - счётчики сервера
+    - каждое соединение обслуживается своей задачей, поиск выполняется вне цикла событий:
+      best и table (NumPy, GIL отпускается) - в пуле потоков,
+      all, top и one (чистый Python, держат GIL) - в пуле процессов, иначе они отнимали бы
+      время у цикла событий и других соединений; у пула процессов своя копия снимка,
+      он создаётся при первом таком запросе к новому снимку (processes=0 - всё в потоках)
+    - запрос берёт ссылку на текущий снимок один раз и до конца работает с ним,
+      publish() заменяет ссылку на новый снимок - запросы не останавливаются на время обновления
+
+load_test() - клиент нагрузочного теста: несколько соединений шлют запросы,
+по времени ответа считаются p50/p99
+
+запуск:
+    python server.py serve --mock --port 8765
+    python server.py load --port 8765 --clients 16 --requests 200 --query "111 888 best"
+'''
+
+
+# алгоритмы на чистом Python - выполняются в пуле процессов
+PROCESS_ALGORITHMS = ('all', 'top', 'one')
+
+# снимок процесса пула (у каждого пула процессов - один снимок, переданный при запуске процесса)
+_worker_snapshot: Snapshot | None = None
+
+
+# данные снимка для запуска процесса: граф передаётся списками детей, чтобы порядок вершин и рёбер сохранился
+def _snapshot_state(snapshot: Snapshot) -> tuple:
+    children = {name: [child.name for child in node.children if child.name in snapshot.node_pool]
+                for name, node in snapshot.node_pool.items()}
+    return snapshot.version, snapshot.currencies, snapshot.quotes, children, snapshot.created
+
+
+def _init_worker(version: int, currencies: dict[str, str], quotes: dict[str, float],
+                 children: dict[str, list[str]], created: float):
+    global _worker_snapshot
+    node_pool = NodePool()
+    for name in children:
+        node_pool.create(name)
+    for name, child_names in children.items():
+        node_pool[name].children.extend(node_pool[child_name] for child_name in child_names)
+    _worker_snapshot = Snapshot(version, currencies, quotes, node_pool, created=created)
+    return
+
+
+def _worker_query(start: str, end: str, algorithm: str, max_hops: int | None) -> tuple[float, list[str]]:
+    return _worker_snapshot.query(start, end, algorithm, max_hops)
+
+
+class QueryServer:
+    def __init__(self, snapshot: Snapshot, host: str = '127.0.0.1', port: int = 0, workers: int = 4,
+                 algorithm: str = 'table', cache: QueryCache | None = None, processes: int = 2):
+        self.snapshot: Snapshot = snapshot
+        self.cache: QueryCache | None = cache  # результаты запросов по версии снимка
+        self.host: str = host
+        self.port: int = port
+        self.algorithm: str = algorithm  # алгоритм для запросов, где он не указан
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers)
+        # пул процессов для PROCESS_ALGORITHMS и версия снимка, с которой он запущен
+        self.processes: int = processes
+        self.process_pool: ProcessPoolExecutor | None = None
+        self.process_pool_version: int | None = None
+        self.process_pool_lock = threading.Lock()
+        self.server: asyncio.AbstractServer | None = None
+
+        self.requests_count: int = 0
+        self.errors_count: int = 0
+        self.connections_count: int = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+        with self.process_pool_lock:
+            if self.process_pool is not None:
+                self.process_pool.shutdown(wait=True)
+                self.process_pool = None
+        return
+
+    # новый снимок: одно присваивание ссылки, начатые запросы дорабатывают на старом
+    def publish(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        if self.cache is not None:
+            self.cache.invalidate()  # записи старых версий больше не будут запрошены
+        return
+
+    # построение снимка в пуле потоков (без остановки цикла событий) и его публикация
+    async def refresh(self, build: Callable[[], Snapshot]) -> Snapshot:
+        snapshot = await asyncio.get_running_loop().run_in_executor(self.executor, build)
+        self.publish(snapshot)
+        return snapshot
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests_count,
+            'errors': self.errors_count,
+            'connections': self.connections_count,
+            'version': self.snapshot.version,
+            'cache': self.cache.stats() if self.cache is not None else None,
+        }
+
+    # запрос в пул процессов снимка (None - снимок уже заменён, и его пул остановлен)
+    # пул следующего снимка запускается при первом запросе к нему, прежний останавливается
+    # после завершения уже отправленных в него запросов
+    def __submit(self, snapshot: Snapshot, start: str, end: str, algorithm: str,
+                 max_hops: int | None) -> Future | None:
+        with self.process_pool_lock:
+            if self.process_pool_version != snapshot.version:
+                if self.process_pool_version is not None and snapshot.version < self.process_pool_version:
+                    return None
+                if self.process_pool is not None:
+                    self.process_pool.shutdown(wait=False)
+                # spawn - процессы не наследуют потоки и блокировки сервера
+                self.process_pool = ProcessPoolExecutor(self.processes, multiprocessing.get_context('spawn'),
+                                                        _init_worker, _snapshot_state(snapshot))
+                self.process_pool_version = snapshot.version
+            return self.process_pool.submit(_worker_query, start, end, algorithm, max_hops)
+
+    # поиск по снимку: алгоритмы на чистом Python - в пуле процессов, остальные - в текущем потоке
+    def query(self, snapshot: Snapshot, start: str, end: str, algorithm: str,
+              max_hops: int | None = None) -> tuple[float, list[str]]:
+        if algorithm in PROCESS_ALGORITHMS and self.processes > 0:
+            future = self.__submit(snapshot, start, end, algorithm, max_hops)
+            if future is not None:
+                return future.result()
+        return snapshot.query(start, end, algorithm, max_hops)
+
+    # ответ на запрос по заданному снимку, выполняется в пуле потоков
+    def answer(self, snapshot: Snapshot, request: dict) -> dict:
+        result = dict(request)
+        try:
+            # неполный JSON-запрос - ответ с ошибкой, а не исключение в пуле потоков
+            start, end, algorithm, max_hops = request['start'], request['end'], request['algorithm'], \
+                request.get('max_hops')
+            if self.cache is not None:
+                key = self.cache.key(start, end, algorithm, snapshot.version, max_hops)
+                value, path = self.cache.get_or_compute(key, lambda: self.query(snapshot, start, end, algorithm,
+                                                                                max_hops))
+            else:
+                value, path = self.query(snapshot, start, end, algorithm, max_hops)
+            result.update({'value': value, 'path': path})
+        except Exception as ex:
+            result['error'] = str(ex)
+        result['version'] = snapshot.version
+        return result
+
+    async def process(self, line: str) -> dict:
+        try:
+            request = parse_query(line, self.algorithm)
+        except (ValueError, IndexError) as ex:
+            self.errors_count += 1
+            return {'error': f'bad request: {ex}'}
+        # ссылка на снимок берётся один раз - весь поиск идёт по одним и тем же данным
+        result = await asyncio.get_running_loop().run_in_executor(self.executor, self.answer, self.snapshot, request)
+        self.requests_count += 1
+        self.errors_count += 'error' in result
+        return result
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections_count += 1
+        try:
+            while line := await reader.readline():
+                line = line.decode().strip()
+                if not line:
+                    continue
+                result = self.stats() if line == 'stats' else await self.process(line)
+                writer.write((json.dumps(result) + '\n').encode())
+                await writer.drain()
+        except ConnectionResetError:
+            pass
+        finally:
+            writer.close()
+        return
+
+
+# p-й перцентиль (0..100) отсортированных значений - ближайший ранг
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.
+    rank = math.ceil(p / 100 * len(values))
+    return values[min(len(values), max(rank, 1)) - 1]
+
+
+# нагрузочный тест: clients соединений, каждое последовательно шлёт requests запросов из queries по кругу
+async def load_test(host: str, port: int, queries: list[str], clients: int = 8, requests: int = 100) -> dict:
+    latencies: list[float] = []
+    errors: int = 0
+
+    async def client(offset: int):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in range(requests):
+                query = queries[(offset + i) % len(queries)]
+                start = time.perf_counter()
+                writer.write((query + '\n').encode())
+                await writer.drain()
+                result = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - start)
+                errors += 'error' in result
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed > 0 else 0.,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.,
+    }
+
+
+async def _serve(args: argparse.Namespace):
+    main = Main('cbdaabe4b8f76243c6acc161a45cb9d3')
+    if args.mock:
+        main.get_mock_data()
+    else:
+        main.get_real_data()
+    cache = QueryCache(args.cache_size) if args.cache_size > 0 else None
+    server = QueryServer(main.snapshot(), args.host, args.port, args.workers, args.algorithm, cache, args.processes)
+    await server.start()
+    print(f'serving on {server.host}:{server.port}')
+
+    # реальные данные обновляются в фоновом потоке, сервер получает готовый снимок
+    def refresh():
+        main.get_real_data()
+        server.publish(main.snapshot())
+
+    refresher = BackgroundRefresher(refresh, args.refresh_interval)
+    if args.refresh_interval > 0 and not args.mock:
+        refresher.start()
+    try:
+        await server.serve_forever()
+    finally:
+        refresher.stop()
+
+
+def test_query_server():
+    from all_pathes import test_find_all_pathes
+    from snapshot import build_snapshot
+
+    node_pool, path, quotes = test_find_all_pathes()
+    currencies = {name: name for name in node_pool}
+    changed_quotes = dict(quotes, **{'111888': 10.})
+
+    async def scenario():
+        server = QueryServer(build_snapshot(1, currencies, quotes), workers=2, cache=QueryCache())
+        await server.start()
+        try:
+            queries = ['111 888 best', '111 888 all', '{"start": "111", "end": "888", "algorithm": "top"}',
+                       '111 888', '111 999']
+            report = await load_test(server.host, server.port, queries, clients=4, requests=25)
+            print(report)
+            assert report['requests'] == 100 and report['errors'] == 20
+            assert report['p50_ms'] <= report['p99_ms'] <= report['max_ms']
+
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b'111 888 best\n')
+            before = json.loads(await reader.readline())
+            assert before['value'] == 6. and before['path'] == [node.name for node in path] and before['version'] == 1
+            assert server.process_pool_version == 1  # all и top посчитаны в пуле процессов
+
+            # новый снимок строится в пуле потоков, следующие запросы того же соединения видят уже его
+            await server.refresh(lambda: build_snapshot(2, currencies, changed_quotes))
+            writer.write(b'111 888 one\nstats\nbad\n{"start": "111"}\n')
+            after = json.loads(await reader.readline())
+            stats = json.loads(await reader.readline())
+            bad = json.loads(await reader.readline())
+            incomplete = json.loads(await reader.readline())
+            assert after['value'] == 10. and after['path'] == ['111', '888'] and after['version'] == 2
+            assert stats['version'] == 2 and stats['requests'] == 102 and 'error' in bad
+            assert 'error' in incomplete and incomplete['version'] == 2
+            assert server.process_pool_version == 2  # one - в пуле процессов нового снимка
+            print(stats)
+            assert stats['cache']['invalidations'] == 1 and stats['cache']['hits'] >= 60
+            writer.close()
+            await writer.wait_closed()
+        finally:
+            await server.close()
+        return report
+
+    return asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='currency conversion query server')
+    commands = arg_parser.add_subparsers(dest='command')
+
+    serve_parser = commands.add_parser('serve', help='run server')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--workers', type=int, default=4, help='threads for searches')
+    serve_parser.add_argument('--processes', type=int, default=2,
+                              help='processes for pure-Python searches: all, top, one (0 - use threads)')
+    serve_parser.add_argument('--algorithm', choices=QUERY_ALGORITHMS, default='table',
+                              help='algorithm for queries that do not specify one')
+    serve_parser.add_argument('--mock', action='store_true', help='use mock graph instead of real data')
+    serve_parser.add_argument('--refresh-interval', type=float, default=60.,
+                              help='seconds between background refreshes of real data (0 - no refresh)')
+    serve_parser.add_argument('--cache-size', type=int, default=4096, help='query cache size (0 - no cache)')
+
+    load_parser = commands.add_parser('load', help='run load test against a running server')
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int, default=8765)
+    load_parser.add_argument('--clients', type=int, default=8)
+    load_parser.add_argument('--requests', type=int, default=100, help='requests per client')
+    load_parser.add_argument('--query', action='append', help='query line, can be repeated')
+
+    cli_args = arg_parser.parse_args()
+    match cli_args.command:
+        case 'serve':
+            asyncio.run(_serve(cli_args))
+        case 'load':
+            load_queries = cli_args.query if cli_args.query else ['111 888 best']
+            print(json.dumps(asyncio.run(load_test(cli_args.host, cli_args.port, load_queries,
+                                                   cli_args.clients, cli_args.requests)), indent=4))
+        case _:
+            test_query_server()
@@ -0,0 +1,155 @@
+import threading
+import time
+
+from graph_definition import GraphNode, NodePool
+from one_path import dijkstra_max_product_path
+from best_path import best_conversion_path
+from all_pathes import find_all_pathes, find_best_pathes, calculate_pathes_value_batched
+from all_pairs import AllPairsTable, build_all_pairs
+from pruning import reduce_graph
+
+
+'''
+снимок данных для ответов на запросы: валюты, котировки, граф и таблица лучших курсов всех пар
+
+снимок после построения не меняется - поиск, начатый на снимке, видит согласованные данные,
+даже если в это время уже опубликован следующий снимок
+замена снимка - присваивание одной ссылки, поэтому читатели никогда не ждут обновления
+
+таблица всех пар (Флойд-Уоршелл, O(n^3)) строится при первом обращении к ней,
+поэтому частые публикации снимков (поток обновлений котировок) её не пересчитывают
+update_snapshot - следующий снимок из текущего и изменившихся курсов: копия котировок,
+граф общий с текущим снимком (он не меняется, курсы берутся из котировок)
+'''
+
+# алгоритмы запросов: all - полный перебор, top - перебор с отсечением, one - Дейкстра,
+# best - динамика по рёбрам, table - таблица всех пар
+QUERY_ALGORITHMS = ('all', 'top', 'one', 'best', 'table')
+
+
+class Snapshot:
+    def __init__(self, version: int, currencies: dict[str, str], quotes: dict[str, float],
+                 node_pool: dict[str, GraphNode], all_pairs: AllPairsTable | None = None,
+                 created: float | None = None):
+        self.version: int = version
+        self.currencies: dict[str, str] = currencies
+        self.quotes: dict[str, float] = quotes
+        self.node_pool: dict[str, GraphNode] = node_pool
+        self._all_pairs: AllPairsTable | None = all_pairs
+        self._all_pairs_lock = threading.Lock()
+        self.created: float = created if created is not None else time.time()
+
+    # таблица всех пар - строится один раз, при первом обращении (запросы идут из нескольких потоков)
+    @property
+    def all_pairs(self) -> AllPairsTable:
+        if self._all_pairs is None:
+            with self._all_pairs_lock:
+                if self._all_pairs is None:
+                    self._all_pairs = build_all_pairs(self.node_pool, self.quotes)
+        return self._all_pairs
+
+    # ответ на один запрос: (значение, путь в виде кодов валют)
+    def query(self, start_node_name: str, end_node_name: str, algorithm: str = 'table',
+              max_hops: int | None = None) -> tuple[float, list[str]]:
+        if start_node_name not in self.node_pool:
+            raise KeyError(f'Node with name {start_node_name} does not exists')
+        if end_node_name not in self.node_pool:
+            raise KeyError(f'Node with name {end_node_name} does not exists')
+
+        start_node = self.node_pool[start_node_name]
+        end_node = self.node_pool[end_node_name]
+        match algorithm:
+            case 'all':
+                # перебор идёт по графу без мёртвых вершин - те же пути, меньше тупиковых ветвей
+                node_pool, quotes = reduce_graph(self.node_pool, self.quotes, start_node, end_node)
+                all_pathes = find_all_pathes(node_pool[start_node_name], node_pool[end_node_name])
+                values, idx = calculate_pathes_value_batched(all_pathes, quotes)
+                if idx < 0:
+                    return 0., []
+                value, path = values[idx], all_pathes[idx]
+            case 'top':
+                node_pool, quotes = reduce_graph(self.node_pool, self.quotes, start_node, end_node)
+                best_pathes = find_best_pathes(node_pool[start_node_name], node_pool[end_node_name], quotes,
+                                               max_hops=max_hops)
+                value, path = best_pathes[0] if best_pathes else (0., [])
+            case 'one':
+                value, path = dijkstra_max_product_path(self.node_pool, start_node, end_node, self.quotes)
+            case 'best':
+                value, path = best_conversion_path(self.node_pool, start_node, end_node, self.quotes, max_hops)
+            case 'table':
+                if not self.all_pairs.has_arbitrage:
+                    return self.all_pairs.rate(start_node_name, end_node_name), \
+                        self.all_pairs.path(start_node_name, end_node_name)
+                # при выгодных циклах таблица недействительна - ответ динамикой по рёбрам (не длиннее n - 1 рёбер)
+                value, path = best_conversion_path(self.node_pool, start_node, end_node, self.quotes, max_hops)
+            case _:
+                raise ValueError(f'Unknown algorithm {algorithm}')
+        return value, [node.name for node in path]
+
+
+# новый снимок из валют и котировок: собственные копии котировок и граф, как его строит Parser
+def build_snapshot(version: int, currencies: dict[str, str], quotes: dict[str, float],
+                   created: float | None = None) -> Snapshot:
+    quotes = dict(quotes)
+    node_pool = NodePool()
+    for currency in currencies:
+        node_pool.create(currency)
+    for key in quotes:
+        node_from = node_pool.get(key[:3])
+        node_to = node_pool.get(key[3:])
+        if node_from is None or node_to is None:
+            continue  # связь есть - вершин таких нет (скипаем связь)
+        node_from.children.append(node_to)
+    return Snapshot(version, dict(currencies), quotes, node_pool, created=created)
+
+
+# следующий снимок после изменения курсов уже известных рёбер: граф и валюты общие с текущим снимком
+def update_snapshot(snapshot: Snapshot, version: int, changed: dict[str, float],
+                    created: float | None = None) -> Snapshot:
+    quotes = dict(snapshot.quotes)
+    quotes.update(changed)
+    return Snapshot(version, snapshot.currencies, quotes, snapshot.node_pool, created=created)
+
+
+def test_snapshot():
+    from all_pathes import test_find_all_pathes
+
+    node_pool, path, quotes = test_find_all_pathes()
+    snapshot = build_snapshot(1, {name: name for name in node_pool}, quotes)
+    for algorithm in QUERY_ALGORITHMS:
+        value, names = snapshot.query('111', '888', algorithm)
+        assert abs(value - 6.) < 1e-12 and names == [node.name for node in path], algorithm
+    assert [child.name for child in snapshot.node_pool['111'].children] == ['222', '444', '888', '666', '555']
+
+    # снимок не зависит от исходных котировок
+    quotes['111888'] = 10.
+    assert snapshot.query('111', '888', 'one')[0] == 6.
+
+    # выгодный цикл 111 -> 222 -> 111: таблица недействительна, запрос 'table' отвечает поиском по рёбрам
+    arbitrage = build_snapshot(3, {name: name for name in ('111', '222')}, {'111222': 2., '222111': 1.})
+    assert arbitrage.all_pairs.has_arbitrage
+    assert arbitrage.query('111', '222', 'table') == arbitrage.query('111', '222', 'best')
+
+    # округлённые котировки mock_api: таблица действительна, запрос 'table' отвечает без поиска
+    from mock_api import MOCK_USD_PRICES
+    rounded = {f'{a}{b}': float(f'{MOCK_USD_PRICES[a] / MOCK_USD_PRICES[b]:.6g}')
+               for a in MOCK_USD_PRICES for b in MOCK_USD_PRICES if a != b}
+    rounded_snapshot = build_snapshot(4, {name: name for name in MOCK_USD_PRICES}, rounded)
+    assert not rounded_snapshot.all_pairs.has_arbitrage
+    value, path = rounded_snapshot.query('EUR', 'JPY', 'table')
+    assert (value, path) == (rounded_snapshot.all_pairs.rate('EUR', 'JPY'), rounded_snapshot.all_pairs.path('EUR', 'JPY'))
+    assert path[0] == 'EUR' and path[-1] == 'JPY'
+    best_value, best = rounded_snapshot.query('EUR', 'JPY', 'best')
+    assert abs(value / best_value - 1) < 1e-4 and len(set(best)) == len(best)
+
+    # новые курсы: граф общий, таблица всех пар нового снимка строится заново при первом запросе
+    updated = update_snapshot(snapshot, 2, {'111888': 10.})
+    assert updated.node_pool is snapshot.node_pool and updated._all_pairs is None
+    value, names = updated.query('111', '888', 'table')
+    assert abs(value - 10.) < 1e-12 and names == ['111', '888']
+    assert snapshot.query('111', '888', 'table')[0] == 6. and snapshot.quotes['111888'] == 3.5
+    return snapshot
+
+
+if __name__ == '__main__':
+    test_snapshot()
@@ -0,0 +1,151 @@
+from compact_graph import CompactGraph
+
+
+'''
+обход графа в глубину без рекурсии
+
+рекурсивный dfs ограничен глубиной стека интерпретатора (sys.getrecursionlimit())
+и тратит время на вызов функции для каждой вершины, здесь вместо этого явный стек:
+    cursors[d] - итератор по ещё не проверенным рёбрам вершины на глубине d
+    visited - bytearray отметок вершин текущего пути
+
+пути выдаются как общие буферы (список вершин и список рёбер текущего пути),
+которые меняются при продолжении обхода - если путь нужно сохранить, его надо скопировать
+
+порядок выдачи путей совпадает с рекурсивным перебором (дети в порядке рёбер CSR)
+'''
+
+
+# все простые пути из start в end: генератор (путь из вершин, путь из рёбер)
+# max_hops - ограничение числа рёбер, visited - уже запрещённые вершины (например, префикс пути)
+def iter_simple_pathes(graph: CompactGraph, start: int, end: int, max_hops: int | None = None,
+                       visited: bytearray | None = None):
+    adjacency = graph.adjacency
+    visited = visited if visited is not None else bytearray(len(graph))
+    max_hops = max_hops if max_hops is not None else len(graph)
+
+    path: list[int] = [start]
+    edges: list[int] = []
+    if start == end:
+        yield path, edges
+        return
+    if max_hops <= 0:
+        return  # до конечной вершины нужно хотя бы одно ребро
+
+    # спуск в вершину возможен, пока рёбер в пути меньше extend_limit:
+    # тогда путь до end не длиннее max_hops рёбер
+    extend_limit = max_hops - 1
+    visited[start] = 1
+    cursors = [iter(adjacency[start])]
+    while cursors:
+        for child, e in cursors[-1]:
+            if child == end:
+                path.append(child)
+                edges.append(e)
+                yield path, edges
+                path.pop()
+                edges.pop()
+                continue
+            if visited[child] or len(edges) >= extend_limit:
+                # вершина уже в пути или путь через неё будет длиннее max_hops
+                continue
+            visited[child] = 1
+            path.append(child)
+            edges.append(e)
+            cursors.append(iter(adjacency[child]))
+            break
+        else:
+            # рёбра вершины кончились - возврат к предыдущей вершине
+            cursors.pop()
+            visited[path.pop()] = 0
+            if edges:
+                edges.pop()
+
+
+# все простые циклы длиной не больше max_len рёбер, каждый ровно один раз:
+# цикл выдаётся от своей вершины с наименьшим номером (путь из вершин с повтором первой в конце, путь из рёбер)
+def iter_simple_cycles(graph: CompactGraph, max_len: int | None = None):
+    n = len(graph)
+    offsets, targets = graph.offsets, graph.targets
+    max_len = max_len if max_len is not None else n
+    visited = bytearray(n)
+
+    for root in range(n):
+        # вершины с меньшими номерами запрещены - их циклы уже выданы
+        for v in range(root):
+            visited[v] = 1
+        path: list[int] = [root]
+        edges: list[int] = []
+        cursors = [iter(range(offsets[root], offsets[root + 1]))]
+        visited[root] = 1
+        while cursors:
+            for e in cursors[-1]:
+                child = targets[e]
+                if child == root:
+                    path.append(child)
+                    edges.append(e)
+                    yield path, edges
+                    path.pop()
+                    edges.pop()
+                    continue
+                if visited[child] or len(edges) + 1 >= max_len:
+                    continue  # вершина уже в пути или цикл через неё будет длиннее max_len
+                visited[child] = 1
+                path.append(child)
+                edges.append(e)
+                cursors.append(iter(range(offsets[child], offsets[child + 1])))
+                break
+            else:
+                cursors.pop()
+                if len(path) > 1:
+                    visited[path[-1]] = 0
+                path.pop()
+                if edges:
+                    edges.pop()
+        for v in range(root + 1):
+            visited[v] = 0
+    return
+
+
+def test_traversal():
+    from compact_graph import from_node_pool
+    from graph_definition import GraphNode
+    from all_pathes import find_all_pathes_recursive, test_find_all_pathes
+
+    node_pool, _, quotes = test_find_all_pathes()
+    graph = from_node_pool(node_pool, quotes)
+    pathes = [graph.path_names(path) for path, _ in iter_simple_pathes(graph, 0, graph.index['888'])]
+    expected = [[node.name for node in path] for path in find_all_pathes_recursive(node_pool['111'], node_pool['888'])]
+    assert pathes == expected
+    short = [graph.path_names(path) for path, _ in iter_simple_pathes(graph, 0, graph.index['888'], max_hops=2)]
+    assert short == [path for path in expected if len(path) <= 3]
+    assert [graph.path_names(path) for path, _ in iter_simple_pathes(graph, 0, graph.index['888'], max_hops=1)] == \
+        [['111', '888']]
+    assert list(iter_simple_pathes(graph, 0, graph.index['888'], max_hops=0)) == []
+
+    # полный граф из трёх вершин: циклы 0-1-0, 0-1-2-0, 0-2-0, 0-2-1-0, 1-2-1
+    pool = {name: GraphNode(name) for name in ('AAA', 'BBB', 'CCC')}
+    pool['AAA'].children = [pool['BBB'], pool['CCC']]
+    pool['BBB'].children = [pool['AAA'], pool['CCC']]
+    pool['CCC'].children = [pool['AAA'], pool['BBB']]
+    rates = {f'{a}{b.name}': 1. for a, node in pool.items() for b in node.children}
+    triangle = from_node_pool(pool, rates)
+    cycles = [list(path) for path, _ in iter_simple_cycles(triangle)]
+    print('cycles:', cycles)
+    assert sorted(cycles) == [[0, 1, 0], [0, 1, 2, 0], [0, 2, 0], [0, 2, 1, 0], [1, 2, 1]]
+    assert sorted(list(path) for path, _ in iter_simple_cycles(triangle, max_len=2)) == [[0, 1, 0], [0, 2, 0], [1, 2, 1]]
+
+    # длинная цепочка: рекурсивный обход упирается в предел глубины стека
+    chain = {f'{i:04d}': GraphNode(f'{i:04d}') for i in range(5000)}
+    nodes = list(chain.values())
+    for node, child in zip(nodes, nodes[1:]):
+        node.children.append(child)
+    chain_quotes = {f'{node}{child}': 1. for node, child in zip(nodes, nodes[1:])}
+    chain_graph = from_node_pool(chain, chain_quotes)
+    chain_pathes = [list(path) for path, _ in iter_simple_pathes(chain_graph, 0, 4999)]
+    assert len(chain_pathes) == 1 and len(chain_pathes[0]) == 5000
+    return pathes
+
+
+if __name__ == '__main__':
+    test_traversal()